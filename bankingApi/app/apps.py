@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class AppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'app'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .authentication import check_revocation_cache
+
+        check_revocation_cache()
@@ -0,0 +1,138 @@
+import threading
+from datetime import datetime
+
+from django.db import connection, models, transaction
+
+from .models import Account, Transfer, TransferArchive
+
+BATCH_SIZE = 500
+
+_models = {}
+_models_lock = threading.Lock()
+
+
+def period_of(timestamp):
+    """The archive period, a month, that ``timestamp`` falls in, e.g. ``'2023-01'``."""
+    return '{:04d}-{:02d}'.format(timestamp.year, timestamp.month)
+
+
+def period_bounds(period):
+    """``[start, end)`` of ``period``."""
+    year, month = map(int, period.split('-'))
+    return datetime(year, month, 1), datetime(year + month // 12, month % 12 + 1, 1)
+
+
+def _account():
+    # No constraint and no cascade: the archive tables are never joined against on delete.
+    return models.ForeignKey(Account, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False,
+                             related_name='+')
+
+
+def _build_model(db_table):
+    suffix = db_table.rsplit('_', 1)[1]
+    meta = type('Meta', (), {
+        'app_label': 'app',
+        'db_table': db_table,
+        'managed': False,
+        'indexes': [
+            models.Index(fields=['sender_account', 'timestamp'], name='transfer_{}_sender_idx'.format(suffix)),
+            models.Index(fields=['receiver_account', 'timestamp'], name='transfer_{}_receiver_idx'.format(suffix)),
+            models.Index(fields=['timestamp'], name='transfer_{}_ts_idx'.format(suffix)),
+        ],
+    })
+    return type('ArchivedTransfer{}'.format(suffix), (models.Model,), {
+        '__module__': __name__,
+        'Meta': meta,
+        # Archived transfers keep the id they had in the hot table.
+        'id': models.BigIntegerField(primary_key=True),
+        'sender_account': _account(),
+        'receiver_account': _account(),
+        'amount': models.BigIntegerField(),
+        'timestamp': models.DateTimeField(),
+    })
+
+
+def archive_model(db_table):
+    """
+    The model of the archive table ``db_table``, built once per process.
+
+    It has the fields of ``Transfer`` under the same names, so archive querysets can be filtered, joined
+    to the customer names and combined with ``union`` exactly like ``Transfer`` querysets.
+    """
+    with _models_lock:
+        model = _models.get(db_table)
+        if model is None:
+            model = _models[db_table] = _build_model(db_table)
+        return model
+
+
+def transfer_models(start=None, end=None):
+    """
+    ``Transfer`` followed by the archive models whose periods overlap ``[start, end]``.
+
+    Either bound can be left out; they are compared the way the history filters compare timestamps.
+    """
+    archives = TransferArchive.objects.order_by('start')
+    if start:
+        archives = archives.filter(end__gt=start)
+    if end:
+        archives = archives.filter(start__lte=end)
+    return [Transfer] + [archive_model(db_table) for db_table in archives.values_list('db_table', flat=True)]
+
+
+def _archive_for(period):
+    archive = TransferArchive.objects.filter(period=period).first()
+    if archive is not None:
+        return archive_model(archive.db_table)
+
+    db_table = 'app_transfer_archive_{}'.format(period.replace('-', ''))
+    model = archive_model(db_table)
+    # The table exists before the catalog row does, so readers never look for a missing table.
+    if db_table not in connection.introspection.table_names():
+        with connection.schema_editor() as schema_editor:
+            schema_editor.create_model(model)
+    start, end = period_bounds(period)
+    TransferArchive.objects.get_or_create(period=period, defaults={'db_table': db_table, 'start': start, 'end': end})
+    return model
+
+
+def _move_batch(model, until, batch_size):
+    # transfers and rollups build on the modules that build on this one.
+    from .rollups import record_transfers
+    from .transfers import lock_for_update
+
+    with transaction.atomic():
+        lock_for_update()
+        rows = list(Transfer.objects.filter(timestamp__lt=until).order_by('timestamp', 'pk')
+                    .values_list('id', 'sender_account_id', 'receiver_account_id', 'amount', 'timestamp',
+                                 'rolled_up')[:batch_size])
+        # The archive tables don't track rollups, so pending transfers are added before they move.
+        record_transfers([Transfer(id=pk, sender_account_id=sender_account_id, receiver_account_id=receiver_account_id,
+                                   amount=amount, timestamp=timestamp)
+                          for pk, sender_account_id, receiver_account_id, amount, timestamp, rolled_up in rows
+                          if not rolled_up])
+        rows = [row[:5] for row in rows]
+        model.objects.bulk_create([
+            model(id=pk, sender_account_id=sender_account_id, receiver_account_id=receiver_account_id, amount=amount,
+                  timestamp=timestamp)
+            for pk, sender_account_id, receiver_account_id, amount, timestamp in rows
+        ])
+        Transfer.objects.filter(pk__in=[row[0] for row in rows]).delete()
+    return len(rows)
+
+
+def archive_transfers(before, batch_size=BATCH_SIZE):
+    """
+    Move the transfers stamped before ``before`` into the archive table of their month, oldest first.
+
+    Every batch of ``batch_size`` transfers is copied and deleted in its own short transaction, so
+    transfers keep being written in between. Yields ``(period, moved)`` after each batch.
+    """
+    while True:
+        oldest = (Transfer.objects.filter(timestamp__lt=before).order_by('timestamp')
+                  .values_list('timestamp', flat=True).first())
+        if oldest is None:
+            return
+        period = period_of(oldest)
+        until = min(period_bounds(period)[1], before)
+        yield period, _move_batch(_archive_for(period), until, batch_size)
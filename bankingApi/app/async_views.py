@@ -0,0 +1,72 @@
+from asgiref.sync import sync_to_async
+from django.http import HttpResponseNotAllowed, JsonResponse
+from rest_framework import status
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.utils.encoders import JSONEncoder
+
+from .asyncdb import database_sync_to_async
+from .authentication import KEYWORD, BearerTokenAuthentication
+from .balances import balance_entry
+from .models import Account
+from .money import from_minor
+from .permissions import IsEmployee
+from .routers import reads_from_replica
+from .views import transfer_history_payload
+
+# Same body as DRF's JSONRenderer produces for the sync views.
+JSON_PARAMS = {'separators': (',', ':'), 'ensure_ascii': False}
+
+
+def _json(payload, status_code=status.HTTP_200_OK):
+    return JsonResponse(payload, status=status_code, encoder=JSONEncoder, safe=False, json_dumps_params=JSON_PARAMS)
+
+
+def _unauthenticated(detail):
+    response = _json({'detail': detail}, status.HTTP_401_UNAUTHORIZED)
+    response['WWW-Authenticate'] = KEYWORD
+    return response
+
+
+async def _denied(request):
+    # django.views.decorators.http can't wrap coroutines before Django 5.0.
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    # As in the sync views, a bearer token takes precedence over the session. Verifying one asks the shared
+    # revocation cache, a network round trip, so it happens on a worker thread; no header, no thread.
+    authenticated = None
+    if 'Authorization' in request.headers:
+        try:
+            authenticated = await sync_to_async(BearerTokenAuthentication().authenticate,
+                                                thread_sensitive=False)(request)
+        except AuthenticationFailed as e:
+            return _unauthenticated(e.detail)
+    if authenticated:
+        request.user, request.auth = authenticated
+    if await IsEmployee().has_permission_async(request):
+        return None
+    if not request.user.is_authenticated:
+        return _unauthenticated('Authentication credentials were not provided.')
+    return _json({'detail': 'You do not have permission to perform this action.'}, status.HTTP_403_FORBIDDEN)
+
+
+async def account_balance(request, account_id):
+    denied = await _denied(request)
+    if denied:
+        return denied
+
+    try:
+        with reads_from_replica(request):
+            entry = await database_sync_to_async(balance_entry)(account_id)
+    except Account.DoesNotExist:
+        return _json({'error': 'Account with given id does not exist'}, status.HTTP_404_NOT_FOUND)
+    return _json({'account_id': account_id, 'balance': from_minor(entry[1])})
+
+
+async def transfer_history(request, account_id):
+    denied = await _denied(request)
+    if denied:
+        return denied
+
+    with reads_from_replica(request):
+        payload, status_code = await database_sync_to_async(transfer_history_payload)(account_id, request.GET)
+    return _json(payload, status_code)
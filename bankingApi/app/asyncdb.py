@@ -0,0 +1,24 @@
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+
+
+def database_sync_to_async(func):
+    """
+    Run a function that uses the ORM from async code, in a worker thread with its own connection.
+
+    Django 3.2 has no async ORM. Unlike the thread-sensitive ``sync_to_async`` that Django uses for sync
+    views, which funnels every call through a single thread, this spreads calls over the executor's
+    threads so independent queries run concurrently. Stale connections of the worker thread are closed
+    around each call, as the request_started/request_finished signals would do for a sync request.
+    """
+    @wraps(func)
+    def inner(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    return sync_to_async(inner, thread_sensitive=False)
@@ -0,0 +1,130 @@
+import secrets
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import signing
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+from rest_framework.exceptions import AuthenticationFailed
+
+KEYWORD = 'Bearer'
+SALT = 'app.authentication.token'
+
+
+def _ttl():
+    return getattr(settings, 'TOKEN_TTL', 900)
+
+
+def _cache():
+    return caches[getattr(settings, 'TOKEN_REVOCATION_CACHE_ALIAS', 'default')]
+
+
+def check_revocation_cache():
+    """
+    Raise ``ImproperlyConfigured`` if revocations would only reach the process that made them.
+
+    A revoked token would keep working on every other worker until it expired. ``ALLOW_LOCAL_TOKEN_REVOCATION``
+    accepts a local memory cache where there is only one process, as with runserver and the tests.
+    """
+    alias = getattr(settings, 'TOKEN_REVOCATION_CACHE_ALIAS', 'default')
+    backend = settings.CACHES[alias]['BACKEND']
+    if backend.endswith(('LocMemCache', 'DummyCache')) and not getattr(settings, 'ALLOW_LOCAL_TOKEN_REVOCATION',
+                                                                          False):
+        raise ImproperlyConfigured(
+            'The token revocation cache {!r} uses {}, which other worker processes cannot see; point '
+            'CACHE_BACKEND at a shared cache or set ALLOW_LOCAL_TOKEN_REVOCATION for a single process.'.format(
+                alias, backend))
+
+
+def _revoked_token_key(token_id):
+    return 'revoked_token:{}'.format(token_id)
+
+
+def _revoked_user_key(user_id):
+    return 'tokens_revoked_before:{}'.format(user_id)
+
+
+class AccessToken:
+    """The verified claims of a bearer token; DRF leaves it on ``request.auth``."""
+    __slots__ = ('user_id', 'employee', 'token_id', 'issued_at', 'expires_at')
+
+    def __init__(self, user_id, employee, token_id, issued_at, expires_at):
+        self.user_id = user_id
+        self.employee = employee
+        self.token_id = token_id
+        self.issued_at = issued_at
+        self.expires_at = expires_at
+
+
+def issue_token(user, employee):
+    """A signed token for ``user`` carrying the employee claim, valid for ``TOKEN_TTL`` seconds."""
+    # Milliseconds, so a token issued right after a revocation isn't caught by it.
+    now = round(time.time(), 3)
+    claims = {'uid': user.pk, 'emp': employee, 'jti': secrets.token_urlsafe(12), 'iat': now, 'exp': now + _ttl()}
+    return signing.dumps(claims, salt=SALT)
+
+
+def verify_token(token):
+    """
+    The ``AccessToken`` of ``token``; raises ``AuthenticationFailed`` if it is forged, expired or revoked.
+
+    Checking the signature needs no database. Revocation is looked up in the cache, with one round trip.
+    """
+    try:
+        claims = signing.loads(token, salt=SALT)
+        access = AccessToken(claims['uid'], claims['emp'], claims['jti'], claims['iat'], claims['exp'])
+    except (signing.BadSignature, KeyError, TypeError):
+        raise AuthenticationFailed('Invalid token.')
+    if access.expires_at <= time.time():
+        raise AuthenticationFailed('Token has expired.')
+
+    revoked = _cache().get_many([_revoked_token_key(access.token_id), _revoked_user_key(access.user_id)])
+    if _revoked_token_key(access.token_id) in revoked:
+        raise AuthenticationFailed('Token has been revoked.')
+    if revoked.get(_revoked_user_key(access.user_id), 0) >= access.issued_at:
+        raise AuthenticationFailed('Token has been revoked.')
+    return access
+
+
+def revoke_token(access):
+    """Reject ``access`` from now on; the entry only lives as long as the token would have."""
+    timeout = max(1, int(access.expires_at - time.time()) + 1)
+    _cache().set(_revoked_token_key(access.token_id), True, timeout)
+
+
+def revoke_user_tokens(user_ids):
+    """
+    Reject every token issued to ``user_ids`` until now, e.g. because their employee claim is stale or the
+    user was deactivated or changed their password.
+    """
+    now = round(time.time(), 3)
+    _cache().set_many({_revoked_user_key(user_id): now for user_id in user_ids}, _ttl() + 1)
+
+
+class BearerTokenAuthentication(BaseAuthentication):
+    """
+    ``Authorization: Bearer <token>`` with tokens from ``issue_token``.
+
+    The user is an unsaved ``User`` carrying only its id, enough to be stored in foreign keys, so neither a
+    session nor the user row is read; ``IsEmployee`` trusts the token's employee claim. That holds because
+    every change that would invalidate the claims revokes the user's tokens: group membership, deactivation
+    and password changes, see app.signals.
+    """
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != KEYWORD.lower().encode():
+            return None
+        if len(auth) != 2:
+            raise AuthenticationFailed('Invalid token header.')
+        try:
+            token = auth[1].decode()
+        except UnicodeError:
+            raise AuthenticationFailed('Invalid token header.')
+        access = verify_token(token)
+        return User(pk=access.user_id), access
+
+    def authenticate_header(self, request):
+        return KEYWORD
@@ -0,0 +1,153 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from .models import Account
+from .shards import total_balance
+from .versions import last_modified, total_version
+
+logger = logging.getLogger(__name__)
+
+LOCK_TIMEOUT = 1
+
+
+def _enabled():
+    return getattr(settings, 'BALANCE_CACHE', False)
+
+
+_stats_lock = threading.Lock()
+_stats = {'cache_hits': 0, 'misses': 0}
+
+
+def _cache():
+    return caches[getattr(settings, 'BALANCE_CACHE_ALIAS', 'default')]
+
+
+def _cache_key(account_id):
+    # Entries gained modified_at; the new key keeps entries of the old shape from being read.
+    return 'account_balance_entry:{}'.format(account_id)
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+@contextmanager
+def _account_lock(cache, account_id):
+    """Yield whether the lock was acquired within ``LOCK_TIMEOUT``; only a lock this call holds is released."""
+    # cache.add is atomic on every backend, which makes it usable as a short-lived mutex.
+    lock_key = _cache_key(account_id) + ':lock'
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    acquired = cache.add(lock_key, 1, LOCK_TIMEOUT)
+    while not acquired and time.monotonic() < deadline:
+        time.sleep(0.001)
+        acquired = cache.add(lock_key, 1, LOCK_TIMEOUT)
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            cache.delete(lock_key)
+
+
+def _store(account_id, version, balance, modified_at):
+    """Publish ``(version, balance, modified_at)`` unless a newer version is already cached."""
+    if not _enabled():
+        return
+    cache = _cache()
+    key = _cache_key(account_id)
+    with _account_lock(cache, account_id) as acquired:
+        if not acquired:
+            # Writing without the lock could replace a newer entry; the next read fetches the balance instead.
+            _evict(account_id)
+            return
+        current = cache.get(key)
+        if current is None or current[0] < version:
+            cache.set(key, (version, balance, modified_at), timeout=getattr(settings, 'BALANCE_CACHE_TIMEOUT', 300))
+
+
+def _evict(account_id):
+    _cache().delete(_cache_key(account_id))
+
+
+def balance_entry(account_id):
+    """
+    Return ``(version, balance, modified_at)`` of ``account_id`` from the cache backend or the database; the
+    version and time are those of ``app.versions``.
+
+    With ``BALANCE_CACHE`` off, e.g. because the cache backend isn't shared between the worker processes,
+    every call reads the database. Raises ``Account.DoesNotExist`` for unknown accounts; those aren't cached.
+    """
+    if _enabled():
+        entry = _cache().get(_cache_key(account_id))
+        if entry is not None:
+            _count('cache_hits')
+            return entry
+
+    _count('misses')
+    rows = Account.objects.values_list('shards', total_version(), total_balance(), last_modified())
+    shards, *entry = rows.get(pk=account_id)
+    # A replica may lag behind the primary, so only balances read from the primary are cached. Credits to
+    # sharded accounts don't touch the account row, so their balances aren't cached at all.
+    if rows.db == DEFAULT_DB_ALIAS and not shards:
+        _store(account_id, *entry)
+    return tuple(entry)
+
+
+def get_balance(account_id):
+    """The balance of ``account_id`` from ``balance_entry``."""
+    return balance_entry(account_id)[1]
+
+
+def write_through(account_ids):
+    """
+    Publish the balances of ``account_ids`` once the current transaction commits.
+
+    The balances are read after the commit, so the transaction doesn't hold the write lock for the read.
+    Entries are versioned: if another transfer has moved a balance on since, its newer version is published
+    and nothing can overwrite it with an older one. Sharded accounts are evicted instead. Does nothing with
+    ``BALANCE_CACHE`` off.
+    """
+    if not _enabled():
+        return
+    account_ids = list(account_ids)
+
+    def publish():
+        # The transfer is already committed, so neither a failed read nor a cache error may fail the request.
+        try:
+            rows = list(Account.objects.using(DEFAULT_DB_ALIAS).filter(pk__in=account_ids)
+                        .values_list('id', 'shards', 'version', total_balance(), 'modified_at'))
+        except Exception:
+            logger.exception('Could not read the balances of accounts %s', account_ids)
+            rows = [(account_id, True, None, None, None) for account_id in account_ids]
+        for account_id, shards, version, balance, modified_at in rows:
+            try:
+                if shards:
+                    _evict(account_id)
+                else:
+                    _store(account_id, version, balance, modified_at)
+            except Exception:
+                logger.exception('Could not publish the balance of account %s', account_id)
+                try:
+                    _evict(account_id)
+                except Exception:
+                    logger.exception('Could not evict the balance of account %s', account_id)
+
+    transaction.on_commit(publish)
+
+
+def balance_cache_stats():
+    with _stats_lock:
+        return dict(_stats)
+
+
+def reset_balance_cache_stats():
+    """Zero the hit and miss counters; the cache backend is left alone."""
+    with _stats_lock:
+        for name in _stats:
+            _stats[name] = 0
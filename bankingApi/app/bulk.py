@@ -0,0 +1,21 @@
+from django.db import connection
+
+
+def bulk_create_with_pks(model, objs, batch_size=None):
+    """
+    ``bulk_create`` that leaves the new primary keys set on ``objs`` on every backend; call it in a transaction.
+
+    Django 3.2 only returns ids from bulk inserts on PostgreSQL. On SQLite the open transaction holds the
+    database write lock once it has inserted, so the rows just inserted are the newest ones, in insertion
+    order. Other backends fall back to one insert per object.
+    """
+    if connection.features.can_return_rows_from_bulk_insert or connection.vendor == 'sqlite':
+        model.objects.bulk_create(objs, batch_size=batch_size)
+        if objs and objs[0].pk is None:
+            pks = model.objects.order_by('-pk').values_list('pk', flat=True)[:len(objs)]
+            for obj, pk in zip(objs, reversed(pks)):
+                obj.pk = pk
+    else:
+        for obj in objs:
+            obj.save(force_insert=True)
+    return objs
@@ -0,0 +1,85 @@
+from collections import defaultdict
+
+from django.db.models import DateTimeField, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from .archive import archive_model, period_of, transfer_models
+from .models import DailyRollup, Transfer, TransferArchive
+
+HISTORY_ORDERING = ('timestamp', 'id')
+
+
+def history_branches(account_id, start_date=None, end_date=None):
+    """
+    Split an account's transfer history into its sent and received halves, per table.
+
+    Each half is a range scan on one of the ``(account, timestamp)`` indexes, where the
+    ``sender OR receiver`` filter they replace can't use either index on its own. A transfer from the
+    account to itself is only in the sent half. Besides the ``Transfer`` table, only the archive tables
+    whose periods overlap the date range are queried.
+    """
+    branches = []
+    for model in transfer_models(start_date, end_date):
+        for branch in (model.objects.filter(sender_account_id=account_id),
+                       model.objects.filter(receiver_account_id=account_id).exclude(sender_account_id=account_id)):
+            if start_date:
+                branch = branch.filter(timestamp__gte=start_date)
+            if end_date:
+                branch = branch.filter(timestamp__lte=end_date)
+            branches.append(branch)
+    return branches
+
+
+def union_all(branches):
+    """Combine the history branches; a transfer never appears in two of them, so no deduplication is needed."""
+    first, *rest = branches
+    return first.union(*rest, all=True).order_by(*HISTORY_ORDERING)
+
+
+def _newest(queryset, field):
+    return Subquery(queryset.order_by('-' + field).values(field)[:1])
+
+
+def last_transfer_at():
+    """
+    An ``Account`` expression for the time of its latest transfer in the ``Transfer`` table, or ``None``.
+
+    One probe into each of the ``(account, timestamp)`` indexes; see ``fill_archived_last_transfers`` for
+    accounts whose transfers have all been archived.
+    """
+    sent = _newest(Transfer.objects.filter(sender_account_id=OuterRef('pk')), 'timestamp')
+    received = _newest(Transfer.objects.filter(receiver_account_id=OuterRef('pk')), 'timestamp')
+    # Greatest is NULL as soon as one side is on some backends.
+    return Greatest(Coalesce(sent, received), Coalesce(received, sent), output_field=DateTimeField())
+
+
+def last_rollup_day():
+    """An ``Account`` expression for the last day it took part in a transfer, from the daily rollups."""
+    return _newest(DailyRollup.objects.filter(account_id=OuterRef('pk')), 'day')
+
+
+def fill_archived_last_transfers(accounts):
+    """
+    Set ``last_transfer_at`` on the ``accounts`` that have none because their transfers were all archived.
+
+    The accounts need the ``last_transfer_at`` and ``last_rollup_day`` annotations. The rollup day names
+    the one archive table to look in, so accounts with recent transfers cost nothing and the others two
+    queries per archive period.
+    """
+    periods = defaultdict(list)
+    for account in accounts:
+        if account.last_transfer_at is None and account.last_rollup_day is not None:
+            periods[period_of(account.last_rollup_day)].append(account)
+    if not periods:
+        return
+
+    archives = dict(TransferArchive.objects.filter(period__in=periods).values_list('period', 'db_table'))
+    for period, db_table in archives.items():
+        by_id = {account.pk: account for account in periods[period]}
+        model = archive_model(db_table)
+        for column in ('sender_account_id', 'receiver_account_id'):
+            latest = (model.objects.filter(**{column + '__in': by_id}).order_by().values_list(column)
+                      .annotate(Max('timestamp')))
+            for account_id, timestamp in latest:
+                account = by_id[account_id]
+                account.last_transfer_at = max(filter(None, (account.last_transfer_at, timestamp)))
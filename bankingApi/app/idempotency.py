@@ -0,0 +1,80 @@
+import hashlib
+import json
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+
+
+def _ttl():
+    return timedelta(seconds=getattr(settings, 'IDEMPOTENCY_KEY_TTL', 86400))
+
+
+def _fingerprint(request):
+    payload = json.dumps([request.method, request.path, request.data], sort_keys=True, cls=JSONEncoder)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _lookup(user, key):
+    return (IdempotencyKey.objects.filter(user=user, key=key, created_at__gte=timezone.now() - _ttl())
+            .values_list('fingerprint', 'status_code', 'response_body').first())
+
+
+def _replay(stored, fingerprint):
+    stored_fingerprint, status_code, response_body = stored
+    if stored_fingerprint != fingerprint:
+        return Response({'error': 'Idempotency-Key was already used with a different request'},
+                        status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+    return Response(json.loads(response_body), status=status_code, headers={'Idempotent-Replayed': 'true'})
+
+
+def idempotent(view):
+    """
+    Let clients retry ``view`` safely by sending an ``Idempotency-Key`` header.
+
+    The first request with a key claims it by inserting its row in the same transaction that runs the
+    view and stores the response, so the key is recorded if and only if the view's writes commit. A
+    duplicate arriving meanwhile blocks on the key's unique index until that transaction ends, and then
+    replays the stored response; later retries cost one indexed lookup. Keys expire after
+    ``IDEMPOTENCY_KEY_TTL`` seconds and are deleted by the ``purge_idempotency_keys`` command.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return view(request, *args, **kwargs)
+        if len(key) > IdempotencyKey._meta.get_field('key').max_length:
+            return Response({'error': 'Idempotency-Key is too long'}, status=status.HTTP_400_BAD_REQUEST)
+
+        fingerprint = _fingerprint(request)
+        stored = _lookup(request.user, key)
+        if stored:
+            return _replay(stored, fingerprint)
+
+        try:
+            with transaction.atomic():
+                # An expired record that hasn't been purged yet must not block the key's reuse.
+                IdempotencyKey.objects.filter(user=request.user, key=key,
+                                              created_at__lt=timezone.now() - _ttl()).delete()
+                record = IdempotencyKey.objects.create(user=request.user, key=key, fingerprint=fingerprint)
+                response = view(request, *args, **kwargs)
+                record.status_code = response.status_code
+                record.response_body = json.dumps(response.data, cls=JSONEncoder)
+                record.save(update_fields=['status_code', 'response_body'])
+        except IntegrityError:
+            stored = _lookup(request.user, key)
+            if stored is None:
+                raise
+            return _replay(stored, fingerprint)
+        return response
+
+    return wrapper
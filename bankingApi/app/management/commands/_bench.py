@@ -0,0 +1,37 @@
+import time
+from contextlib import contextmanager
+
+from django.db import connection
+from django.test.utils import setup_databases, teardown_databases
+
+
+@contextmanager
+def benchmark_database(verbosity=0):
+    """Run a benchmark against a throwaway copy of the test database, never the real one."""
+    old_config = setup_databases(verbosity=verbosity, interactive=False)
+    try:
+        yield
+    finally:
+        teardown_databases(old_config, verbosity=verbosity)
+
+
+@contextmanager
+def timer(results, key):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        results[key] = time.perf_counter() - start
+
+
+@contextmanager
+def count_queries(counter, key):
+    """Count the statements run on the default connection without the size cap of ``connection.queries``."""
+    counter[key] = 0
+
+    def wrapper(execute, sql, params, many, context):
+        counter[key] += 1
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(wrapper):
+        yield
@@ -0,0 +1,28 @@
+from datetime import date, datetime, time, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from app.archive import BATCH_SIZE, archive_transfers
+
+
+class Command(BaseCommand):
+    help = ('Move transfers older than TRANSFER_ARCHIVE_AFTER_DAYS into monthly archive tables, in short '
+            'batches so transfers keep being written. History queries still find them.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.TRANSFER_ARCHIVE_AFTER_DAYS,
+                            help='Archive the transfers of days that ended more than this many days ago.')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        if options['days'] < 1:
+            raise CommandError('--days must be at least 1')
+        before = datetime.combine(date.today() - timedelta(days=options['days']), time.min)
+
+        moved = {}
+        for period, count in archive_transfers(before, options['batch_size']):
+            moved[period] = moved.get(period, 0) + count
+        for period, count in moved.items():
+            self.stdout.write('{}: {} transfers archived'.format(period, count))
+        self.stdout.write('Archived {} transfers stamped before {}'.format(sum(moved.values()), before))
@@ -0,0 +1,226 @@
+import io
+import json
+import multiprocessing
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import timedelta
+from wsgiref.util import setup_testing_defaults
+
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.core.signals import got_request_exception
+from django.db import OperationalError, connection, connections
+from django.db.backends.signals import connection_created
+from django.http import HttpRequest
+from django.middleware.csrf import get_token
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from app.balances import reset_balance_cache_stats
+from app.models import Customer, Account, BalanceShard, Transfer
+from app.money import to_minor
+from app.shards import set_shard_count, sharding_enabled
+from ._bench import benchmark_database
+
+ENDPOINTS = ('transfer', 'account_balance', 'transfer_history')
+
+# Share of requests per endpoint, and the share of transfers that involve a hot account.
+MIXES = {
+    'uniform': ({'transfer': 0.4, 'account_balance': 0.4, 'transfer_history': 0.2}, 0.0),
+    'hot-account': ({'transfer': 0.4, 'account_balance': 0.4, 'transfer_history': 0.2}, 0.9),
+    'read-heavy': ({'transfer': 0.05, 'account_balance': 0.6, 'transfer_history': 0.35}, 0.0),
+}
+
+_local = threading.local()
+_worker = {}
+
+
+def _count_query(execute, sql, params, many, context):
+    _local.queries = getattr(_local, 'queries', 0) + 1
+    return execute(sql, params, many, context)
+
+
+def _on_connection_created(sender, connection, **kwargs):
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_query)
+
+
+def _on_request_exception(sender, request=None, **kwargs):
+    _local.exception = sys.exc_info()[1]
+
+
+def _fire(spec):
+    """Send one request through the WSGI handler; returns ``(endpoint, latency, status, queries, conflict)``."""
+    endpoint, method, path, body = spec
+    environ = {'PATH_INFO': path, 'REQUEST_METHOD': method, 'HTTP_HOST': 'localhost',
+               'HTTP_COOKIE': _worker['cookie'], 'HTTP_X_CSRFTOKEN': _worker['csrf_token'],
+               'CONTENT_TYPE': 'application/json', 'CONTENT_LENGTH': str(len(body)), 'wsgi.input': io.BytesIO(body)}
+    if '?' in path:
+        environ['PATH_INFO'], environ['QUERY_STRING'] = path.split('?', 1)
+    setup_testing_defaults(environ)
+    _local.queries = 0
+    _local.exception = None
+    start = time.perf_counter()
+    response = _worker['handler'](environ, lambda status, headers: None)
+    b''.join(response)
+    response.close()
+    latency = time.perf_counter() - start
+    return endpoint, latency, response.status_code, _local.queries, isinstance(_local.exception, OperationalError)
+
+
+def _init_process():
+    # Forked workers must not share the parent's database connection.
+    for conn in connections.all():
+        conn.close()
+
+
+def _percentile(ordered, q):
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+
+def _summary(results, elapsed=None):
+    latencies = sorted(result[1] for result in results)
+    count = len(results)
+    summary = {
+        'requests': count,
+        'latency_ms': {'p{}'.format(q): _percentile(latencies, q) * 1000 for q in (50, 95, 99)} if count else {},
+        'queries_per_request': sum(result[3] for result in results) / count if count else 0,
+        'error_rate': sum(result[2] >= 500 for result in results) / count if count else 0,
+        'conflict_rate': sum(result[4] for result in results) / count if count else 0,
+        'rejection_rate': sum(400 <= result[2] < 500 for result in results) / count if count else 0,
+    }
+    if elapsed is not None:
+        summary['throughput_rps'] = count / elapsed
+    return summary
+
+
+class Command(BaseCommand):
+    help = ('Seed a throwaway database and fire concurrent transfer, account-balance and transfer-history '
+            'requests at it from a thread or process pool, for a uniform, a hot-account and a read-heavy mix. '
+            'Reports throughput, latency percentiles, queries per request and error/conflict rates as JSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mix', action='append', choices=sorted(MIXES),
+                            help='Mix to run; repeat for several. Defaults to all of them.')
+        parser.add_argument('--pool', choices=('thread', 'process'), default='thread')
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per mix.')
+        parser.add_argument('--accounts', type=int, default=1000)
+        parser.add_argument('--hot-accounts', type=int, default=2)
+        parser.add_argument('--shards', type=int, default=0, help='Balance shards of each hot account.')
+        parser.add_argument('--transfers', type=int, default=20000, help='Transfers seeded before each mix.')
+        parser.add_argument('--initial-balance', type=int, default=100000)
+        parser.add_argument('--history-limit', type=int, default=100, help='Page size of history requests.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout.')
+
+    def handle(self, *args, **options):
+        if options['accounts'] < 2 or not 0 < options['hot_accounts'] < options['accounts']:
+            raise CommandError('Need at least two accounts and fewer hot accounts than accounts')
+        if options['shards'] and not sharding_enabled():
+            raise CommandError('--shards needs BALANCE_SHARDS')
+        if options['pool'] == 'process' and 'fork' not in multiprocessing.get_all_start_methods():
+            raise CommandError('The process pool needs the fork start method')
+
+        report = {'config': {key: options[key] for key in ('pool', 'concurrency', 'requests', 'accounts',
+                                                            'hot_accounts', 'shards', 'transfers', 'seed')},
+                  'mixes': {}}
+        connection_created.connect(_on_connection_created, weak=False)
+        got_request_exception.connect(_on_request_exception, weak=False)
+        with benchmark_database():
+            account_ids = self._seed(options)
+            for name in options['mix'] or MIXES:
+                rng = random.Random('{}:{}'.format(options['seed'], name))
+                self._reset(account_ids, options, rng)
+                plan = self._plan(MIXES[name], account_ids, options, rng)
+                report['mixes'][name] = self._run(plan, options)
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+    def _seed(self, options):
+        user = User.objects.create_user(username='bench', password='bench')
+        user.groups.add(Group.objects.create(name='employee'))
+        client = Client()
+        client.force_login(user)
+        # Session auth enforces CSRF on the transfer POSTs, so send a token pair like a browser would.
+        request = HttpRequest()
+        _worker['csrf_token'] = get_token(request)
+        _worker['cookie'] = 'sessionid={}; csrftoken={}'.format(client.cookies['sessionid'].value,
+                                                                request.META['CSRF_COOKIE'])
+        _worker['handler'] = WSGIHandler()
+
+        customer = Customer.objects.create(name='Benchmark')
+        Account.objects.bulk_create([Account(customer=customer, balance=to_minor(options['initial_balance']))
+                                     for _ in range(options['accounts'])])
+        account_ids = list(Account.objects.order_by('pk').values_list('pk', flat=True))
+        for account_id in account_ids[:options['hot_accounts']]:
+            set_shard_count(account_id, options['shards'])
+        return account_ids
+
+    def _reset(self, account_ids, options, rng):
+        """Give every mix the same starting point: fresh balances and ``--transfers`` of history."""
+        Transfer.objects.all().delete()
+        Account.objects.update(balance=to_minor(options['initial_balance']), version=0)
+        BalanceShard.objects.update(balance=0)
+        now = timezone.now()
+        transfers = []
+        for _ in range(options['transfers']):
+            sender, receiver = rng.sample(account_ids, 2)
+            transfers.append(Transfer(sender_account_id=sender, receiver_account_id=receiver, amount=100,
+                                      timestamp=now - timedelta(seconds=rng.randrange(30 * 86400))))
+        Transfer.objects.bulk_create(transfers, batch_size=1000)
+        cache.clear()
+        reset_balance_cache_stats()
+
+    def _plan(self, mix, account_ids, options, rng):
+        weights, hot_share = mix
+        hot = account_ids[:options['hot_accounts']]
+        plan = []
+        for endpoint in rng.choices(list(weights), weights=list(weights.values()), k=options['requests']):
+            if endpoint == 'transfer':
+                sender, receiver = rng.sample(account_ids, 2)
+                if rng.random() < hot_share:
+                    # One side is a hot account, the other any other account; hot accounts send and receive.
+                    hot_account = rng.choice(hot)
+                    other = sender if sender != hot_account else receiver
+                    sender, receiver = (hot_account, other) if rng.random() < 0.5 else (other, hot_account)
+                body = json.dumps({'sender_account_id': sender, 'receiver_account_id': receiver,
+                                   'transfer_amount': str(rng.randint(1, 100))}).encode()
+                plan.append((endpoint, 'POST', reverse('transfer'), body))
+                continue
+            account_id = rng.choice(hot if rng.random() < hot_share else account_ids)
+            path = reverse(endpoint, kwargs={'account_id': account_id})
+            if endpoint == 'transfer_history':
+                path += '?limit={}'.format(options['history_limit'])
+            plan.append((endpoint, 'GET', path, b''))
+        return plan
+
+    def _run(self, plan, options):
+        connection.close()
+        if options['pool'] == 'process':
+            executor = ProcessPoolExecutor(max_workers=options['concurrency'], initializer=_init_process,
+                                           mp_context=multiprocessing.get_context('fork'))
+        else:
+            executor = ThreadPoolExecutor(max_workers=options['concurrency'])
+        start = time.perf_counter()
+        with executor:
+            results = list(executor.map(_fire, plan, chunksize=1 if options['pool'] == 'thread' else 16))
+        elapsed = time.perf_counter() - start
+
+        summary = _summary(results, elapsed)
+        summary['by_endpoint'] = {endpoint: _summary([result for result in results if result[0] == endpoint])
+                                  for endpoint in ENDPOINTS}
+        return summary
@@ -0,0 +1,88 @@
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from app.archive import archive_transfers
+from app.history import history_branches, union_all
+from app.models import Customer, Account, Transfer
+from app.transfers import execute_transfer
+from ._bench import benchmark_database, timer
+
+TRANSFERS = 500
+
+
+class Command(BaseCommand):
+    help = ('Seed a throwaway database with a long transfer history, then time recent and full-range history '
+            'lookups and transfers before and after archiving everything older than --keep-days.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--transfers', type=int, default=1000000)
+        parser.add_argument('--accounts', type=int, default=1000)
+        parser.add_argument('--days', type=int, default=730, help='Period the seeded transfers span.')
+        parser.add_argument('--keep-days', type=int, default=90, help='Days left in the hot table.')
+        parser.add_argument('--lookups', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        now = datetime.now()
+        with benchmark_database():
+            account_ids = self._seed(rng, now, options)
+            accounts = [rng.choice(account_ids) for _ in range(options['lookups'])]
+            pairs = [rng.sample(account_ids, 2) for _ in range(TRANSFERS)]
+
+            report = {'before': self._measure(accounts, pairs, now)}
+            results = {}
+            with timer(results, 'archive'):
+                moved = sum(count for _, count in archive_transfers(now - timedelta(days=options['keep_days'])))
+            report['after'] = self._measure(accounts, pairs, now)
+
+        self.stdout.write('archived {} transfers into monthly tables in {:.1f}s'.format(moved, results['archive']))
+        self.stdout.write('{:<7} {:>10} {:>16} {:>14} {:>12}'.format(
+            'state', 'hot rows', 'last 30 days ms', 'all time ms', 'transfers/s'))
+        for name, row in report.items():
+            self.stdout.write('{:<7} {:>10} {:>16.3f} {:>14.3f} {:>12.1f}'.format(name, *row))
+
+    def _seed(self, rng, now, options):
+        customer = Customer.objects.create(name='Benchmark')
+        Account.objects.bulk_create([Account(customer=customer, balance=10 ** 9) for _ in range(options['accounts'])],
+                                    batch_size=500)
+        account_ids = list(Account.objects.values_list('id', flat=True))
+
+        sql = ('INSERT INTO {} (sender_account_id, receiver_account_id, amount, timestamp) '
+               'VALUES (%s, %s, %s, %s)'.format(connection.ops.quote_name(Transfer._meta.db_table)))
+        span = options['days'] * 86400
+        remaining = options['transfers']
+        with connection.cursor() as cursor:
+            while remaining:
+                rows = []
+                for _ in range(min(remaining, 50000)):
+                    sender_id, receiver_id = rng.sample(account_ids, 2)
+                    rows.append((sender_id, receiver_id, rng.randint(100, 99999),
+                                 now - timedelta(seconds=rng.randrange(span))))
+                with transaction.atomic():
+                    cursor.executemany(sql, rows)
+                remaining -= len(rows)
+        return account_ids
+
+    def _measure(self, accounts, pairs, now):
+        recent, full = [], []
+        for account_id in accounts:
+            start = time.perf_counter()
+            list(union_all(history_branches(account_id, now - timedelta(days=30), now)).values_list('id', 'amount'))
+            recent.append((time.perf_counter() - start) * 1000)
+        for account_id in accounts[:20]:
+            start = time.perf_counter()
+            list(union_all(history_branches(account_id)).values_list('id', 'amount'))
+            full.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        for sender_id, receiver_id in pairs:
+            execute_transfer(sender_id, receiver_id, 100)
+        rate = len(pairs) / (time.perf_counter() - start)
+
+        return Transfer.objects.count(), statistics.mean(recent), statistics.mean(full), rate
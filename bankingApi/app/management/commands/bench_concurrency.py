@@ -0,0 +1,140 @@
+import asyncio
+import io
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from wsgiref.util import setup_testing_defaults
+
+from django.contrib.auth.models import Group, User
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.test import Client
+from django.urls import reverse
+
+from app.models import Customer, Account, Transfer
+from ._bench import benchmark_database
+
+VIEWS = ('account_balance', 'transfer_history')
+
+
+def _report(name, latencies, elapsed):
+    throughput = len(latencies) / elapsed
+    return {
+        'mode': name,
+        'requests_per_sec': throughput,
+        'p50_ms': statistics.median(latencies) * 1000,
+        # Little's law: requests in flight on average, i.e. the concurrency actually sustained.
+        'sustained_concurrency': throughput * statistics.mean(latencies),
+    }
+
+
+class Command(BaseCommand):
+    help = ('Fire concurrent requests at one in-process worker and compare the sync views behind WSGI and ASGI '
+            'with the async views behind ASGI. --db-latency adds a sleep to every query to stand in for a '
+            'networked database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--db-latency', type=float, default=0.005, help='Seconds added to every query.')
+        parser.add_argument('--transfers', type=int, default=20)
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            cookie, paths = self._seed(options)
+            connection_created.connect(self._slow_down(options['db_latency']), weak=False)
+            results = []
+            for view in VIEWS:
+                sync_path, async_path = paths[view]
+                results.append(self._wsgi('{} wsgi sync'.format(view), sync_path, cookie, options))
+                results.append(self._asgi('{} asgi sync'.format(view), sync_path, cookie, options))
+                results.append(self._asgi('{} asgi async'.format(view), async_path, cookie, options))
+
+        self.stdout.write('{:<34} {:>10} {:>9} {:>12}'.format('mode', 'req/s', 'p50 ms', 'concurrency'))
+        for result in results:
+            self.stdout.write('{mode:<34} {requests_per_sec:>10.1f} {p50_ms:>9.2f} {sustained_concurrency:>12.1f}'
+                              .format(**result))
+
+    def _seed(self, options):
+        employee_group = Group.objects.create(name='employee')
+        user = User.objects.create_user(username='bench', password='bench')
+        user.groups.add(employee_group)
+        customer = Customer.objects.create(name='Benchmark')
+        account = Account.objects.create(customer=customer, balance=0)
+        other = Account.objects.create(customer=customer, balance=0)
+        Transfer.objects.bulk_create([Transfer(sender_account=account, receiver_account=other, amount=100)
+                                      for _ in range(options['transfers'])])
+
+        client = Client()
+        client.force_login(user)
+        cookie = '{}={}'.format('sessionid', client.cookies['sessionid'].value)
+        kwargs = {'account_id': account.id}
+        paths = {view: (reverse(view, kwargs=kwargs), reverse('async_' + view, kwargs=kwargs)) for view in VIEWS}
+        connection.close()
+        return cookie, paths
+
+    def _slow_down(self, latency):
+        def wrapper(execute, sql, params, many, context):
+            time.sleep(latency)
+            return execute(sql, params, many, context)
+
+        def on_connection_created(sender, connection, **kwargs):
+            # The wrapper object outlives reconnects, so only install it once.
+            if wrapper not in connection.execute_wrappers:
+                connection.execute_wrappers.append(wrapper)
+
+        return on_connection_created
+
+    def _wsgi(self, name, path, cookie, options):
+        """A threaded WSGI server worker: one thread per in-flight request."""
+        handler = WSGIHandler()
+
+        def request(_):
+            environ = {'PATH_INFO': path, 'REQUEST_METHOD': 'GET', 'HTTP_COOKIE': cookie, 'HTTP_HOST': 'localhost',
+                       'wsgi.input': io.BytesIO()}
+            setup_testing_defaults(environ)
+            start = time.perf_counter()
+            response = handler(environ, lambda status, headers: None)
+            b''.join(response)
+            response.close()
+            return time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            latencies = list(executor.map(request, range(options['requests'])))
+        return _report(name, latencies, time.perf_counter() - start)
+
+    def _asgi(self, name, path, cookie, options):
+        """An ASGI server worker: one event loop, ``--concurrency`` requests in flight."""
+        handler = ASGIHandler()
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+            'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '',
+            'headers': [(b'host', b'localhost'), (b'cookie', cookie.encode())],
+            'client': ('127.0.0.1', 0), 'server': ('localhost', 80),
+        }
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            pass
+
+        async def request(semaphore):
+            async with semaphore:
+                start = time.perf_counter()
+                await handler(dict(scope), receive, send)
+                return time.perf_counter() - start
+
+        async def run():
+            # The ORM work of the async views runs on the loop's default executor; size it like the WSGI pool.
+            asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=options['concurrency']))
+            semaphore = asyncio.Semaphore(options['concurrency'])
+            return await asyncio.gather(*(request(semaphore) for _ in range(options['requests'])))
+
+        start = time.perf_counter()
+        latencies = asyncio.run(run())
+        return _report(name, latencies, time.perf_counter() - start)
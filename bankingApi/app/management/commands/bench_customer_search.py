@@ -0,0 +1,50 @@
+import json
+import random
+
+from django.core.management.base import BaseCommand
+
+from app.models import Customer
+from app.onboarding import import_rows, parse_ndjson
+from app.search import customers_by_prefix, customers_by_words
+from ._bench import benchmark_database, timer
+
+FIRST_NAMES = ('Ahmet', 'Ayşe', 'İsmail', 'Işıl', 'Mehmet', 'Zeynep', 'Sarah', 'Michael', 'Emily', 'Ömer')
+LAST_NAMES = ('Yılmaz', 'Kaya', 'Demir', 'Işık', 'Çelik', 'Şahin', 'Johnson', 'Garcia', 'Rodriguez', 'Öztürk')
+
+
+class Command(BaseCommand):
+    help = ('Search a synthetic customer base by name with a case-insensitive scan and through the normalized '
+            'name and word indexes, and compare the time per search.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--customers', type=int, default=200000)
+        parser.add_argument('--searches', type=int, default=200)
+        parser.add_argument('--page-size', type=int, default=50)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        page_size = options['page_size']
+        results = {}
+        with benchmark_database():
+            lines = (json.dumps({'name': '{} {} {}'.format(rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES), i)})
+                     for i in range(options['customers']))
+            for _ in import_rows(parse_ndjson(lines)):
+                pass
+            queries = ['{} {}'.format(rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)).upper()
+                       for _ in range(options['searches'])]
+
+            with timer(results, 'icontains'):
+                for query in queries:
+                    list(Customer.objects.filter(name__icontains=query).order_by('pk')
+                         .values_list('pk', 'name')[:page_size])
+            with timer(results, 'prefix'):
+                for query in queries:
+                    list(customers_by_prefix(query)[:page_size])
+            with timer(results, 'words'):
+                for query in queries:
+                    list(customers_by_words(query)[:page_size])
+
+        for name, elapsed in results.items():
+            self.stdout.write('{:<10} {:>8.2f}s {:>8.2f} ms/search'.format(
+                name, elapsed, elapsed / options['searches'] * 1000))
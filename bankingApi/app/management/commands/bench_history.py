@@ -0,0 +1,108 @@
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, models, transaction
+from django.db.models import Q
+
+from app.history import history_branches, union_all
+from app.models import Customer, Account, Transfer
+from ._bench import benchmark_database
+
+LEGACY_INDEXES = [
+    models.Index(fields=['sender_account'], name='bench_transfer_sender_idx'),
+    models.Index(fields=['receiver_account'], name='bench_transfer_receiver_idx'),
+]
+
+
+def _legacy_history(account_id, start_date, end_date):
+    query = Q(sender_account_id=account_id) | Q(receiver_account_id=account_id)
+    query &= Q(timestamp__gte=start_date) & Q(timestamp__lte=end_date)
+    return Transfer.objects.filter(query)
+
+
+def _union_history(account_id, start_date, end_date):
+    return union_all(history_branches(account_id, start_date, end_date))
+
+
+class Command(BaseCommand):
+    help = ('Seed a throwaway database with transfers and time date-ranged history lookups with the '
+            'single-column FK indexes and OR filter against the composite indexes and UNION ALL query.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--transfers', type=int, default=2000000)
+        parser.add_argument('--accounts', type=int, default=1000)
+        parser.add_argument('--days', type=int, default=365, help='Period the seeded transfers span.')
+        parser.add_argument('--window', type=int, default=30, help='Days covered by each history lookup.')
+        parser.add_argument('--lookups', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        with benchmark_database():
+            with connection.schema_editor() as schema_editor:
+                for index in Transfer._meta.indexes:
+                    schema_editor.remove_index(Transfer, index)
+
+            account_ids = self._seed(rng, options)
+            origin = datetime(2023, 1, 1)
+            lookups = []
+            for _ in range(options['lookups']):
+                start_date = origin + timedelta(days=rng.randrange(max(options['days'] - options['window'], 1)))
+                lookups.append((rng.choice(account_ids), start_date, start_date + timedelta(days=options['window'])))
+
+            report = {}
+            with connection.schema_editor() as schema_editor:
+                for index in LEGACY_INDEXES:
+                    schema_editor.add_index(Transfer, index)
+            report['before'] = self._measure(_legacy_history, lookups)
+            with connection.schema_editor() as schema_editor:
+                for index in LEGACY_INDEXES:
+                    schema_editor.remove_index(Transfer, index)
+                for index in Transfer._meta.indexes:
+                    schema_editor.add_index(Transfer, index)
+            report['after'] = self._measure(_union_history, lookups)
+
+        for name, (timings, plan) in report.items():
+            self.stdout.write('{:<7} mean {:8.3f} ms  p50 {:8.3f} ms  p95 {:8.3f} ms'.format(
+                name, statistics.mean(timings), statistics.median(timings),
+                statistics.quantiles(timings, n=20)[-1]))
+            self.stdout.write('        plan: {}'.format(plan.replace('\n', '\n              ')))
+        self.stdout.write('speedup: {:.1f}x'.format(
+            statistics.mean(report['before'][0]) / statistics.mean(report['after'][0])))
+
+    def _seed(self, rng, options):
+        customer = Customer.objects.create(name='Benchmark')
+        Account.objects.bulk_create([Account(customer=customer, balance=0) for _ in range(options['accounts'])],
+                                    batch_size=500)
+        account_ids = list(Account.objects.values_list('id', flat=True))
+
+        sql = ('INSERT INTO {} (sender_account_id, receiver_account_id, amount, timestamp) '
+               'VALUES (%s, %s, %s, %s)'.format(connection.ops.quote_name(Transfer._meta.db_table)))
+        origin = datetime(2023, 1, 1)
+        span = options['days'] * 86400
+        remaining = options['transfers']
+        with connection.cursor() as cursor:
+            while remaining:
+                rows = []
+                for _ in range(min(remaining, 50000)):
+                    sender_id, receiver_id = rng.sample(account_ids, 2)
+                    rows.append((sender_id, receiver_id, rng.randint(1, 999) * 100 + rng.randint(0, 99),
+                                 origin + timedelta(seconds=rng.randrange(span))))
+                with transaction.atomic():
+                    cursor.executemany(sql, rows)
+                remaining -= len(rows)
+                self.stdout.write('seeded {} transfers'.format(options['transfers'] - remaining), ending='\r')
+        self.stdout.write('')
+        return account_ids
+
+    def _measure(self, history, lookups):
+        timings = []
+        for account_id, start_date, end_date in lookups:
+            start = time.perf_counter()
+            list(history(account_id, start_date, end_date).values_list('id', 'amount', 'timestamp'))
+            timings.append((time.perf_counter() - start) * 1000)
+        account_id, start_date, end_date = lookups[0]
+        return timings, history(account_id, start_date, end_date).explain()
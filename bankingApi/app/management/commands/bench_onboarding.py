@@ -0,0 +1,58 @@
+import csv
+import io
+import json
+
+from django.contrib.auth.models import Group, User
+from django.core.management.base import BaseCommand
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from app.models import Customer, Account
+from ._bench import benchmark_database, timer
+
+
+class Command(BaseCommand):
+    help = ('Onboard the same customers through the create-customer/create-account endpoints, one request '
+            'per row, and through the streaming import-customers endpoint, and compare rows/sec.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=2000, help='Customers to onboard.')
+        parser.add_argument('--accounts-per-customer', type=int, default=2)
+
+    def handle(self, *args, **options):
+        rows = [('Customer {}'.format(i), ['100.00'] * options['accounts_per_customer'])
+                for i in range(options['rows'])]
+        results = {}
+        with benchmark_database():
+            user = User.objects.create_user(username='bench', password='bench')
+            user.groups.add(Group.objects.create(name='employee'))
+            client = APIClient(SERVER_NAME='localhost')
+            client.force_authenticate(user)
+
+            with timer(results, 'per-request'):
+                for name, balances in rows:
+                    customer_id = client.post(reverse('create_customer'), {'name': name}, format='json').data['id']
+                    for balance in balances:
+                        client.post(reverse('create_account'),
+                                    {'customer_id': customer_id, 'initial_balance': balance}, format='json')
+            self._check(options)
+
+            body = io.StringIO()
+            writer = csv.writer(body)
+            writer.writerow(('name', 'initial_balances'))
+            writer.writerows((name, ';'.join(balances)) for name, balances in rows)
+            with timer(results, 'import'):
+                response = client.post(reverse('import_customers'), body.getvalue(), content_type='text/csv')
+                events = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+            assert events[-1]['errors'] == 0, events[-1]
+            self._check(options)
+
+        for name, elapsed in results.items():
+            self.stdout.write('{:<12} {:>8.2f}s {:>10.0f} rows/s'.format(name, elapsed, options['rows'] / elapsed))
+        self.stdout.write('speedup: {:.1f}x'.format(results['per-request'] / results['import']))
+
+    def _check(self, options):
+        assert Customer.objects.count() == options['rows']
+        assert Account.objects.count() == options['rows'] * options['accounts_per_customer']
+        Account.objects.all().delete()
+        Customer.objects.all().delete()
@@ -0,0 +1,74 @@
+import multiprocessing
+import random
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from app.models import Customer, Account, Transfer
+from app.reconciliation import account_ranges, reconcile
+from ._bench import benchmark_database, timer
+
+
+class Command(BaseCommand):
+    help = ('Seed a throwaway database with a consistent ledger, then time a full reconciliation with '
+            'increasing numbers of worker processes.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--accounts', type=int, default=20000)
+        parser.add_argument('--transfers', type=int, default=500000)
+        parser.add_argument('--range-size', type=int, default=1000)
+        parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            raise CommandError('This benchmark needs the fork start method')
+
+        results = {}
+        with benchmark_database():
+            if connection.is_in_memory_db():
+                raise CommandError('The test database is in memory; set DATABASES TEST NAME to a file')
+            self._seed(random.Random(options['seed']), options)
+            ranges = account_ranges(options['range_size'])
+            for workers in options['workers']:
+                with timer(results, workers):
+                    discrepancies = sum(len(rows) for _, rows in reconcile(ranges, workers))
+                if discrepancies:
+                    raise CommandError('The seeded ledger does not reconcile')
+
+        self.stdout.write('{} accounts in {} ranges, {} transfers'.format(
+            options['accounts'], len(ranges), options['transfers']))
+        self.stdout.write('{:>8} {:>10} {:>12} {:>8}'.format('workers', 'seconds', 'accounts/s', 'speedup'))
+        for workers, elapsed in results.items():
+            self.stdout.write('{:>8} {:>10.2f} {:>12.0f} {:>8.2f}'.format(
+                workers, elapsed, options['accounts'] / elapsed, results[options['workers'][0]] / elapsed))
+
+    def _seed(self, rng, options):
+        customer = Customer.objects.create(name='Benchmark')
+        Account.objects.bulk_create([Account(customer=customer, balance=10 ** 9) for _ in range(options['accounts'])],
+                                    batch_size=500)
+        account_ids = list(Account.objects.values_list('id', flat=True))
+
+        sql = ('INSERT INTO {} (sender_account_id, receiver_account_id, amount, timestamp) '
+               'VALUES (%s, %s, %s, %s)'.format(connection.ops.quote_name(Transfer._meta.db_table)))
+        now = datetime.now()
+        remaining = options['transfers']
+        with connection.cursor() as cursor:
+            while remaining:
+                rows = [tuple(rng.sample(account_ids, 2)) + (rng.randint(100, 99999),
+                                                             now - timedelta(seconds=rng.randrange(86400 * 365)))
+                        for _ in range(min(remaining, 50000))]
+                with transaction.atomic():
+                    cursor.executemany(sql, rows)
+                remaining -= len(rows)
+
+        # Bring the balances in line with the transfers inserted behind the engine's back.
+        def total(column):
+            sums = (Transfer.objects.filter(**{column: OuterRef('pk')}).order_by().values(column)
+                    .annotate(total=Sum('amount')).values('total'))
+            return Coalesce(Subquery(sums), Value(0))
+
+        Account.objects.update(balance=F('opening_balance') + total('receiver_account') - total('sender_account'))
@@ -0,0 +1,58 @@
+import random
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand
+
+from app.models import Customer, Account, Transfer
+from app.serializers import TRANSFER_ROW_FIELDS, TransferSerializer, transfer_rows
+from ._bench import benchmark_database, count_queries, timer
+
+
+class Command(BaseCommand):
+    help = 'Time rendering a list of transfers through TransferSerializer and through the transfer_rows fast path.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--transfers', type=int, default=10000)
+        parser.add_argument('--accounts', type=int, default=100)
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        variants = {
+            'serializer': lambda: TransferSerializer(Transfer.objects.all(), many=True).data,
+            'serializer+select_related': lambda: TransferSerializer(
+                Transfer.objects.select_related('sender_account__customer', 'receiver_account__customer'),
+                many=True).data,
+            'transfer_rows': lambda: transfer_rows(Transfer.objects.values_list(*TRANSFER_ROW_FIELDS)),
+        }
+
+        with benchmark_database():
+            Customer.objects.bulk_create([Customer(name='Customer {}'.format(i)) for i in range(options['accounts'])])
+            customers = list(Customer.objects.all())
+            Account.objects.bulk_create([Account(customer=customer, balance=0) for customer in customers])
+            account_ids = list(Account.objects.values_list('id', flat=True))
+            origin = datetime(2023, 1, 1)
+            transfers = []
+            for i in range(options['transfers']):
+                sender_id, receiver_id = rng.sample(account_ids, 2)
+                transfers.append(Transfer(sender_account_id=sender_id, receiver_account_id=receiver_id,
+                                          amount=rng.randint(1, 99999),
+                                          timestamp=origin + timedelta(seconds=i)))
+            Transfer.objects.bulk_create(transfers, batch_size=500)
+
+            results = {}
+            for name, render in variants.items():
+                best = None
+                for _ in range(options['repeat']):
+                    timings = {}
+                    queries = {}
+                    with count_queries(queries, name), timer(timings, name):
+                        render()
+                    best = min(best or timings[name], timings[name])
+                results[name] = (best, queries[name])
+
+        baseline = results['serializer'][0]
+        for name, (elapsed, queries) in results.items():
+            self.stdout.write('{:<27} {:8.1f} ms  {:>6} queries  {:5.1f}x'.format(
+                name, elapsed * 1000, queries, baseline / elapsed))
@@ -0,0 +1,113 @@
+import multiprocessing
+import random
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, connections
+
+from app.models import Customer, Account, Transfer
+from app import transfers
+from app.transfers import BatchConflict, BatchRejected, InsufficientBalance, execute_transfer, execute_transfer_batch
+from ._bench import benchmark_database
+
+# SQLite's own defaults (rollback journal, synchronous=FULL) with batches reading before they take the write
+# lock, against SQLITE_PRAGMAS with the lock taken first. journal_mode is persistent in the database file,
+# so the baseline has to switch it back explicitly.
+CONFIGS = {
+    'default': ({'journal_mode': 'DELETE', 'synchronous': 'FULL'}, False),
+    'tuned': (settings.SQLITE_PRAGMAS, True),
+}
+
+BATCH_SHARE = 0.2
+
+
+def _close_connections():
+    for conn in connections.all():
+        conn.close()
+
+
+def _work(args):
+    """One worker process: transfers, each followed by the reads a client makes, until the deadline."""
+    pragmas, lock_first, deadline, account_ids, seed = args
+    settings.SQLITE_PRAGMAS = pragmas
+    if not lock_first:
+        # Only ever runs in a forked worker.
+        transfers.lock_for_update = lambda: None
+    rng = random.Random(seed)
+    counts = {'transfers': 0, 'reads': 0, 'locked': 0}
+    while time.time() < deadline:
+        sender, receiver = rng.sample(account_ids, 2)
+        try:
+            if rng.random() < BATCH_SHARE:
+                # Batches read their accounts before writing them: the pattern SQLite can't always wait out.
+                execute_transfer_batch([tuple(rng.sample(account_ids, 2)) + (100,) for _ in range(5)])
+                counts['transfers'] += 5
+            else:
+                execute_transfer(sender, receiver, rng.randint(1, 10) * 100)
+                counts['transfers'] += 1
+            Account.objects.values_list('balance', flat=True).get(pk=sender)
+            list(Transfer.objects.filter(sender_account_id=sender).order_by('-timestamp')[:20])
+            counts['reads'] += 1
+        except (InsufficientBalance, BatchRejected, BatchConflict):
+            pass
+        except OperationalError as e:
+            if 'locked' not in str(e) and 'busy' not in str(e):
+                raise
+            counts['locked'] += 1
+    _close_connections()
+    return counts
+
+
+class Command(BaseCommand):
+    help = ('Run transfers and reads from several processes against one SQLite file, with SQLite\'s default '
+            'journaling and with SQLITE_PRAGMAS, and compare throughput and "database is locked" errors.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=8)
+        parser.add_argument('--seconds', type=float, default=5.0, help='Duration of each run.')
+        parser.add_argument('--accounts', type=int, default=100)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            raise CommandError('This benchmark needs the fork start method')
+
+        original = settings.SQLITE_PRAGMAS
+        results = {}
+        with benchmark_database():
+            if connection.is_in_memory_db():
+                raise CommandError('The test database is in memory; set DATABASES TEST NAME to a file')
+            customer = Customer.objects.create(name='Benchmark')
+            Account.objects.bulk_create([Account(customer=customer, balance=10 ** 8)
+                                         for _ in range(options['accounts'])])
+            account_ids = list(Account.objects.values_list('pk', flat=True))
+            try:
+                for name, (pragmas, lock_first) in CONFIGS.items():
+                    results[name] = self._run(pragmas, lock_first, account_ids, options)
+            finally:
+                settings.SQLITE_PRAGMAS = original
+                _close_connections()
+
+        self.stdout.write('{:<8} {:>12} {:>10} {:>8}'.format('config', 'transfers/s', 'reads/s', 'locked'))
+        for name, (counts, elapsed) in results.items():
+            self.stdout.write('{:<8} {:>12.1f} {:>10.1f} {:>8}'.format(
+                name, counts['transfers'] / elapsed, counts['reads'] / elapsed, counts['locked']))
+
+    def _run(self, pragmas, lock_first, account_ids, options):
+        # Switch the journal mode once, before the workers start, then hand them a closed connection.
+        _close_connections()
+        settings.SQLITE_PRAGMAS = pragmas
+        connection.ensure_connection()
+        _close_connections()
+
+        start = time.time()
+        deadline = start + options['seconds']
+        work = [(pragmas, lock_first, deadline, account_ids, options['seed'] + i)
+                for i in range(options['processes'])]
+        with multiprocessing.get_context('fork').Pool(options['processes']) as pool:
+            per_process = pool.map(_work, work)
+        elapsed = time.time() - start
+
+        totals = {key: sum(counts[key] for counts in per_process) for key in per_process[0]}
+        return totals, elapsed
@@ -0,0 +1,54 @@
+import random
+
+from django.core.management.base import BaseCommand
+
+from app.models import Customer, Account, QueuedTransfer, Transfer
+from app.transfer_queue import BATCH_SIZE, enqueue_transfer, process_queued_transfers
+from app.transfers import InsufficientBalance, execute_transfer
+from ._bench import benchmark_database, timer
+
+
+class Command(BaseCommand):
+    help = ('Apply the same transfers one transaction each and through the queue with group commit, and '
+            'compare transfers/sec of the synchronous path, of enqueueing and of draining the queue.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--transfers', type=int, default=5000)
+        parser.add_argument('--accounts', type=int, default=100)
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        results = {}
+        with benchmark_database():
+            customer = Customer.objects.create(name='Benchmark')
+            Account.objects.bulk_create([Account(customer=customer, balance=100000)
+                                         for _ in range(options['accounts'])])
+            account_ids = list(Account.objects.values_list('pk', flat=True))
+            transfers = [tuple(rng.sample(account_ids, 2)) + (rng.randint(1, 100) * 100,)
+                         for _ in range(options['transfers'])]
+
+            with timer(results, 'synchronous'):
+                for sender_id, receiver_id, amount in transfers:
+                    try:
+                        execute_transfer(sender_id, receiver_id, amount)
+                    except InsufficientBalance:
+                        pass
+            synchronous = (Transfer.objects.count(), dict(Account.objects.values_list('pk', 'balance')))
+
+            Transfer.objects.all().delete()
+            Account.objects.update(balance=100000)
+            with timer(results, 'enqueue'):
+                for transfer in transfers:
+                    enqueue_transfer(*transfer)
+            with timer(results, 'group commit'):
+                while process_queued_transfers(options['batch_size']):
+                    pass
+            queued = (Transfer.objects.count(), dict(Account.objects.values_list('pk', 'balance')))
+            assert queued == synchronous, 'The queue and the synchronous path disagree'
+            assert not QueuedTransfer.objects.filter(status=QueuedTransfer.PENDING).exists()
+
+        for name, elapsed in results.items():
+            self.stdout.write('{:<13} {:>8.2f}s {:>10.0f} transfers/s'.format(
+                name, elapsed, options['transfers'] / elapsed))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from app.models import Account
+from app.shards import fold_shards
+
+
+class Command(BaseCommand):
+    help = ('Fold the sub-balances of every sharded account back into its account row, one short '
+            'transaction per account. Meant to run periodically next to the API.')
+
+    def handle(self, *args, **options):
+        accounts = 0
+        moved = 0
+        for account_id in Account.objects.filter(shards__gt=0).values_list('pk', flat=True).iterator():
+            moved += fold_shards(account_id)
+            accounts += 1
+        self.stdout.write('Compacted {} accounts, moved {}'.format(accounts, moved))
@@ -0,0 +1,36 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app.onboarding import CHUNK_SIZE, PARSERS, import_rows
+
+
+class Command(BaseCommand):
+    help = ('Bulk-create customers and their initial accounts from a CSV (name,initial_balances) or NDJSON '
+            '({"name": ..., "accounts": [...]}) file, one transaction per chunk. Use - to read stdin.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=sorted(PARSERS),
+                            help='Input format. Defaults to the file extension; required for stdin.')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or (path.rsplit('.', 1)[-1] if '.' in path else None)
+        if fmt not in PARSERS:
+            raise CommandError('Pass --format, the format can not be told from {!r}'.format(path))
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be positive')
+
+        source = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        try:
+            for event in import_rows(PARSERS[fmt](source), chunk_size=options['chunk_size']):
+                if event['event'] == 'error':
+                    self.stderr.write('line {line}: {error}'.format(**event))
+                else:
+                    self.stdout.write('{event}: {rows} rows, {customers} customers, {accounts} accounts, '
+                                      '{errors} errors'.format(**event))
+        finally:
+            if source is not sys.stdin:
+                source.close()
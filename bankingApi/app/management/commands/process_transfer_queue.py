@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app.transfer_queue import BATCH_SIZE, process_queued_transfers
+
+
+class Command(BaseCommand):
+    help = ('Apply transfers queued by transfer-amount in async mode, many per transaction, in queue order. '
+            'Runs until interrupted unless --once is given.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Transfers per transaction.')
+        parser.add_argument('--poll-interval', type=float, default=0.2, help='Seconds to wait when idle.')
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is empty.')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+
+        total = 0
+        try:
+            while True:
+                processed = process_queued_transfers(options['batch_size'])
+                total += processed
+                if processed:
+                    if options['verbosity'] > 1:
+                        self.stdout.write('Processed {} transfers'.format(processed))
+                elif options['once']:
+                    break
+                else:
+                    time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write('Processed {} transfers in total'.format(total))
@@ -0,0 +1,34 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+
+from app.archive import transfer_models
+from app.rollups import rebuild_day
+
+
+class Command(BaseCommand):
+    help = ('Recompute the per-account daily rollups from the transfers, one day per transaction. '
+            'Defaults to every day from the first transfer to the last.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=date.fromisoformat, help='First day to rebuild (YYYY-MM-DD).')
+        parser.add_argument('--end', type=date.fromisoformat, help='Last day to rebuild (YYYY-MM-DD).')
+
+    def handle(self, *args, **options):
+        bounds = [model.objects.aggregate(first=Min('timestamp'), last=Max('timestamp'))
+                  for model in transfer_models()]
+        timestamps = [bound[key] for bound in bounds for key in ('first', 'last') if bound[key]]
+        start = options['start'] or (timestamps and min(timestamps).date()) or None
+        end = options['end'] or (timestamps and max(timestamps).date()) or None
+        if start is None or end is None:
+            self.stdout.write('No transfers to roll up')
+            return
+        if start > end:
+            raise CommandError('--start must not be after --end')
+
+        day = start
+        while day <= end:
+            written = rebuild_day(day)
+            self.stdout.write('{}: {} rollups'.format(day, written))
+            day += timedelta(days=1)
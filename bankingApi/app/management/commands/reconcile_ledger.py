@@ -0,0 +1,60 @@
+import csv
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app.money import format_minor
+from app.reconciliation import RANGE_SIZE, account_ranges, load_checkpoint, reconcile, save_checkpoint
+
+
+class Command(BaseCommand):
+    help = ('Check that every account balance equals its opening balance plus the transfers it received minus '
+            'the ones it sent. Accounts are checked in id ranges by a pool of worker processes; progress is '
+            'checkpointed after every range, so an interrupted run resumes where it stopped.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--range-size', type=int, default=RANGE_SIZE, help='Account ids per range.')
+        parser.add_argument('--checkpoint', default='reconcile_ledger.checkpoint.json',
+                            help='Progress file; removed once the run completes.')
+        parser.add_argument('--restart', action='store_true', help='Ignore an existing checkpoint.')
+        parser.add_argument('--report', default='-', help='CSV file for the discrepancies; - for stdout.')
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1 or options['range_size'] < 1:
+            raise CommandError('--workers and --range-size must be at least 1')
+
+        path = options['checkpoint']
+        checkpoint = None if options['restart'] else load_checkpoint(path)
+        if checkpoint is None:
+            ranges = account_ranges(options['range_size'])
+            checkpoint = {'ranges': ranges, 'completed': [], 'discrepancies': []}
+        else:
+            self.stderr.write('Resuming: {} of {} ranges already checked'.format(
+                len(checkpoint['completed']), len(checkpoint['ranges'])))
+        completed = {tuple(bounds) for bounds in checkpoint['completed']}
+        pending = [tuple(bounds) for bounds in checkpoint['ranges'] if tuple(bounds) not in completed]
+
+        for bounds, discrepancies in reconcile(pending, options['workers']):
+            checkpoint['completed'].append(bounds)
+            checkpoint['discrepancies'].extend(discrepancies)
+            save_checkpoint(path, checkpoint)
+            self.stderr.write('{}-{}: {} discrepancies'.format(bounds[0], bounds[1] - 1, len(discrepancies)))
+
+        self._report(options['report'], sorted(checkpoint['discrepancies'], key=lambda row: row[0]))
+        if os.path.exists(path):
+            os.remove(path)
+        self.stderr.write('Checked {} ranges, {} discrepancies'.format(
+            len(checkpoint['ranges']), len(checkpoint['discrepancies'])))
+
+    def _report(self, report, discrepancies):
+        f = self.stdout if report == '-' else open(report, 'w', newline='')
+        try:
+            writer = csv.writer(f, lineterminator='\n')
+            writer.writerow(['account_id', 'expected', 'actual', 'difference'])
+            for account_id, expected, actual in discrepancies:
+                writer.writerow([account_id, format_minor(expected), format_minor(actual),
+                                 format_minor(actual - expected)])
+        finally:
+            if f is not self.stdout:
+                f.close()
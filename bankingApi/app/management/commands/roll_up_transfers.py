@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app.rollups import CHUNK_SIZE, roll_up_transfers
+
+
+class Command(BaseCommand):
+    help = ('Add new transfers to the per-account daily rollups, many per transaction. Account summaries read '
+            'the transfers that are still pending one by one, so keep this running next to the web workers. '
+            'Runs until interrupted unless --once is given.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=CHUNK_SIZE, help='Transfers per transaction.')
+        parser.add_argument('--poll-interval', type=float, default=1, help='Seconds to wait when idle.')
+        parser.add_argument('--once', action='store_true', help='Exit once no transfers are pending.')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+
+        total = 0
+        try:
+            while True:
+                rolled_up = roll_up_transfers(options['batch_size'])
+                total += rolled_up
+                if rolled_up:
+                    if options['verbosity'] > 1:
+                        self.stdout.write('Rolled up {} transfers'.format(rolled_up))
+                elif options['once']:
+                    break
+                else:
+                    time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write('Rolled up {} transfers in total'.format(total))
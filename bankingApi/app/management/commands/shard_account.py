@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app.models import Account
+from app.shards import MAX_SHARDS, set_shard_count
+
+
+class Command(BaseCommand):
+    help = ('Spread the credits to a hot account over N sub-balance rows, or turn sharding off with '
+            '--shards 0. Reads and debits combine the shards; compact_balance_shards folds them back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('account_id', type=int)
+        parser.add_argument('--shards', type=int, required=True, help='0 to {}.'.format(MAX_SHARDS))
+
+    def handle(self, *args, **options):
+        try:
+            set_shard_count(options['account_id'], options['shards'])
+        except Account.DoesNotExist:
+            raise CommandError('Account {} does not exist'.format(options['account_id']))
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write('Account {account_id}: {shards} shards'.format(**options))
@@ -0,0 +1,33 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max
+
+from app.models import BalanceSnapshot
+from app.snapshots import snapshot_day, snapshot_initial
+
+
+class Command(BaseCommand):
+    help = ('Write daily closing balance snapshots, continuing from the last snapshotted day. '
+            'The first run snapshots every account once, on --until.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--until', type=date.fromisoformat,
+                            help='Last day to snapshot (YYYY-MM-DD). Defaults to yesterday; today is never complete.')
+
+    def handle(self, *args, **options):
+        until = options['until'] or date.today() - timedelta(days=1)
+        if until >= date.today():
+            raise CommandError('Only complete days can be snapshotted')
+
+        last = BalanceSnapshot.objects.aggregate(last=Max('day'))['last']
+        if last is None:
+            written = snapshot_initial(until)
+            self.stdout.write('{}: {} initial snapshots'.format(until, written))
+            return
+
+        day = last + timedelta(days=1)
+        while day <= until:
+            written = snapshot_day(day)
+            self.stdout.write('{}: {} snapshots'.format(day, written))
+            day += timedelta(days=1)
@@ -0,0 +1,100 @@
+import random
+import threading
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Sum
+
+from app.models import Customer, Account, Transfer
+from app.money import to_minor
+from app.transfers import InsufficientBalance, execute_transfer
+from ._bench import benchmark_database, timer
+
+
+def _legacy_transfer(sender_account_id, receiver_account_id, amount):
+    with transaction.atomic():
+        sender_account = Account.objects.get(pk=sender_account_id)
+        receiver_account = Account.objects.get(pk=receiver_account_id)
+        if sender_account.balance < amount:
+            raise InsufficientBalance
+        Transfer.objects.create(sender_account=sender_account, receiver_account=receiver_account, amount=amount)
+        sender_account.balance -= amount
+        sender_account.save()
+        receiver_account.balance += amount
+        receiver_account.save()
+
+
+class Command(BaseCommand):
+    help = ('Fire concurrent transfers at a throwaway database and compare the lock-ordered transfer engine '
+            'with the read-modify-write path serialized behind a global lock.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--accounts', type=int, default=20)
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--transfers', type=int, default=400, help='Transfers per thread.')
+        parser.add_argument('--initial-balance', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if options['accounts'] < 2:
+            raise CommandError('At least two accounts are needed')
+
+        initial_balance = to_minor(options['initial_balance'])
+        with benchmark_database():
+            customer = Customer.objects.create(name='Benchmark')
+            accounts = [Account(customer=customer, balance=initial_balance)
+                        for _ in range(options['accounts'])]
+            Account.objects.bulk_create(accounts)
+            account_ids = list(Account.objects.values_list('id', flat=True))
+
+            global_lock = threading.Lock()
+
+            def serialized(sender_account_id, receiver_account_id, amount):
+                with global_lock:
+                    _legacy_transfer(sender_account_id, receiver_account_id, amount)
+
+            results = {}
+            for name, transfer_func in (('serialized', serialized), ('engine', execute_transfer)):
+                Transfer.objects.all().delete()
+                Account.objects.update(balance=initial_balance)
+                with timer(results, name):
+                    self._run(transfer_func, account_ids, options)
+                self._check_ledger(account_ids, initial_balance)
+
+            total = options['threads'] * options['transfers']
+            for name, elapsed in results.items():
+                self.stdout.write('{:<12} {:>8} transfers in {:.2f}s  {:>10.1f} transfers/sec'.format(
+                    name, total, elapsed, total / elapsed))
+            self.stdout.write('speedup: {:.2f}x'.format(results['serialized'] / results['engine']))
+
+    def _run(self, transfer_func, account_ids, options):
+        errors = []
+
+        def worker(seed):
+            rng = random.Random(seed)
+            try:
+                for _ in range(options['transfers']):
+                    sender_account_id, receiver_account_id = rng.sample(account_ids, 2)
+                    try:
+                        transfer_func(sender_account_id, receiver_account_id, rng.randint(1, 100) * 100)
+                    except InsufficientBalance:
+                        pass
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(options['seed'] + i,)) for i in range(options['threads'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if errors:
+            raise CommandError('{} worker(s) failed: {!r}'.format(len(errors), errors[0]))
+
+    def _check_ledger(self, account_ids, initial_balance):
+        expected = initial_balance * len(account_ids)
+        total = Account.objects.aggregate(total=Sum('balance'))['total']
+        if total != expected:
+            raise CommandError('Lost update detected: total balance {} != {}'.format(total, expected))
@@ -0,0 +1,31 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = ('Copy the primary SQLite database over the replica with the SQLite backup API. Stands in for '
+            'replication when the replica is a second local SQLite file.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=getattr(settings, 'REPLICA_DATABASE_ALIAS', 'replica'),
+                            help='Alias of the replica.')
+
+    def handle(self, *args, **options):
+        alias = options['database']
+        if alias not in settings.DATABASES or alias == DEFAULT_DB_ALIAS:
+            raise CommandError('No replica database {!r} is configured'.format(alias))
+        primary, replica = connections[DEFAULT_DB_ALIAS], connections[alias]
+        if primary.vendor != 'sqlite' or replica.vendor != 'sqlite':
+            raise CommandError('Only SQLite databases can be copied')
+
+        replica.close()
+        primary.ensure_connection()
+        target = sqlite3.connect(replica.settings_dict['NAME'])
+        try:
+            primary.connection.backup(target)
+        finally:
+            target.close()
+        self.stdout.write('Copied {} to {}'.format(primary.settings_dict['NAME'], replica.settings_dict['NAME']))
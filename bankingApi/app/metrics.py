@@ -0,0 +1,135 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+
+PREFIX = 'banking_'
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+METRICS = {
+    'request_duration_seconds': ('Time spent handling requests, per view.', DURATION_BUCKETS),
+    'db_duration_seconds': ('Time spent in database queries per request, per view.', DURATION_BUCKETS),
+    'serialize_duration_seconds': ('Time spent serializing response data per request, per view.', DURATION_BUCKETS),
+    'permission_duration_seconds': ('Time spent checking permissions per request, per view.', DURATION_BUCKETS),
+    'encode_duration_seconds': ('Time spent encoding response data into bodies, per view.', DURATION_BUCKETS),
+    'db_queries': ('Database queries per request, per view.', QUERY_BUCKETS),
+}
+
+
+request_timings = ContextVar('request_timings', default=None)
+
+
+class RequestTimings:
+    """The phases of one request, in seconds; set in ``request_timings`` by ``RequestMetricsMiddleware``."""
+    __slots__ = ('queries', 'db', 'serialize', 'permission', 'encode', 'encode_start')
+
+    def __init__(self):
+        self.queries = 0
+        self.db = 0.0
+        self.serialize = 0.0
+        self.permission = 0.0
+        self.encode = 0.0
+        self.encode_start = None
+
+
+@contextmanager
+def timed(phase):
+    """
+    Add the time the block takes to ``phase`` of the current request; a no-op outside of a timed request.
+
+    Queries the block runs are left out, they are already part of the database time.
+    """
+    timings = request_timings.get()
+    if timings is None:
+        yield
+        return
+    start, db = time.perf_counter(), timings.db
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start - (timings.db - db)
+        setattr(timings, phase, getattr(timings, phase) + elapsed)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # One count per bucket plus the +Inf bucket; made cumulative when rendered.
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+_lock = threading.Lock()
+_histograms = {}
+
+
+def metrics_enabled():
+    return getattr(settings, 'REQUEST_METRICS', False)
+
+
+def observe(view, **values):
+    """Record one request of ``view``; ``values`` maps metric names to the observed values."""
+    with _lock:
+        for name, value in values.items():
+            histogram = _histograms.get((name, view))
+            if histogram is None:
+                histogram = _histograms[(name, view)] = Histogram(METRICS[name][1])
+            histogram.observe(value)
+
+
+def reset_metrics():
+    with _lock:
+        _histograms.clear()
+
+
+def _label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_prometheus():
+    """The histograms in the Prometheus text exposition format."""
+    with _lock:
+        snapshot = {key: (list(histogram.counts), histogram.sum) for key, histogram in _histograms.items()}
+
+    lines = []
+    for name, (description, buckets) in METRICS.items():
+        metric = PREFIX + name
+        lines.append('# HELP {} {}'.format(metric, description))
+        lines.append('# TYPE {} histogram'.format(metric))
+        for (histogram_name, view), (counts, total) in sorted(snapshot.items()):
+            if histogram_name != name:
+                continue
+            view = _label(view)
+            cumulative = 0
+            for bound, count in zip(buckets + ('+Inf',), counts):
+                cumulative += count
+                lines.append('{}_bucket{{view="{}",le="{}"}} {}'.format(metric, view, bound, cumulative))
+            lines.append('{}_sum{{view="{}"}} {}'.format(metric, view, total))
+            lines.append('{}_count{{view="{}"}} {}'.format(metric, view, cumulative))
+    return '\n'.join(lines) + '\n'
+
+
+def _may_scrape(request):
+    # Scrapers send METRICS_TOKEN as a bearer token; staff can look from a signed-in browser.
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token and constant_time_compare(request.headers.get('Authorization', ''), 'Bearer ' + token):
+        return True
+    return request.user.is_authenticated and request.user.is_staff
+
+
+def metrics(request):
+    if not metrics_enabled():
+        raise Http404
+    if not _may_scrape(request):
+        return HttpResponseForbidden()
+    return HttpResponse(render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,100 @@
+import asyncio
+import time
+
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.db.backends.signals import connection_created
+
+from .metrics import RequestTimings, metrics_enabled, observe, request_timings
+
+
+def _record_query(execute, sql, params, many, context):
+    timings = request_timings.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.db += time.perf_counter() - start
+        timings.queries += 1
+
+
+def _install(connection, **kwargs):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+class RequestMetricsMiddleware:
+    """
+    Time each request, the database queries it runs, its permission checks, the serialization of its
+    response data and the encoding of that data into the response body.
+
+    The views and permission classes report serialization and permission checks through ``metrics.timed``;
+    queries those run count as database time only. Encoding is the renderer turning the response data into
+    bytes.
+
+    The breakdown is returned in a ``Server-Timing`` header and recorded in per-view histograms served by
+    the ``/metrics`` endpoint. Queries are timed by an execute wrapper on every connection that reports to
+    the request's context variable, so ORM calls that async views make on worker threads count too.
+    Unless ``REQUEST_METRICS`` is set the middleware removes itself from the stack at startup.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not metrics_enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self._async = asyncio.iscoroutinefunction(get_response)
+        if self._async:
+            # Tells the handler that __call__ returns a coroutine, as MiddlewareMixin does.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+        connection_created.connect(_install, dispatch_uid='request_metrics')
+
+    def __call__(self, request):
+        if self._async:
+            return self.__acall__(request)
+        # The connection of this thread may predate the connection_created receiver.
+        _install(connection)
+        timings = RequestTimings()
+        token = request_timings.set(timings)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            request_timings.reset(token)
+        return self._finish(request, response, timings, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        timings = RequestTimings()
+        token = request_timings.set(timings)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            request_timings.reset(token)
+        return self._finish(request, response, timings, time.perf_counter() - start)
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered after the view returns; time it from here to the end of render().
+        timings = request_timings.get()
+        if timings is not None:
+            timings.encode_start = time.perf_counter()
+            response.add_post_render_callback(lambda response: self._encoded(timings))
+        return response
+
+    def _encoded(self, timings):
+        timings.encode = time.perf_counter() - timings.encode_start
+
+    def _finish(self, request, response, timings, total):
+        match = getattr(request, 'resolver_match', None)
+        observe(match.view_name if match else 'unresolved', request_duration_seconds=total,
+                db_duration_seconds=timings.db, serialize_duration_seconds=timings.serialize,
+                permission_duration_seconds=timings.permission, encode_duration_seconds=timings.encode,
+                db_queries=timings.queries)
+        response['Server-Timing'] = (
+            'db;dur={:.3f};desc="{} queries", permission;dur={:.3f}, serialize;dur={:.3f}, encode;dur={:.3f}, '
+            'total;dur={:.3f}'.format(timings.db * 1000, timings.queries, timings.permission * 1000,
+                                      timings.serialize * 1000, timings.encode * 1000, total * 1000))
+        return response
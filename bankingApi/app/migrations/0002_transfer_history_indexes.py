@@ -0,0 +1,32 @@
+# Generated by Django 3.2.10 on 2026-10-18 08:50
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transfer',
+            index=models.Index(fields=['sender_account', 'timestamp'], name='transfer_sender_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transfer',
+            index=models.Index(fields=['receiver_account', 'timestamp'], name='transfer_receiver_ts_idx'),
+        ),
+        migrations.AlterField(
+            model_name='transfer',
+            name='receiver_account',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='receiver_account', to='app.account'),
+        ),
+        migrations.AlterField(
+            model_name='transfer',
+            name='sender_account',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='sender_account', to='app.account'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.10 on 2026-10-18 08:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0002_transfer_history_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='account',
+            name='version',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
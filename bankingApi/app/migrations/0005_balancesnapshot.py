@@ -0,0 +1,35 @@
+# Generated by Django 3.2.10 on 2026-10-18 09:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0004_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BalanceSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('balance', models.DecimalField(decimal_places=2, max_digits=12)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='transfer',
+            index=models.Index(fields=['timestamp'], name='transfer_ts_idx'),
+        ),
+        migrations.AddField(
+            model_name='balancesnapshot',
+            name='account',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='app.account'),
+        ),
+        migrations.AddConstraint(
+            model_name='balancesnapshot',
+            constraint=models.UniqueConstraint(fields=('account', 'day'), name='balance_snapshot_account_day_unique'),
+        ),
+    ]
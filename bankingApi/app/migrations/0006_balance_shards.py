@@ -0,0 +1,32 @@
+# Generated by Django 3.2.10 on 2026-10-18 10:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0005_balancesnapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='account',
+            name='shards',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='BalanceShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('balance', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('account', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='app.account')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='balanceshard',
+            constraint=models.UniqueConstraint(fields=('account', 'shard'), name='balance_shard_account_shard_unique'),
+        ),
+    ]
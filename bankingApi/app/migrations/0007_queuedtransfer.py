@@ -0,0 +1,33 @@
+# Generated by Django 3.2.10 on 2026-10-18 11:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0006_balance_shards'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueuedTransfer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sender_account_id', models.BigIntegerField()),
+                ('receiver_account_id', models.BigIntegerField()),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('completed', 'Completed'), ('rejected', 'Rejected')], default='pending', max_length=9)),
+                ('error', models.CharField(blank=True, max_length=255)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('transfer', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='app.transfer')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='queuedtransfer',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['id'], name='queued_transfer_pending_idx'),
+        ),
+    ]
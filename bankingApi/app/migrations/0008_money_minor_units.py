@@ -0,0 +1,97 @@
+# Generated by Django 3.2.10 on 2026-10-18 12:00
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import F
+from django.db.models.functions import Cast, Round
+
+# (model, field) for every money field; the values become integer minor units (kuruş).
+MONEY_FIELDS = [
+    ('account', 'balance'),
+    ('balanceshard', 'balance'),
+    ('transfer', 'amount'),
+    ('queuedtransfer', 'amount'),
+    ('balancesnapshot', 'balance'),
+]
+
+
+def to_minor_units(apps, schema_editor):
+    # SQLite may hold the decimals as floats; rounding before the cast keeps 100.1 * 100 from becoming 10009.
+    db_alias = schema_editor.connection.alias
+    for model_name, field in MONEY_FIELDS:
+        model = apps.get_model('app', model_name)
+        minor = Cast(Round(F(field) * 100), models.BigIntegerField())
+        model.objects.using(db_alias).update(**{field + '_minor': minor})
+
+
+def from_minor_units(apps, schema_editor):
+    # SQLite divides integers without a remainder, so the way back is done in Python.
+    db_alias = schema_editor.connection.alias
+    for model_name, field in MONEY_FIELDS:
+        model = apps.get_model('app', model_name)
+        rows = model.objects.using(db_alias).values_list('pk', field + '_minor').iterator(chunk_size=2000)
+        objs = [model(pk=pk, **{field: Decimal(minor).scaleb(-2)}) for pk, minor in rows]
+        model.objects.using(db_alias).bulk_update(objs, [field], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0007_queuedtransfer'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='account',
+            name='balance_minor',
+            field=models.BigIntegerField(default=0, verbose_name='Bakiye'),
+        ),
+        migrations.AddField(
+            model_name='balanceshard',
+            name='balance_minor',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='transfer',
+            name='amount_minor',
+            field=models.BigIntegerField(default=0),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='queuedtransfer',
+            name='amount_minor',
+            field=models.BigIntegerField(default=0),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='balancesnapshot',
+            name='balance_minor',
+            field=models.BigIntegerField(default=0),
+            preserve_default=False,
+        ),
+        # Nullable while both columns exist, so that unapplying can re-add them before they are filled in again.
+        migrations.AlterField(
+            model_name='transfer',
+            name='amount',
+            field=models.DecimalField(decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AlterField(
+            model_name='queuedtransfer',
+            name='amount',
+            field=models.DecimalField(decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AlterField(
+            model_name='balancesnapshot',
+            name='balance',
+            field=models.DecimalField(decimal_places=2, max_digits=12, null=True),
+        ),
+        migrations.RunPython(to_minor_units, from_minor_units),
+    ] + [
+        operation
+        for model_name, field in MONEY_FIELDS
+        for operation in (
+            migrations.RemoveField(model_name=model_name, name=field),
+            migrations.RenameField(model_name=model_name, old_name=field + '_minor', new_name=field),
+        )
+    ]
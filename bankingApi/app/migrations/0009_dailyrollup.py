@@ -0,0 +1,30 @@
+# Generated by Django 3.2.10 on 2026-10-18 13:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0008_money_minor_units'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('amount_in', models.BigIntegerField(default=0)),
+                ('amount_out', models.BigIntegerField(default=0)),
+                ('count_in', models.PositiveIntegerField(default=0)),
+                ('count_out', models.PositiveIntegerField(default=0)),
+                ('account', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='app.account')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='dailyrollup',
+            constraint=models.UniqueConstraint(fields=('account', 'day'), name='daily_rollup_account_day_unique'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 3.2.10 on 2026-10-18 14:00
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0009_dailyrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransferArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(max_length=7, unique=True)),
+                ('db_table', models.CharField(max_length=63, unique=True)),
+                ('start', models.DateTimeField()),
+                ('end', models.DateTimeField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
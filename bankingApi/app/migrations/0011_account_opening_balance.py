@@ -0,0 +1,47 @@
+# Generated by Django 3.2.10 on 2026-10-18 15:00
+
+import app.models
+from django.db import migrations
+
+
+def derive_opening_balances(apps, schema_editor):
+    # Existing accounts get the opening balance their current balance and transfers imply, archived
+    # transfers included, so the ledger reconciles as of this migration.
+    db_alias = schema_editor.connection.alias
+    Account = apps.get_model('app', 'Account')
+    BalanceShard = apps.get_model('app', 'BalanceShard')
+    Transfer = apps.get_model('app', 'Transfer')
+    TransferArchive = apps.get_model('app', 'TransferArchive')
+    quote = schema_editor.quote_name
+
+    account = quote(Account._meta.db_table)
+    terms = ['{}.balance'.format(account),
+             '+ COALESCE((SELECT SUM(balance) FROM {} WHERE account_id = {}.id), 0)'.format(
+                 quote(BalanceShard._meta.db_table), account)]
+    archives = TransferArchive.objects.using(db_alias).values_list('db_table', flat=True)
+    for table in [Transfer._meta.db_table, *archives]:
+        for sign, column in (('-', 'receiver_account_id'), ('+', 'sender_account_id')):
+            terms.append('{} COALESCE((SELECT SUM(amount) FROM {} WHERE {} = {}.id), 0)'.format(
+                sign, quote(table), column, account))
+    schema_editor.execute('UPDATE {} SET opening_balance = {}'.format(account, ' '.join(terms)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0010_transferarchive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='account',
+            name='opening_balance',
+            field=app.models.OpeningBalanceField(blank=True, null=True),
+        ),
+        migrations.RunPython(derive_opening_balances, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='account',
+            name='opening_balance',
+            field=app.models.OpeningBalanceField(blank=True),
+        ),
+    ]
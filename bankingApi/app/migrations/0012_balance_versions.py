@@ -0,0 +1,29 @@
+# Generated by Django 3.2.10 on 2026-10-18 16:00
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0011_account_opening_balance'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='account',
+            name='modified_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='balanceshard',
+            name='modified_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='balanceshard',
+            name='version',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 3.2.10 on 2026-10-18 17:00
+
+import app.models
+from app.names import name_tokens, normalize_name
+from django.db import migrations, models
+import django.db.models.deletion
+
+BATCH_SIZE = 2000
+
+
+def index_customer_names(apps, schema_editor):
+    db_alias = schema_editor.connection.alias
+    Customer = apps.get_model('app', 'Customer')
+    CustomerNameToken = apps.get_model('app', 'CustomerNameToken')
+    customers = []
+    for pk, name in Customer.objects.using(db_alias).values_list('pk', 'name').iterator(chunk_size=BATCH_SIZE):
+        customers.append(Customer(pk=pk, name=name, search_name=normalize_name(name)))
+        if len(customers) == BATCH_SIZE:
+            _write(Customer, CustomerNameToken, customers, db_alias)
+            customers = []
+    _write(Customer, CustomerNameToken, customers, db_alias)
+
+
+def _write(Customer, CustomerNameToken, customers, db_alias):
+    Customer.objects.using(db_alias).bulk_update(customers, ['search_name'], batch_size=500)
+    CustomerNameToken.objects.using(db_alias).bulk_create(
+        [CustomerNameToken(customer_id=customer.pk, token=token)
+         for customer in customers for token in name_tokens(customer.name)], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0012_balance_versions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerNameToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=255)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='search_name',
+            field=app.models.SearchNameField(blank=True, default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='customernametoken',
+            name='customer',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='app.customer'),
+        ),
+        migrations.AddConstraint(
+            model_name='customernametoken',
+            constraint=models.UniqueConstraint(fields=('token', 'customer'), name='customer_name_token_unique'),
+        ),
+        migrations.RunPython(index_customer_names, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['search_name', 'id'], name='customer_search_name_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.2.10 on 2026-10-18 18:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0013_customer_search'),
+    ]
+
+    operations = [
+        # Existing transfers were added to the rollups when they were made.
+        migrations.AddField(
+            model_name='transfer',
+            name='rolled_up',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AlterField(
+            model_name='transfer',
+            name='rolled_up',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name='transfer',
+            index=models.Index(condition=models.Q(('rolled_up', False)), fields=['id'], name='transfer_rollup_pending_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 3.2.10 on 2026-10-18 19:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0014_transfer_rolled_up'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='queuedtransfer',
+            name='transfer',
+            field=models.OneToOneField(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, to='app.transfer'),
+        ),
+    ]
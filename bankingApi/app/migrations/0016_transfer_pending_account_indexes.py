@@ -0,0 +1,21 @@
+# Generated by Django 3.2.10 on 2026-10-18 11:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0015_queued_transfer_keeps_archived_transfer'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transfer',
+            index=models.Index(condition=models.Q(('rolled_up', False)), fields=['sender_account'], name='transfer_sender_pending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transfer',
+            index=models.Index(condition=models.Q(('rolled_up', False)), fields=['receiver_account'], name='transfer_receiver_pending_idx'),
+        ),
+    ]
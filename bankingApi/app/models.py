@@ -2,6 +2,9 @@ from django.contrib.auth.models import User
 from django.db import models
 from django.utils import timezone
 
+from .money import format_minor
+from .names import normalize_name
+
 
 class Employee(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -10,27 +13,217 @@ class Employee(models.Model):
         return f'{self.user.get_full_name()}'
 
 
+class SearchNameField(models.CharField):
+    """The customer's ``name`` normalized by app.names, recomputed on every save and ``bulk_create``."""
+
+    def pre_save(self, model_instance, add):
+        value = normalize_name(model_instance.name)
+        setattr(model_instance, self.attname, value)
+        return value
+
+
 class Customer(models.Model):
     name = models.CharField(null=True, blank=True, max_length=255, verbose_name='Ad Soyad')
+    # Searched by prefix through the (search_name, id) index; queryset.update(name=...) bypasses it.
+    search_name = SearchNameField(max_length=255, blank=True, default='', editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['search_name', 'id'], name='customer_search_name_idx'),
+        ]
 
     def __str__(self):
         return f'{self.name}'
 
 
+class CustomerNameToken(models.Model):
+    """One word of a customer's normalized name, for finding customers by any word; see app.search."""
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE)
+    token = models.CharField(max_length=255)
+
+    class Meta:
+        constraints = [
+            # Also the index the word search scans, in customer order.
+            models.UniqueConstraint(fields=['token', 'customer'], name='customer_name_token_unique'),
+        ]
+
+    def __str__(self):
+        return f'{self.token} -> {self.customer_id}'
+
+
+class OpeningBalanceField(models.BigIntegerField):
+    """Takes the account's ``balance`` when an account is created without one, ``bulk_create`` included."""
+
+    def pre_save(self, model_instance, add):
+        if add and getattr(model_instance, self.attname) is None:
+            setattr(model_instance, self.attname, model_instance.balance)
+        return super().pre_save(model_instance, add)
+
+
 class Account(models.Model):
     customer = models.ForeignKey(Customer, on_delete=models.CASCADE)
-    balance = models.DecimalField(max_digits=12, decimal_places=2, default=0.00, verbose_name='Bakiye')
+    # Money is stored in minor units (kuruş) throughout; see app.money.
+    balance = models.BigIntegerField(default=0, verbose_name='Bakiye')
+    # The balance the account was opened with; balance = opening balance + transfers in - transfers out,
+    # which reconcile_ledger checks.
+    opening_balance = OpeningBalanceField(blank=True)
+    # Incremented with every balance change and every transfer; orders cached balances and derived
+    # representations, and with the shards' versions makes the ETags of app.versions.
+    version = models.PositiveBigIntegerField(default=0)
+    modified_at = models.DateTimeField(default=timezone.now)
+    # When non-zero, credits land on this many BalanceShard rows instead of this row; see app.shards.
+    shards = models.PositiveSmallIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return f'{self.customer.name}'
 
 
+class BalanceShard(models.Model):
+    """Part of the balance of a sharded account; the account's balance is its own plus all of its shards'."""
+    # Covered by the (account, shard) unique constraint.
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, db_index=False)
+    shard = models.PositiveSmallIntegerField()
+    balance = models.BigIntegerField(default=0)
+    # Bumped by the credits that land on this shard instead of the account row.
+    version = models.PositiveBigIntegerField(default=0)
+    modified_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['account', 'shard'], name='balance_shard_account_shard_unique'),
+        ]
+
+    def __str__(self):
+        return f'{self.account_id}/{self.shard}: {format_minor(self.balance)}'
+
+
 class Transfer(models.Model):
-    sender_account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='sender_account')
-    receiver_account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='receiver_account')
-    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    # Covered by the composite (account, timestamp) indexes below.
+    sender_account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='sender_account',
+                                       db_index=False)
+    receiver_account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='receiver_account',
+                                         db_index=False)
+    amount = models.BigIntegerField()
     timestamp = models.DateTimeField(default=timezone.now)
+    # Whether the transfer has been added to the daily rollups; see app.rollups.roll_up_transfers.
+    rolled_up = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['sender_account', 'timestamp'], name='transfer_sender_ts_idx'),
+            models.Index(fields=['receiver_account', 'timestamp'], name='transfer_receiver_ts_idx'),
+            models.Index(fields=['timestamp'], name='transfer_ts_idx'),
+            models.Index(fields=['id'], condition=models.Q(rolled_up=False), name='transfer_rollup_pending_idx'),
+            models.Index(fields=['sender_account'], condition=models.Q(rolled_up=False),
+                         name='transfer_sender_pending_idx'),
+            models.Index(fields=['receiver_account'], condition=models.Q(rolled_up=False),
+                         name='transfer_receiver_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f'{format_minor(self.amount)} - {self.sender_account} to {self.receiver_account}'
+
+
+class TransferArchive(models.Model):
+    """
+    An archive table holding the transfers of one month that were moved out of ``Transfer``.
+
+    The tables themselves are created and queried through the models of app.archive.
+    """
+    period = models.CharField(max_length=7, unique=True)
+    db_table = models.CharField(max_length=63, unique=True)
+    # The month the table covers, [start, end).
+    start = models.DateTimeField()
+    end = models.DateTimeField()
+    created_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f'{self.period} ({self.db_table})'
+
+
+class QueuedTransfer(models.Model):
+    """A transfer accepted by ``transfer-amount`` in async mode, applied later by ``process_transfer_queue``."""
+    PENDING = 'pending'
+    COMPLETED = 'completed'
+    REJECTED = 'rejected'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (COMPLETED, 'Completed'),
+        (REJECTED, 'Rejected'),
+    ]
+
+    # Plain ids rather than foreign keys: as in synchronous mode, unknown accounts are a rejection
+    # reported by the transfer, not an error when it is accepted.
+    sender_account_id = models.BigIntegerField()
+    receiver_account_id = models.BigIntegerField()
+    amount = models.BigIntegerField()
+    status = models.CharField(max_length=9, choices=STATUS_CHOICES, default=PENDING)
+    error = models.CharField(max_length=255, blank=True)
+    # No constraint and no cascade: the transfer may be moved to an archive table, which keeps its id.
+    transfer = models.OneToOneField(Transfer, on_delete=models.DO_NOTHING, db_constraint=False, null=True,
+                                    blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # The worker drains pending transfers in id order; processed rows drop out of the index.
+            models.Index(fields=['id'], condition=models.Q(status='pending'), name='queued_transfer_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f'{format_minor(self.amount)} - {self.sender_account_id} to {self.receiver_account_id} ({self.status})'
+
+
+class BalanceSnapshot(models.Model):
+    """Closing balance of an account at the end of ``day``; only written for days the balance changed."""
+    # Covered by the (account, day) unique constraint.
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, db_index=False)
+    day = models.DateField()
+    balance = models.BigIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['account', 'day'], name='balance_snapshot_account_day_unique'),
+        ]
+
+    def __str__(self):
+        return f'{self.account_id} @ {self.day}: {format_minor(self.balance)}'
+
+
+class DailyRollup(models.Model):
+    """Money in and out of an account on ``day``; kept up to date by every transfer, see app.rollups."""
+    # Covered by the (account, day) unique constraint.
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, db_index=False)
+    day = models.DateField()
+    amount_in = models.BigIntegerField(default=0)
+    amount_out = models.BigIntegerField(default=0)
+    count_in = models.PositiveIntegerField(default=0)
+    count_out = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['account', 'day'], name='daily_rollup_account_day_unique'),
+        ]
+
+    def __str__(self):
+        return f'{self.account_id} @ {self.day}: +{format_minor(self.amount_in)} -{format_minor(self.amount_out)}'
+
+
+class IdempotencyKey(models.Model):
+    # Covered by the (user, key) unique constraint.
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True)
+    response_body = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='idempotency_user_key_unique'),
+        ]
 
     def __str__(self):
-        return f'{self.amount} - {self.sender_account} to {self.receiver_account}'
+        return f'{self.key} ({self.status_code})'
@@ -0,0 +1,37 @@
+from decimal import Decimal, InvalidOperation
+
+# Amounts are stored and computed as integers in minor units (kuruş); decimals only exist at the API boundary.
+PLACES = 2
+
+# The ranges of the former DecimalFields: 12 digits for balances, 10 for transfer amounts.
+MAX_BALANCE = 10 ** 12 - 1
+MAX_AMOUNT = 10 ** 10 - 1
+
+
+def to_minor(value):
+    """
+    Convert a decimal amount as sent by clients, e.g. ``'12.50'`` or ``12.5``, to minor units.
+
+    Raises ``ValueError`` for anything that isn't a finite number with at most two decimal places.
+    """
+    try:
+        amount = Decimal(str(value).strip())
+    except InvalidOperation:
+        raise ValueError('Invalid amount: {!r}'.format(value))
+    if not amount.is_finite():
+        raise ValueError('Invalid amount: {!r}'.format(value))
+    minor = amount.scaleb(PLACES)
+    if minor != minor.to_integral_value():
+        raise ValueError('Amounts can have at most {} decimal places: {!r}'.format(PLACES, value))
+    return int(minor)
+
+
+def from_minor(minor):
+    """The two-place ``Decimal`` for ``minor`` units, as the API has always rendered amounts."""
+    return Decimal(minor).scaleb(-PLACES)
+
+
+def format_minor(minor):
+    """``minor`` units as a two-place decimal string, without going through ``Decimal``."""
+    units, cents = divmod(abs(minor), 10 ** PLACES)
+    return '{}{}.{:0{}d}'.format('-' if minor < 0 else '', units, cents, PLACES)
@@ -0,0 +1,19 @@
+import unicodedata
+
+# Python's case mapping is locale-independent: it lowercases I to i and İ to i plus a combining dot.
+TURKISH_LOWER = str.maketrans({'I': 'ı', 'İ': 'i'})
+
+
+def normalize_name(name):
+    """
+    ``name`` the way it is indexed and searched for: NFC, case-folded with Turkish dotted and dotless i, and
+    single-spaced. ``'IŞIK  İnce'`` and ``'ışık ince'`` both become ``'ışık ince'``.
+    """
+    if not name:
+        return ''
+    return ' '.join(unicodedata.normalize('NFC', name).translate(TURKISH_LOWER).casefold().split())
+
+
+def name_tokens(name):
+    """The distinct words of the normalized ``name``."""
+    return sorted(set(normalize_name(name).split()))
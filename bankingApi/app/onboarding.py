@@ -0,0 +1,120 @@
+import csv
+import json
+
+from django.db import transaction
+
+from .bulk import bulk_create_with_pks
+from .models import Customer, Account
+from .money import MAX_BALANCE, to_minor
+from .search import index_name_tokens
+
+CHUNK_SIZE = 1000
+MAX_NAME_LENGTH = Customer._meta.get_field('name').max_length
+
+
+class RowError(ValueError):
+    pass
+
+
+def _balance(value):
+    try:
+        balance = to_minor(value)
+    except ValueError:
+        raise RowError('Invalid initial balance: {!r}'.format(value))
+    if balance < 0:
+        raise RowError('Invalid initial balance: {!r}'.format(value))
+    if balance > MAX_BALANCE:
+        raise RowError('Initial balance out of range: {!r}'.format(value))
+    return balance
+
+
+def _row(name, balances):
+    if not isinstance(name, str) or not name.strip():
+        raise RowError('name is required')
+    if len(name) > MAX_NAME_LENGTH:
+        raise RowError('name is longer than {} characters'.format(MAX_NAME_LENGTH))
+    return name.strip(), [_balance(balance) for balance in balances]
+
+
+def parse_csv(lines):
+    """
+    Parse ``name,initial_balances`` CSV lines; ``initial_balances`` is a ``;``-separated list.
+
+    Yields ``(line_number, (name, balances))`` or ``(line_number, RowError)`` one row at a time.
+    """
+    reader = csv.DictReader(lines)
+    if reader.fieldnames is None or 'name' not in reader.fieldnames:
+        raise RowError('CSV header must contain a name column')
+    for row in reader:
+        balances = [balance for balance in (row.get('initial_balances') or '').split(';') if balance.strip()]
+        try:
+            yield reader.line_num, _row(row['name'], balances)
+        except RowError as e:
+            yield reader.line_num, e
+
+
+def parse_ndjson(lines):
+    """Parse ``{"name": ..., "accounts": [initial balances]}`` lines, one row at a time."""
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+            if not isinstance(row, dict) or not isinstance(row.get('accounts', []), list):
+                raise RowError('Expected an object with a name and an accounts list')
+            yield line_number, _row(row.get('name'), row.get('accounts', []))
+        except ValueError as e:
+            yield line_number, e if isinstance(e, RowError) else RowError('Invalid JSON: {}'.format(e))
+
+
+PARSERS = {
+    'csv': parse_csv,
+    'ndjson': parse_ndjson,
+}
+
+
+def _import_chunk(chunk):
+    with transaction.atomic():
+        customers = [Customer(name=name) for name, _ in chunk]
+        bulk_create_with_pks(Customer, customers)
+        index_name_tokens(customers)
+        accounts = [Account(customer=customer, balance=balance)
+                    for customer, (_, balances) in zip(customers, chunk) for balance in balances]
+        Account.objects.bulk_create(accounts, batch_size=CHUNK_SIZE)
+    return len(customers), len(accounts)
+
+
+def import_rows(rows, chunk_size=CHUNK_SIZE):
+    """
+    Insert parsed rows with chunked ``bulk_create`` calls, one transaction per chunk.
+
+    A generator of events: an ``error`` event per rejected row, a ``progress`` event per committed chunk
+    and a final ``done`` event with the totals. Only one chunk is held in memory at a time.
+    """
+    totals = {'rows': 0, 'customers': 0, 'accounts': 0, 'errors': 0}
+    chunk = []
+
+    def flush():
+        customers, accounts = _import_chunk(chunk)
+        totals['customers'] += customers
+        totals['accounts'] += accounts
+        chunk.clear()
+        return dict(totals, event='progress')
+
+    try:
+        for line_number, row in rows:
+            totals['rows'] += 1
+            if isinstance(row, RowError):
+                totals['errors'] += 1
+                yield {'event': 'error', 'line': line_number, 'error': str(row)}
+                continue
+            chunk.append(row)
+            if len(chunk) == chunk_size:
+                yield flush()
+    except RowError as e:
+        # The input as a whole is unusable, e.g. a CSV without a header.
+        totals['errors'] += 1
+        yield {'event': 'error', 'line': 1, 'error': str(e)}
+    if chunk:
+        yield flush()
+    yield dict(totals, event='done')
@@ -0,0 +1,80 @@
+import base64
+import json
+from datetime import datetime
+from operator import attrgetter
+
+from django.db import connections
+from django.db.models import Q
+
+from .history import HISTORY_ORDERING, union_all
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def encode_cursor(timestamp, pk):
+    raw = '{}|{}'.format(timestamp.isoformat(), pk)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        timestamp, pk = raw.split('|')
+        return datetime.fromisoformat(timestamp), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        raise InvalidCursor
+
+
+def encode_key_cursor(*values):
+    """A cursor for keyset pages ordered by anything other than ``(timestamp, id)``."""
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+
+def decode_key_cursor(cursor, *types):
+    """The values of ``encode_key_cursor``, which must be of ``types``."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode())
+    except (ValueError, UnicodeDecodeError):
+        raise InvalidCursor
+    if not isinstance(values, list) or len(values) != len(types) or not all(
+            type(value) is type_ for value, type_ in zip(values, types)):
+        raise InvalidCursor
+    return values
+
+
+def parse_page_size(limit):
+    if limit is None:
+        return DEFAULT_PAGE_SIZE
+    limit = int(limit)
+    if limit <= 0:
+        raise ValueError('limit must be positive')
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def keyset_page(branches, cursor, limit, key=attrgetter('timestamp', 'pk')):
+    """
+    Return one page of the union of ``branches`` ordered by ``(timestamp, id)`` and the next page's cursor.
+
+    The position is carried in the cursor instead of an offset, so every page is a range scan that
+    starts where the previous one ended, and rows inserted in the meantime don't shift the pages.
+    Where the backend allows it each branch is limited on its own before the union. ``key`` extracts
+    the ``(timestamp, id)`` pair from a fetched row.
+    """
+    if cursor:
+        timestamp, pk = decode_cursor(cursor)
+        after = Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, id__gt=pk)
+        branches = [branch.filter(after) for branch in branches]
+    if connections[branches[0].db].features.supports_slicing_ordering_in_compound:
+        branches = [branch.order_by(*HISTORY_ORDERING)[:limit + 1] for branch in branches]
+
+    page = list(union_all(branches)[:limit + 1])
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = encode_cursor(*key(page[-1]))
+    return page, next_cursor
@@ -1,8 +1,74 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
 from rest_framework.permissions import BasePermission
 
+from .asyncdb import database_sync_to_async
+from .authentication import AccessToken, revoke_user_tokens
+from .metrics import timed
+
+EMPLOYEE_GROUP = 'employee'
+
+
+def _cache():
+    return caches[getattr(settings, 'EMPLOYEE_CACHE_ALIAS', 'default')]
+
+
+def _cache_key(user_id):
+    return 'is_employee:{}'.format(user_id)
+
+
+def is_employee(user):
+    """
+    Whether ``user`` is in the employee group, cached per user for ``EMPLOYEE_CACHE_TIMEOUT`` seconds.
+
+    Membership changes invalidate the entry through the signal handlers in ``app.signals``; the timeout
+    only bounds staleness for processes that don't share the cache backend with the one making the change.
+    """
+    key = _cache_key(user.pk)
+    member = _cache().get(key)
+    if member is None:
+        member = user.groups.filter(name=EMPLOYEE_GROUP).exists()
+        _cache().set(key, member, getattr(settings, 'EMPLOYEE_CACHE_TIMEOUT', 60))
+    return member
+
+
+async def ais_employee(user):
+    """
+    Async ``is_employee``. A hit in a local memory cache is answered on the event loop; any other backend
+    does network I/O, so the lookup runs on a worker thread together with the query a miss needs.
+    """
+    cache = _cache()
+    member = cache.get(_cache_key(user.pk)) if isinstance(cache, LocMemCache) else None
+    if member is None:
+        member = await database_sync_to_async(is_employee)(user)
+    return member
+
+
+def invalidate_employee_cache(user_ids):
+    """The employee membership of ``user_ids`` changed: drop it from the cache and revoke the tokens claiming it."""
+    user_ids = list(user_ids)
+    _cache().delete_many([_cache_key(user_id) for user_id in user_ids])
+    revoke_user_tokens(user_ids)
+
 
 class IsEmployee(BasePermission):
 
     def has_permission(self, request, view):
+        with timed('permission'):
+            # Bearer tokens carry the claim; it is checked when they are verified and revoked when it changes.
+            if isinstance(request.auth, AccessToken):
+                return request.auth.employee
+            return request.user.is_authenticated and is_employee(request.user)
 
-        return request.user.is_authenticated and request.user.groups.filter(name='employee').exists()
+    async def has_permission_async(self, request):
+        """
+        For plain async Django views, where ``request.user`` is the lazy user set by the auth middleware, or
+        the token user with ``request.auth`` set by ``async_views``.
+        """
+        with timed('permission'):
+            if isinstance(getattr(request, 'auth', None), AccessToken):
+                return request.auth.employee
+            # Evaluating the lazy user reads the session and the user row, so it happens off the event loop.
+            is_authenticated = await database_sync_to_async(lambda: request.user.is_authenticated)()
+            return is_authenticated and await ais_employee(request.user)
@@ -0,0 +1,96 @@
+import json
+import multiprocessing
+import os
+
+from django.db import connection, connections, transaction
+from django.db.models import Max, Min, Sum
+
+from .archive import transfer_models
+from .models import Account
+from .shards import total_balance
+
+RANGE_SIZE = 10000
+
+
+def account_ranges(range_size=RANGE_SIZE):
+    """``[start, end)`` id ranges of ``range_size`` ids covering the accounts that exist now."""
+    bounds = Account.objects.aggregate(first=Min('pk'), last=Max('pk'))
+    if bounds['first'] is None:
+        return []
+    return [(start, min(start + range_size, bounds['last'] + 1))
+            for start in range(bounds['first'], bounds['last'] + 1, range_size)]
+
+
+def _sums(model, column, start, end):
+    # Served by the (account, timestamp) indexes of the transfer and archive tables.
+    return (model.objects.filter(**{column + '__gte': start, column + '__lt': end}).order_by()
+            .values_list(column).annotate(Sum('amount')))
+
+
+def reconcile_range(start, end):
+    """
+    ``(account_id, expected, actual)`` for every account with an id in ``[start, end)`` that doesn't reconcile.
+
+    The expected balance is the opening balance plus the transfers received minus the transfers sent,
+    archived ones included; the actual balance includes the shards. The database sums the transfers per
+    account, and everything is read in one transaction, so transfers committed meanwhile aren't reported.
+    """
+    with transaction.atomic():
+        # SQLite's read transactions already see a single snapshot.
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY')
+        accounts = Account.objects.filter(pk__gte=start, pk__lt=end)
+        expected = dict(accounts.values_list('pk', 'opening_balance'))
+        actual = list(accounts.annotate(total=total_balance()).values_list('pk', 'total'))
+        for model in transfer_models():
+            # Archived transfers may outlive their accounts.
+            for account_id, amount in _sums(model, 'receiver_account_id', start, end):
+                if account_id in expected:
+                    expected[account_id] += amount
+            for account_id, amount in _sums(model, 'sender_account_id', start, end):
+                if account_id in expected:
+                    expected[account_id] -= amount
+    return [(pk, expected[pk], total) for pk, total in actual if expected[pk] != total]
+
+
+def _close_connections():
+    for conn in connections.all():
+        conn.close()
+
+
+def _reconcile(bounds):
+    return bounds, reconcile_range(*bounds)
+
+
+def reconcile(ranges, workers=1):
+    """
+    Reconcile ``ranges`` with ``workers`` processes; yields ``(range, discrepancies)`` as ranges complete.
+
+    The ranges are independent, so a pool of forked workers checks them in parallel, each on its own
+    database connection.
+    """
+    if workers <= 1:
+        for bounds in ranges:
+            yield _reconcile(bounds)
+        return
+    # The workers must not share the parent's connections.
+    _close_connections()
+    with multiprocessing.get_context('fork').Pool(workers) as pool:
+        yield from pool.imap_unordered(_reconcile, ranges)
+
+
+def load_checkpoint(path):
+    """The checkpoint saved at ``path``, or ``None`` if there isn't one."""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def save_checkpoint(path, checkpoint):
+    """Replace the checkpoint at ``path`` atomically, so an interrupted run never leaves half a file behind."""
+    with open(path + '.tmp', 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(path + '.tmp', path)
@@ -0,0 +1,141 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+
+from .archive import transfer_models
+from .models import DailyRollup, Transfer
+from .snapshots import day_end
+
+CHUNK_SIZE = 500
+
+
+def _deltas(transfers):
+    """``{(account_id, day): (amount_in, amount_out, count_in, count_out)}`` for ``transfers``."""
+    deltas = defaultdict(lambda: [0, 0, 0, 0])
+    for transfer in transfers:
+        day = transfer.timestamp.date()
+        received = deltas[transfer.receiver_account_id, day]
+        received[0] += transfer.amount
+        received[2] += 1
+        sent = deltas[transfer.sender_account_id, day]
+        sent[1] += transfer.amount
+        sent[3] += 1
+    return deltas
+
+
+def _add(account_id, day, amount_in, amount_out, count_in, count_out):
+    return DailyRollup.objects.filter(account_id=account_id, day=day).update(
+        amount_in=F('amount_in') + amount_in, amount_out=F('amount_out') + amount_out,
+        count_in=F('count_in') + count_in, count_out=F('count_out') + count_out)
+
+
+def record_transfers(transfers):
+    """
+    Add ``transfers`` to the daily rollups of their accounts, in the transaction that marks them rolled up.
+
+    Every row is changed with a single-statement ``F()`` update, in ascending ``(account, day)`` order, so
+    concurrent transfers add up instead of overwriting each other. The first transfer of an account on a
+    day creates its row, ignoring the conflict if a concurrent transfer created it first.
+    """
+    deltas = _deltas(transfers)
+    missing = [key for key in sorted(deltas) if not _add(*key, *deltas[key])]
+    if missing:
+        DailyRollup.objects.bulk_create([DailyRollup(account_id=account_id, day=day) for account_id, day in missing],
+                                        batch_size=CHUNK_SIZE, ignore_conflicts=True)
+        for key in missing:
+            _add(*key, *deltas[key])
+
+
+def roll_up_transfers(batch_size=CHUNK_SIZE):
+    """
+    Add the transfers that aren't rolled up yet to the daily rollups, oldest first; returns how many.
+
+    Run periodically by the ``roll_up_transfers`` command, which keeps the rollup updates out of the transfer
+    requests and pays for one transaction per batch. Each batch takes the write lock before reading the
+    pending transfers, so concurrent callers take turns and every transfer is added once; a caller that
+    finds nothing pending doesn't write at all.
+    """
+    # transfers records into the rollups, so it can't be imported at module level.
+    from .transfers import lock_for_update
+
+    pending = Transfer.objects.filter(rolled_up=False)
+    total = 0
+    while pending.exists():
+        with transaction.atomic():
+            lock_for_update()
+            transfers = list(pending.select_for_update().order_by('pk')[:batch_size])
+            record_transfers(transfers)
+            Transfer.objects.filter(pk__in=[transfer.pk for transfer in transfers]).update(rolled_up=True)
+        total += len(transfers)
+        if len(transfers) < batch_size:
+            break
+    return total
+
+
+def rebuild_day(day):
+    """
+    Replace the rollups of ``day`` with totals recomputed from its transfers; returns the rows written.
+
+    For backfills and repairs, e.g. after transfers were loaded without going through the transfer engine.
+    Archived transfers are counted too.
+    """
+    # transfers records into the rollups, so it can't be imported at module level.
+    from .transfers import lock_for_update
+
+    start, end = day_end(day - timedelta(days=1)), day_end(day)
+    with transaction.atomic():
+        lock_for_update()
+        DailyRollup.objects.filter(day=day).delete()
+        Transfer.objects.filter(timestamp__gte=start, timestamp__lt=end, rolled_up=False).update(rolled_up=True)
+        rollups = {}
+        for model in transfer_models(start, end):
+            transfers = model.objects.filter(timestamp__gte=start, timestamp__lt=end).order_by()
+            for account_id, amount, count in transfers.values_list('receiver_account_id').annotate(Sum('amount'),
+                                                                                                   Count('pk')):
+                rollup = rollups.setdefault(account_id, DailyRollup(account_id=account_id, day=day))
+                rollup.amount_in += amount
+                rollup.count_in += count
+            for account_id, amount, count in transfers.values_list('sender_account_id').annotate(Sum('amount'),
+                                                                                                 Count('pk')):
+                rollup = rollups.setdefault(account_id, DailyRollup(account_id=account_id, day=day))
+                rollup.amount_out += amount
+                rollup.count_out += count
+        DailyRollup.objects.bulk_create(rollups.values(), batch_size=CHUNK_SIZE)
+    return len(rollups)
+
+
+def daily_totals(account_id, start_date=None, end_date=None):
+    """
+    Per-day and total money in and out of ``account_id`` between the two days, both inclusive.
+
+    Reads one rollup row per day with transfers, however many transfers there were, and adds in the
+    account's transfers that haven't been rolled up yet, found through the partial indexes on the pending
+    transfers, so that costs as many rows as are pending rather than the account's whole history. Both are
+    read in one transaction, so a concurrent ``roll_up_transfers`` can't make a transfer count twice or not
+    at all.
+    """
+    rollups = DailyRollup.objects.filter(account_id=account_id)
+    # rolled_up is repeated in both branches, which is what lets SQLite use the partial indexes; without it,
+    # or with a timestamp range, it picks the (account, timestamp) indexes. The days are filtered below.
+    pending = Transfer.objects.filter(Q(sender_account_id=account_id, rolled_up=False) |
+                                      Q(receiver_account_id=account_id, rolled_up=False))
+    if start_date:
+        rollups = rollups.filter(day__gte=start_date)
+    if end_date:
+        rollups = rollups.filter(day__lte=end_date)
+    fields = ('amount_in', 'amount_out', 'count_in', 'count_out')
+    with transaction.atomic(using=rollups.db):
+        days = {row[0]: dict(zip(('day',) + fields, row))
+                for row in rollups.order_by().values_list('day', *fields)}
+        deltas = _deltas(pending.using(rollups.db).only('sender_account_id', 'receiver_account_id', 'amount',
+                                                         'timestamp'))
+    for (delta_account_id, day), delta in deltas.items():
+        if delta_account_id == account_id and (start_date or day) <= day <= (end_date or day):
+            row = days.setdefault(day, {'day': day, **dict.fromkeys(fields, 0)})
+            for field, value in zip(fields, delta):
+                row[field] += value
+    days = sorted(days.values(), key=lambda row: row['day'])
+    totals = {field: sum(day[field] for day in days) for field in fields}
+    return totals, days
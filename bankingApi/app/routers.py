@@ -0,0 +1,74 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+HEADER = 'X-Read-From'
+
+_reads = ContextVar('replica_reads', default=None)
+
+
+class _ReadState:
+    __slots__ = ('replica',)
+
+    def __init__(self, replica):
+        self.replica = replica
+
+
+def replica_alias():
+    """The alias reads may be sent to, or ``None`` when no replica is configured or replica reads are off."""
+    alias = getattr(settings, 'REPLICA_DATABASE_ALIAS', 'replica')
+    if getattr(settings, 'REPLICA_READS', False) and alias in settings.DATABASES:
+        return alias
+    return None
+
+
+@contextmanager
+def reads_from_replica(request):
+    """
+    Send the ORM reads made inside the block to the read replica.
+
+    ``request`` can insist on the primary, e.g. to read its own writes, with ``X-Read-From: primary``, and
+    once anything has been written inside the block the remaining reads stick to the primary. The state is
+    a context variable, so ORM calls an async view makes on worker threads follow it too.
+    """
+    token = _reads.set(_ReadState(replica=request.headers.get(HEADER, '').lower() != 'primary'))
+    try:
+        yield
+    finally:
+        _reads.reset(token)
+
+
+def replica_reads(view):
+    """Run ``view`` inside ``reads_from_replica``; permission checks have run by then and used the primary."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        with reads_from_replica(request):
+            return view(request, *args, **kwargs)
+
+    return wrapper
+
+
+class PrimaryReplicaRouter:
+    """Send the reads of ``replica_reads`` views to the replica and everything else to the primary."""
+
+    def db_for_read(self, model, **hints):
+        state = _reads.get()
+        if state is not None and state.replica:
+            return replica_alias()
+        return None
+
+    def db_for_write(self, model, **hints):
+        state = _reads.get()
+        if state is not None:
+            state.replica = False
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same rows as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return True
@@ -0,0 +1,50 @@
+from django.db.models import Exists, OuterRef, Q
+
+from .models import Customer, CustomerNameToken
+from .names import name_tokens, normalize_name
+
+# Sorts after every character, so [prefix, prefix + END) holds exactly the strings starting with prefix.
+END = '\U0010ffff'
+
+
+def index_name_tokens(customers):
+    """Replace the name tokens of the saved ``customers``; for inserts that bypass ``save``, e.g. ``bulk_create``."""
+    CustomerNameToken.objects.filter(customer_id__in=[customer.pk for customer in customers]).delete()
+    CustomerNameToken.objects.bulk_create([CustomerNameToken(customer_id=customer.pk, token=token)
+                                           for customer in customers for token in name_tokens(customer.name)],
+                                          batch_size=500)
+
+
+def customers_by_prefix(query, after=None):
+    """
+    ``(id, name, search_name)`` of the customers whose normalized name starts with ``query``, by name and id.
+
+    A range on the ``(search_name, id)`` index rather than ``LIKE``, which SQLite compares case-insensitively
+    and so can't serve from the index. ``after`` is the ``(search_name, id)`` of the last row of the previous
+    page; the page then starts right there in the index.
+    """
+    prefix = normalize_name(query)
+    customers = Customer.objects.filter(search_name__gte=prefix, search_name__lt=prefix + END)
+    if after:
+        search_name, pk = after
+        customers = customers.filter(Q(search_name__gt=search_name) | Q(pk__gt=pk), search_name__gte=search_name)
+    return customers.order_by('search_name', 'pk').values_list('pk', 'name', 'search_name')
+
+
+def customers_by_words(query, after=None):
+    """
+    ``(id, name)`` of the customers with every word of ``query`` somewhere in their name, by id.
+
+    The longest word drives a scan of the ``(token, customer)`` index, which is in customer order; the other
+    words are one index probe per candidate. ``after`` is the last id of the previous page.
+    """
+    words = sorted(name_tokens(query), key=len, reverse=True)
+    if not words:
+        return CustomerNameToken.objects.none().values_list('customer_id', 'customer__name')
+    tokens = CustomerNameToken.objects.filter(token=words[0])
+    for word in words[1:]:
+        other = CustomerNameToken.objects.filter(token=word, customer_id=OuterRef('customer_id'))
+        tokens = tokens.filter(Exists(other))
+    if after:
+        tokens = tokens.filter(customer_id__gt=after)
+    return tokens.order_by('customer_id').values_list('customer_id', 'customer__name')
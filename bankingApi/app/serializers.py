@@ -1,8 +1,26 @@
-from decimal import Decimal
-
 from rest_framework import serializers
+from rest_framework.settings import api_settings
+
+from .metrics import timed
+from .models import Employee, Customer, Account, Transfer, QueuedTransfer
+from .money import from_minor, to_minor
+
+
+class MoneyField(serializers.DecimalField):
+    """A ``DecimalField`` for amounts stored in minor units; clients keep sending and seeing decimals."""
 
-from .models import Employee, Customer, Account, Transfer
+    def __init__(self, max_digits, **kwargs):
+        super().__init__(max_digits=max_digits, decimal_places=2, **kwargs)
+
+    def to_internal_value(self, data):
+        return to_minor(super().to_internal_value(data))
+
+    def to_representation(self, value):
+        # from_minor already has two places; no quantize needed.
+        amount = from_minor(value)
+        if getattr(self, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING):
+            return str(amount)
+        return amount
 
 
 class EmployeeSerializer(serializers.ModelSerializer):
@@ -19,22 +37,80 @@ class CustomerSerializer(serializers.ModelSerializer):
 
 class AccountSerializer(serializers.ModelSerializer):
     customer_name = serializers.ReadOnlyField(source='customer.name')
+    balance = MoneyField(max_digits=12, read_only=True)
 
     class Meta:
         model = Account
         fields = '__all__'
 
 
+class PortfolioAccountSerializer(serializers.ModelSerializer):
+    """An account of ``CustomerPortfolioSerializer``; reads the annotations the portfolio view adds."""
+    balance = MoneyField(max_digits=12, source='total_balance', coerce_to_string=False, read_only=True)
+    last_transfer_at = serializers.DateTimeField(read_only=True)
+
+    class Meta:
+        model = Account
+        fields = ('id', 'balance', 'created_at', 'last_transfer_at')
+
+
+class CustomerPortfolioSerializer(serializers.ModelSerializer):
+    accounts = PortfolioAccountSerializer(source='portfolio_accounts', many=True, read_only=True)
+
+    class Meta:
+        model = Customer
+        fields = ('id', 'name', 'accounts')
+
+
 class TransferSerializer(serializers.ModelSerializer):
-    source_account_customer_name = serializers.ReadOnlyField(source='source_account.customer.name')
-    destination_account_customer_name = serializers.ReadOnlyField(source='destination_account.customer.name')
-    amount = serializers.DecimalField(max_digits=10, decimal_places=2)
+    sender_account_customer_name = serializers.ReadOnlyField(source='sender_account.customer.name')
+    receiver_account_customer_name = serializers.ReadOnlyField(source='receiver_account.customer.name')
+    amount = MoneyField(max_digits=10, coerce_to_string=False)
 
     class Meta:
         model = Transfer
+        exclude = ('rolled_up',)
+
+
+class QueuedTransferSerializer(serializers.ModelSerializer):
+    amount = MoneyField(max_digits=10, coerce_to_string=False)
+    transfer = TransferSerializer(read_only=True)
+
+    class Meta:
+        model = QueuedTransfer
         fields = '__all__'
 
-    def to_representation(self, instance):
-        ret = super().to_representation(instance)
-        ret['amount'] = round(Decimal(ret['amount']), 2)
-        return ret
+
+TRANSFER_ROW_FIELDS = ('id', 'sender_account__customer__name', 'receiver_account__customer__name', 'amount',
+                       'timestamp', 'sender_account_id', 'receiver_account_id')
+
+_timestamp_field = serializers.DateTimeField()
+
+
+def transfer_rows(rows):
+    """
+    Render ``values_list(*TRANSFER_ROW_FIELDS)`` rows the way ``TransferSerializer`` renders transfers.
+
+    For read-only list endpoints: the customer names come joined into the same query and no serializer
+    field is bound or run per row.
+    """
+    to_timestamp = _timestamp_field.to_representation
+    with timed('serialize'):
+        return [
+            {
+                'id': pk,
+                'sender_account_customer_name': sender_name,
+                'receiver_account_customer_name': receiver_name,
+                'amount': from_minor(amount),
+                'timestamp': to_timestamp(timestamp),
+                'sender_account': sender_account_id,
+                'receiver_account': receiver_account_id,
+            }
+            for pk, sender_name, receiver_name, amount, timestamp, sender_account_id, receiver_account_id in rows
+        ]
+
+
+def serialized(serializer):
+    """``serializer.data``, timed as the serialization phase of the current request."""
+    with timed('serialize'):
+        return serializer.data
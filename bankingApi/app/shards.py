@@ -0,0 +1,90 @@
+import random
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import BigIntegerField, Case, F, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+from .models import Account, BalanceShard
+from .versions import bump
+
+MAX_SHARDS = 64
+
+
+def sharding_enabled():
+    return getattr(settings, 'BALANCE_SHARDS', False)
+
+
+def total_balance():
+    """
+    An ``Account`` expression for the whole balance: the account row plus its shards.
+
+    The shard sum is only evaluated for sharded accounts.
+    """
+    shard_sum = (BalanceShard.objects.filter(account_id=OuterRef('pk')).order_by().values('account_id')
+                 .annotate(total=Sum('balance')).values('total'))
+    output_field = BigIntegerField()
+    return Case(
+        When(shards=0, then=F('balance')),
+        default=F('balance') + Coalesce(Subquery(shard_sum), Value(0), output_field=output_field),
+        output_field=output_field,
+    )
+
+
+def credit_shard(account_id, shards, amount):
+    """
+    Add ``amount`` to one of the ``shards`` shards of ``account_id``, chosen at random.
+
+    Concurrent credits to a sharded account mostly update different rows and so don't queue on one row
+    lock. Returns the number of rows updated: 0 if the shard is gone, e.g. because ``set_shard_count``
+    removed it after the count was read.
+    """
+    return BalanceShard.objects.filter(account_id=account_id, shard=random.randrange(shards)).update(
+        balance=F('balance') + amount, **bump())
+
+
+def fold_shards(account_id):
+    """
+    Move the shard balances of ``account_id`` into the account row; returns the amount moved.
+
+    Debits call this when the account row alone can't cover them, and ``compact_balance_shards`` runs it
+    in the background. The total balance doesn't change, but the account row's version is bumped.
+    """
+    with transaction.atomic():
+        shards = list(BalanceShard.objects.select_for_update().filter(account_id=account_id)
+                      .exclude(balance=0).values_list('pk', 'balance'))
+        for pk, balance in shards:
+            BalanceShard.objects.filter(pk=pk).update(balance=F('balance') - balance)
+        moved = sum(balance for _, balance in shards)
+        if moved:
+            Account.objects.filter(pk=account_id).update(balance=F('balance') + moved, **bump())
+    return moved
+
+
+def set_shard_count(account_id, shards):
+    """
+    Spread future credits to ``account_id`` over ``shards`` shard rows; 0 turns sharding off.
+
+    Shards beyond the new count are folded into the account row and deleted. Only 0 is accepted unless
+    ``BALANCE_SHARDS`` is on.
+    """
+    if not 0 <= shards <= MAX_SHARDS:
+        raise ValueError('The shard count must be between 0 and {}'.format(MAX_SHARDS))
+    if shards and not sharding_enabled():
+        raise ValueError('Balance sharding is off; set BALANCE_SHARDS to turn it on')
+    # balances builds on this module.
+    from .balances import write_through
+
+    with transaction.atomic():
+        account = Account.objects.select_for_update().get(pk=account_id)
+        BalanceShard.objects.bulk_create(
+            [BalanceShard(account_id=account_id, shard=shard) for shard in range(shards)], ignore_conflicts=True)
+        Account.objects.filter(pk=account_id).update(shards=shards, **bump())
+        if shards < account.shards:
+            fold_shards(account_id)
+            removed = BalanceShard.objects.filter(account_id=account_id, shard__gte=shards)
+            # The account's version includes its shards'; keep it from going back.
+            Account.objects.filter(pk=account_id).update(
+                version=F('version') + removed.aggregate(total=Coalesce(Sum('version'), 0))['total'])
+            removed.delete()
+        write_through([account_id])
@@ -0,0 +1,77 @@
+from django.conf import settings
+from django.contrib.auth.models import Group, User
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .authentication import revoke_user_tokens
+from .models import Customer
+from .permissions import invalidate_employee_cache
+from .search import index_name_tokens
+
+UserGroups = User.groups.through
+
+
+@receiver(m2m_changed, sender=UserGroups)
+def user_groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        # Group side (group.user_set.add/remove/clear): pk_set holds user ids, or None on clear.
+        if action == 'pre_clear':
+            instance._cleared_user_ids = list(instance.user_set.values_list('pk', flat=True))
+        elif action == 'post_clear':
+            invalidate_employee_cache(getattr(instance, '_cleared_user_ids', []))
+        elif action in ('post_add', 'post_remove'):
+            invalidate_employee_cache(pk_set)
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_employee_cache([instance.pk])
+
+
+@receiver(post_delete, sender=UserGroups)
+def user_group_deleted(sender, instance, **kwargs):
+    invalidate_employee_cache([instance.user_id])
+
+
+@receiver(pre_delete, sender=Group)
+def group_deleting(sender, instance, **kwargs):
+    instance._deleted_user_ids = list(instance.user_set.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Group)
+def group_deleted(sender, instance, **kwargs):
+    invalidate_employee_cache(getattr(instance, '_deleted_user_ids', []))
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    invalidate_employee_cache([instance.pk])
+
+
+@receiver(pre_save, sender=User)
+def user_saving(sender, instance, update_fields=None, **kwargs):
+    instance._saved_credentials = None
+    if instance.pk is None or (update_fields is not None and not {'is_active', 'password'} & set(update_fields)):
+        return
+    instance._saved_credentials = User.objects.filter(pk=instance.pk).values_list('is_active', 'password').first()
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, **kwargs):
+    # Bearer tokens don't read the user row, so deactivation and password changes have to revoke them.
+    saved = instance._saved_credentials
+    if saved is not None and saved != (instance.is_active, instance.password):
+        revoke_user_tokens([instance.pk])
+
+
+@receiver(post_save, sender=Customer)
+def customer_saved(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or 'name' in update_fields:
+        index_name_tokens([instance])
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    """Apply ``SQLITE_PRAGMAS`` to each new SQLite connection, bypassing execute wrappers."""
+    if connection.vendor != 'sqlite':
+        return
+    for name, value in getattr(settings, 'SQLITE_PRAGMAS', {}).items():
+        connection.connection.execute('PRAGMA {} = {}'.format(name, value))
@@ -0,0 +1,132 @@
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import BigIntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .archive import transfer_models
+from .models import Account, BalanceSnapshot
+from .shards import total_balance
+
+CHUNK_SIZE = 1000
+
+
+def day_end(day):
+    """First instant after ``day``; transfers stamped before it count towards that day's closing balance."""
+    return datetime.combine(day + timedelta(days=1), time.min)
+
+
+def _sum_after(field, cutoff):
+    total = None
+    for model in transfer_models(start=cutoff):
+        amounts = (model.objects.filter(**{field: OuterRef('pk')}, timestamp__gte=cutoff)
+                   .order_by().values(field).annotate(total=Sum('amount')).values('total'))
+        amount = Coalesce(Subquery(amounts), Value(0), output_field=BigIntegerField())
+        total = amount if total is None else total + amount
+    return total
+
+
+def balances_at(accounts, day):
+    """
+    Closing balances of ``accounts`` on ``day``, derived from their current balances.
+
+    Each balance is worked out in one statement, so it is consistent with concurrent transfers even under
+    READ COMMITTED, but the cost grows with the number of transfers since ``day``. Only used to seed the
+    first snapshot of an account.
+    """
+    cutoff = day_end(day)
+    return accounts.annotate(
+        closing=total_balance() - _sum_after('receiver_account', cutoff) + _sum_after('sender_account', cutoff),
+    ).values_list('id', 'closing')
+
+
+def _net(account_id, start, end):
+    net = 0
+    for model in transfer_models(start, end):
+        transfers = model.objects.filter(timestamp__gte=start, timestamp__lt=end)
+        net += transfers.filter(receiver_account_id=account_id).aggregate(total=Sum('amount'))['total'] or 0
+        net -= transfers.filter(sender_account_id=account_id).aggregate(total=Sum('amount'))['total'] or 0
+    return net
+
+
+def balance_as_of(account_id, day):
+    """
+    Closing balance of ``account_id`` on ``day`` from the nearest snapshot plus the transfers in between.
+
+    Snapshots on or before ``day`` are preferred; before the first snapshot of the account the nearest
+    later one is walked backwards. Only if the account has no snapshot at all is the current balance used.
+    """
+    snapshots = BalanceSnapshot.objects.filter(account_id=account_id)
+    earlier = snapshots.filter(day__lte=day).order_by('-day').values_list('day', 'balance').first()
+    if earlier:
+        snapshot_day, balance = earlier
+        return balance + _net(account_id, day_end(snapshot_day), day_end(day))
+
+    later = snapshots.filter(day__gt=day).order_by('day').values_list('day', 'balance').first()
+    if later:
+        snapshot_day, balance = later
+        return balance - _net(account_id, day_end(day), day_end(snapshot_day))
+
+    return balances_at(Account.objects.filter(pk=account_id), day).get()[1]
+
+
+def _day_nets(day):
+    start, end = day_end(day - timedelta(days=1)), day_end(day)
+    nets = {}
+    for model in transfer_models(start, end):
+        transfers = model.objects.filter(timestamp__gte=start, timestamp__lt=end)
+        for account_id, total in transfers.order_by().values_list('receiver_account_id').annotate(Sum('amount')):
+            nets[account_id] = nets.get(account_id, 0) + total
+        for account_id, total in transfers.order_by().values_list('sender_account_id').annotate(Sum('amount')):
+            nets[account_id] = nets.get(account_id, 0) - total
+    return nets
+
+
+def _chunks(items):
+    items = list(items)
+    for start in range(0, len(items), CHUNK_SIZE):
+        yield items[start:start + CHUNK_SIZE]
+
+
+def snapshot_initial(day):
+    """Write a snapshot of every account that existed at the end of ``day``."""
+    accounts = Account.objects.filter(created_at__lt=day_end(day)).order_by('pk')
+    written = 0
+    with transaction.atomic():
+        for chunk in _chunks(accounts.values_list('pk', flat=True).iterator()):
+            BalanceSnapshot.objects.bulk_create(
+                [BalanceSnapshot(account_id=account_id, day=day, balance=balance)
+                 for account_id, balance in balances_at(Account.objects.filter(pk__in=chunk), day)],
+                ignore_conflicts=True)
+            written += len(chunk)
+    return written
+
+
+def snapshot_day(day):
+    """
+    Write snapshots for the accounts whose balance changed on ``day`` and the accounts opened on it.
+
+    Accounts that already have a snapshot start from their latest one, so the work is proportional to
+    the day's transfers; new accounts are seeded with ``balances_at``.
+    """
+    nets = _day_nets(day)
+    opened = set(Account.objects.filter(created_at__gte=day_end(day - timedelta(days=1)),
+                                        created_at__lt=day_end(day)).values_list('pk', flat=True))
+    written = 0
+    with transaction.atomic():
+        for chunk in _chunks(sorted(set(nets) | opened)):
+            latest_day = (BalanceSnapshot.objects.filter(account_id=OuterRef('account_id'), day__lt=day)
+                          .order_by('-day').values('day')[:1])
+            previous = dict(BalanceSnapshot.objects.filter(account_id__in=chunk, day=Subquery(latest_day))
+                            .values_list('account_id', 'balance'))
+            closing = {account_id: previous[account_id] + nets.get(account_id, 0)
+                       for account_id in chunk if account_id in previous}
+            missing = [account_id for account_id in chunk if account_id not in previous]
+            if missing:
+                closing.update(balances_at(Account.objects.filter(pk__in=missing), day))
+            BalanceSnapshot.objects.bulk_create(
+                [BalanceSnapshot(account_id=account_id, day=day, balance=balance)
+                 for account_id, balance in closing.items()],
+                ignore_conflicts=True)
+            written += len(closing)
+    return written
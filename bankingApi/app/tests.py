@@ -1,28 +1,91 @@
+import csv
+import itertools
+import json
+import os
+import random
+import threading
 from datetime import datetime, timedelta
+from io import StringIO
+from tempfile import NamedTemporaryFile, TemporaryDirectory
+from unittest import mock
 
+from asgiref.sync import async_to_sync
+from django.conf import settings
 from django.contrib.auth.models import User, Group
+from django.core.cache import cache
+from django.core.cache.backends.dummy import DummyCache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.db.models import F, Q, Sum
+from django.test import AsyncClient, Client, RequestFactory, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework.test import APIClient, APITestCase
 from rest_framework import status
 from decimal import Decimal
 
-from .models import Customer, Account, Transfer
-from .serializers import TransferSerializer
+from .balances import _cache_key, _store, balance_cache_stats, get_balance, reset_balance_cache_stats
+from .metrics import RequestTimings, render_prometheus, request_timings, reset_metrics, timed
+from .archive import archive_model, archive_transfers
+from .async_views import _denied
+from .authentication import check_revocation_cache, verify_token
+from .history import history_branches, union_all
+from .models import (Customer, Account, Transfer, IdempotencyKey, BalanceShard, BalanceSnapshot, DailyRollup,
+                     QueuedTransfer, TransferArchive)
+from .money import MAX_BALANCE, format_minor, from_minor, to_minor
+from .permissions import ais_employee
+from .reconciliation import account_ranges, save_checkpoint
+from .rollups import roll_up_transfers
+from .routers import replica_reads
+from .serializers import TRANSFER_ROW_FIELDS, TransferSerializer, transfer_rows
+from .transfers import _sqlite_writer, InsufficientBalance, execute_transfer, execute_transfer_batch
+from .versions import bump, total_version
 
 
-class BankingAPITests(APITestCase):
+class EmployeeTestMixin:
+    """
+    Empties the caches and signs ``self.client`` in as ``self.employee_user``, a member of the employee group.
+
+    Tests of authentication itself set ``sign_in`` to ``False`` and sign in their own way.
+    """
+    sign_in = True
+
     def setUp(self):
+        super().setUp()
+        cache.clear()
+        reset_balance_cache_stats()
         self.employee_group = Group.objects.create(name='employee')
         self.employee_user = User.objects.create_user(username='employeeuser', password='123456')
         self.employee_user.groups.add(self.employee_group)
+        self.client = self.client_class()
+        if self.sign_in:
+            self.login(self.client)
+
+    def login(self, client):
+        if isinstance(client, APIClient):
+            client.force_authenticate(user=self.employee_user)
+        else:
+            client.force_login(self.employee_user)
+
+
+class EmployeeAPITestCase(EmployeeTestMixin, APITestCase):
+    pass
+
+
+class EmployeeTransactionTestCase(EmployeeTestMixin, TransactionTestCase):
+    pass
+
+
+class BankingAPITests(EmployeeAPITestCase):
+    def setUp(self):
+        super().setUp()
         self.customer = Customer.objects.create(name='Sarah Johnson')
         self.customer2 = Customer.objects.create(name='Michael Garcia')
         self.customer3 = Customer.objects.create(name='Emily Rodriguez')
 
-        self.client = APIClient()
-
     def test_create_account(self):
-        self.client.force_authenticate(user=self.employee_user)
         url = reverse('create_account')
         data = {
             'customer_id': self.customer.id,
@@ -34,8 +97,27 @@ class BankingAPITests(APITestCase):
         self.assertEqual(response.data['customer'], self.customer.id)
         self.assertEqual(response.data['balance'], '500.00')
 
+    def test_create_account_with_negative_balance(self):
+        response = self.client.post(reverse('create_account'), {'customer_id': self.customer.id,
+                                                                'initial_balance': '-0.01'}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['error'], 'Invalid initial balance')
+        self.assertFalse(Account.objects.exists())
+
+    def test_create_account_with_balance_out_of_range(self):
+        url = reverse('create_account')
+        response = self.client.post(url, {'customer_id': self.customer.id,
+                                          'initial_balance': str(from_minor(MAX_BALANCE + 1))}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['error'], 'Initial balance out of range')
+        self.assertFalse(Account.objects.exists())
+        response = self.client.post(url, {'customer_id': self.customer.id,
+                                          'initial_balance': str(from_minor(MAX_BALANCE))}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
     def test_create_account_with_invalid_customer(self):
-        self.client.force_authenticate(user=self.employee_user)
         url = reverse('create_account')
         data = {
             'customer_id': 9999,
@@ -47,8 +129,7 @@ class BankingAPITests(APITestCase):
         self.assertEqual(response.data['error'], 'Customer with id 9999 does not exist')
 
     def test_transfer(self):
-        self.client.force_authenticate(user=self.employee_user)
-        sender_account = Account.objects.create(customer=self.customer, balance=10000)
+        sender_account = Account.objects.create(customer=self.customer, balance=1000000)
         receiver_account = Account.objects.create(customer=self.customer, balance=0)
 
         url = reverse('transfer')
@@ -63,15 +144,15 @@ class BankingAPITests(APITestCase):
         self.assertEqual(response.data['sender_account'], sender_account.id)
         self.assertEqual(response.data['receiver_account'], receiver_account.id)
         self.assertEqual(response.data['amount'], Decimal('5000.00'))
+        self.assertEqual(response.data['sender_account_customer_name'], 'Sarah Johnson')
 
         sender_account.refresh_from_db()
         receiver_account.refresh_from_db()
-        self.assertEqual(sender_account.balance, Decimal('5000.00'))
-        self.assertEqual(receiver_account.balance, Decimal('5000.00'))
+        self.assertEqual(sender_account.balance, 500000)
+        self.assertEqual(receiver_account.balance, 500000)
 
     def test_transfer_with_one_account(self):
-        self.client.force_authenticate(user=self.employee_user)
-        account = Account.objects.create(customer=self.customer, balance=1000)
+        account = Account.objects.create(customer=self.customer, balance=100000)
 
         url = reverse('transfer')
         data = {
@@ -85,11 +166,44 @@ class BankingAPITests(APITestCase):
         self.assertEqual(response.data['error'], 'Sender and receiver account cannot be the same')
 
         account.refresh_from_db()
-        self.assertEqual(account.balance, Decimal('1000.00'))
+        self.assertEqual(account.balance, 100000)
+
+    def test_transfer_with_malformed_or_unknown_account_ids(self):
+        account = Account.objects.create(customer=self.customer, balance=100000)
+        other = Account.objects.create(customer=self.customer, balance=0)
+        url = reverse('transfer')
+
+        def post(data, **headers):
+            return self.client.post(url, {'transfer_amount': 10, **data}, format='json', **headers)
+
+        for data in ({'receiver_account_id': other.id},
+                     {'sender_account_id': account.id},
+                     {'sender_account_id': 'abc', 'receiver_account_id': other.id},
+                     {'sender_account_id': account.id, 'receiver_account_id': 1.5},
+                     {'sender_account_id': True, 'receiver_account_id': other.id},
+                     {'sender_account_id': account.id, 'receiver_account_id': 2 ** 63}):
+            for headers in ({}, {'HTTP_PREFER': 'respond-async'}):
+                response = post(data, **headers)
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, (data, headers))
+                self.assertEqual(response.data['error'], 'Invalid transfer')
+        self.assertEqual(self.client.post(url, [account.id, other.id], format='json').status_code,
+                         status.HTTP_400_BAD_REQUEST)
+
+        response = post({'sender_account_id': '0{}'.format(account.id), 'receiver_account_id': account.id})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['error'], 'Sender and receiver account cannot be the same')
+
+        response = post({'sender_account_id': account.id, 'receiver_account_id': 9999})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(response.data['error'], 'Account with given id does not exist')
+
+        response = post({'sender_account_id': str(account.id), 'receiver_account_id': '0{}'.format(other.id)})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['receiver_account'], other.id)
+        self.assertFalse(QueuedTransfer.objects.exists())
 
     def test_transfer_with_invalid_amount(self):
-        self.client.force_authenticate(user=self.employee_user)
-        sender_account = Account.objects.create(customer=self.customer, balance=1000)
+        sender_account = Account.objects.create(customer=self.customer, balance=100000)
         receiver_account = Account.objects.create(customer=self.customer, balance=0)
 
         url = reverse('transfer')
@@ -105,12 +219,11 @@ class BankingAPITests(APITestCase):
 
         sender_account.refresh_from_db()
         receiver_account.refresh_from_db()
-        self.assertEqual(sender_account.balance, Decimal('1000.00'))
-        self.assertEqual(receiver_account.balance, Decimal('0.00'))
+        self.assertEqual(sender_account.balance, 100000)
+        self.assertEqual(receiver_account.balance, 0)
 
     def test_transfer_insufficient_balance(self):
-        self.client.force_authenticate(user=self.employee_user)
-        sender_account = Account.objects.create(customer=self.customer, balance=1000)
+        sender_account = Account.objects.create(customer=self.customer, balance=100000)
         receiver_account = Account.objects.create(customer=self.customer, balance=0)
 
         url = reverse('transfer')
@@ -126,12 +239,155 @@ class BankingAPITests(APITestCase):
 
         sender_account.refresh_from_db()
         receiver_account.refresh_from_db()
-        self.assertEqual(sender_account.balance, Decimal('1000.00'))
-        self.assertEqual(receiver_account.balance, Decimal('0.00'))
+        self.assertEqual(sender_account.balance, 100000)
+        self.assertEqual(receiver_account.balance, 0)
+
+    def test_transfer_idempotency_key_replays_response(self):
+        sender_account = Account.objects.create(customer=self.customer, balance=100000)
+        receiver_account = Account.objects.create(customer=self.customer2, balance=0)
+
+        url = reverse('transfer')
+        data = {
+            'sender_account_id': sender_account.id,
+            'receiver_account_id': receiver_account.id,
+            'transfer_amount': 400
+        }
+        first = self.client.post(url, data, format='json', HTTP_IDEMPOTENCY_KEY='retry-1')
+        with CaptureQueriesContext(connection) as queries:
+            retry = self.client.post(url, data, format='json', HTTP_IDEMPOTENCY_KEY='retry-1')
+
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.content, first.content)
+        self.assertFalse([query for query in queries if 'app_account' in query['sql']])
+        self.assertEqual(Transfer.objects.count(), 1)
+        sender_account.refresh_from_db()
+        self.assertEqual(sender_account.balance, 60000)
+
+    def test_transfer_idempotency_key_reused_for_different_request(self):
+        sender_account = Account.objects.create(customer=self.customer, balance=100000)
+        receiver_account = Account.objects.create(customer=self.customer2, balance=0)
+
+        url = reverse('transfer')
+        data = {
+            'sender_account_id': sender_account.id,
+            'receiver_account_id': receiver_account.id,
+            'transfer_amount': 400
+        }
+        self.client.post(url, data, format='json', HTTP_IDEMPOTENCY_KEY='retry-1')
+        data['transfer_amount'] = 500
+        response = self.client.post(url, data, format='json', HTTP_IDEMPOTENCY_KEY='retry-1')
+
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(Transfer.objects.count(), 1)
+
+    def test_purge_idempotency_keys(self):
+        IdempotencyKey.objects.create(user=self.employee_user, key='old', fingerprint='x',
+                                      created_at=timezone.now() - timedelta(days=2))
+        IdempotencyKey.objects.create(user=self.employee_user, key='new', fingerprint='x')
+
+        call_command('purge_idempotency_keys', stdout=StringIO())
+
+        self.assertEqual(list(IdempotencyKey.objects.values_list('key', flat=True)), ['new'])
+
+    def test_transfer_batch(self):
+        first = Account.objects.create(customer=self.customer, balance=100000)
+        second = Account.objects.create(customer=self.customer2, balance=0)
+        third = Account.objects.create(customer=self.customer3, balance=0)
+
+        url = reverse('transfer_batch')
+        data = {'transfers': [
+            {'sender_account_id': first.id, 'receiver_account_id': second.id, 'transfer_amount': 600},
+            {'sender_account_id': second.id, 'receiver_account_id': third.id, 'transfer_amount': 500},
+            {'sender_account_id': third.id, 'receiver_account_id': first.id, 'transfer_amount': '100.50'},
+        ]}
+        response = self.client.post(url, data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data['transfers']), 3)
+        self.assertEqual(Transfer.objects.count(), 3)
+        for account, balance in ((first, 50050), (second, 10000), (third, 39950)):
+            account.refresh_from_db()
+            self.assertEqual(account.balance, balance)
+
+    def test_transfer_batch_is_all_or_nothing(self):
+        sender_account = Account.objects.create(customer=self.customer, balance=100000)
+        receiver_account = Account.objects.create(customer=self.customer2, balance=0)
+
+        url = reverse('transfer_batch')
+        data = {'transfers': [
+            {'sender_account_id': sender_account.id, 'receiver_account_id': receiver_account.id,
+             'transfer_amount': 600},
+            {'sender_account_id': sender_account.id, 'receiver_account_id': receiver_account.id,
+             'transfer_amount': 600},
+        ]}
+        response = self.client.post(url, data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['errors'], [{'index': 1, 'error': 'Insufficient balance in sender account'}])
+        self.assertFalse(Transfer.objects.exists())
+        sender_account.refresh_from_db()
+        self.assertEqual(sender_account.balance, 100000)
+
+    def test_transfer_batch_per_item_results(self):
+        sender_account = Account.objects.create(customer=self.customer, balance=100000)
+        receiver_account = Account.objects.create(customer=self.customer2, balance=0)
+
+        url = reverse('transfer_batch')
+        data = {'atomic': False, 'transfers': [
+            {'sender_account_id': sender_account.id, 'receiver_account_id': receiver_account.id,
+             'transfer_amount': 0},
+            {'sender_account_id': sender_account.id, 'receiver_account_id': receiver_account.id,
+             'transfer_amount': 600},
+            {'sender_account_id': sender_account.id, 'receiver_account_id': 9999, 'transfer_amount': 10},
+            {'sender_account_id': sender_account.id, 'receiver_account_id': receiver_account.id,
+             'transfer_amount': 600},
+        ]}
+        response = self.client.post(url, data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.data['results']
+        self.assertEqual([result['status'] for result in results], ['rejected', 'created', 'rejected', 'rejected'])
+        self.assertEqual(results[0]['error'], 'Invalid amount')
+        self.assertEqual(results[2]['error'], 'Account with given id does not exist')
+        self.assertEqual(results[3]['error'], 'Insufficient balance in sender account')
+        self.assertEqual(results[1]['transfer']['amount'], Decimal('600.00'))
+        sender_account.refresh_from_db()
+        self.assertEqual(sender_account.balance, 40000)
+        self.assertEqual(Transfer.objects.count(), 1)
+
+    def test_transfer_batch_rejects_malformed_bodies(self):
+        url = reverse('transfer_batch')
+        transfers = [{'sender_account_id': 1, 'receiver_account_id': 2, 'transfer_amount': 1}]
+
+        for data, error in (([], 'Invalid batch'), ('transfers', 'Invalid batch'), (None, 'Invalid batch'),
+                            ({'atomic': 'no', 'transfers': transfers}, 'atomic must be true or false'),
+                            ({'atomic': 0, 'transfers': transfers}, 'atomic must be true or false'),
+                            ({'atomic': None, 'transfers': transfers}, 'atomic must be true or false')):
+            response = self.client.post(url, json.dumps(data), content_type='application/json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, data)
+            self.assertEqual(response.data['error'], error)
+        self.assertFalse(Transfer.objects.exists())
+
+    def test_transfer_batch_query_count_does_not_grow_with_batch_size(self):
+        accounts = [Account.objects.create(customer=self.customer, balance=10000000) for _ in range(4)]
+
+        url = reverse('transfer_batch')
+        data = {'transfers': [
+            {'sender_account_id': accounts[i % 4].id, 'receiver_account_id': accounts[(i + 1) % 4].id,
+             'transfer_amount': 10}
+            for i in range(200)
+        ]}
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Transfer.objects.count(), 200)
+        # The transfers cancel out, so every account still costs an update to bump its version.
+        self.assertLess(len(queries), 25)
 
     def test_get_balance(self):
-        self.client.force_authenticate(user=self.employee_user)
-        account = Account.objects.create(customer=self.customer, balance=12000)
+        account = Account.objects.create(customer=self.customer, balance=1200000)
 
         url = reverse('account_balance', kwargs={'account_id': account.id})
         response = self.client.get(url)
@@ -140,8 +396,6 @@ class BankingAPITests(APITestCase):
         self.assertEqual(response.data['balance'], Decimal('12000.00'))
 
     def test_get_balance_with_invalid_account(self):
-        self.client.force_authenticate(user=self.employee_user)
-
         url = reverse('account_balance', kwargs={'account_id': 9999})
         response = self.client.get(url)
 
@@ -149,16 +403,15 @@ class BankingAPITests(APITestCase):
         self.assertEqual(response.data['error'], 'Account with given id does not exist')
 
     def test_get_transfer_history(self):
-        self.client.force_authenticate(user=self.employee_user)
-        sender_account = Account.objects.create(customer=self.customer, balance=1000)
-        receiver_account = Account.objects.create(customer=self.customer2, balance=1000)
+        sender_account = Account.objects.create(customer=self.customer, balance=100000)
+        receiver_account = Account.objects.create(customer=self.customer2, balance=100000)
 
         Transfer.objects.create(sender_account=sender_account, receiver_account=receiver_account,
-                                amount=Decimal('100.00'))
+                                amount=10000)
         Transfer.objects.create(sender_account=sender_account, receiver_account=receiver_account,
-                                amount=Decimal('200.00'))
+                                amount=20000)
         Transfer.objects.create(sender_account=receiver_account, receiver_account=sender_account,
-                                amount=Decimal('50.00'))
+                                amount=5000)
 
         url = reverse('transfer_history', kwargs={'account_id': sender_account.id})
         response = self.client.get(url)
@@ -178,9 +431,34 @@ class BankingAPITests(APITestCase):
         self.assertEqual(response.data[2]['receiver_account'], sender_account.id)
         self.assertEqual(response.data[2]['amount'], Decimal('50.00'))
 
-    def test_get_transfer_history_with_invalid_account(self):
-        self.client.force_authenticate(user=self.employee_user)
+    def test_transfer_history_renders_customer_names_in_constant_queries(self):
+        sender_account = Account.objects.create(customer=self.customer, balance=100000)
+        receiver_account = Account.objects.create(customer=self.customer2, balance=100000)
+        for _ in range(10):
+            Transfer.objects.create(sender_account=sender_account, receiver_account=receiver_account,
+                                    amount=1000)
+
+        url = reverse('transfer_history', kwargs={'account_id': sender_account.id})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+
+        self.assertEqual(len(response.data), 10)
+        self.assertEqual(response.data[0]['sender_account_customer_name'], 'Sarah Johnson')
+        self.assertEqual(response.data[0]['receiver_account_customer_name'], 'Michael Garcia')
+        # Including the lookup of the archive tables covering the range and of the version for the ETag.
+        self.assertLessEqual(len(queries), 5)
+
+    def test_transfer_rows_match_transfer_serializer(self):
+        sender_account = Account.objects.create(customer=self.customer, balance=100000)
+        receiver_account = Account.objects.create(customer=self.customer2, balance=100000)
+        Transfer.objects.create(sender_account=sender_account, receiver_account=receiver_account,
+                                amount=1250)
 
+        rows = transfer_rows(Transfer.objects.values_list(*TRANSFER_ROW_FIELDS))
+
+        self.assertEqual(rows, TransferSerializer(Transfer.objects.all(), many=True).data)
+
+    def test_get_transfer_history_with_invalid_account(self):
         url = reverse('transfer_history', kwargs={'account_id': 9999})
         response = self.client.get(url)
 
@@ -188,19 +466,18 @@ class BankingAPITests(APITestCase):
         self.assertEqual(response.data['error'], 'Account with given id does not exist')
 
     def test_get_transfer_history_filter_by_date(self):
-        self.client.force_authenticate(user=self.employee_user)
         start_date = datetime.now().date() - timedelta(days=1)
         end_date = datetime.now().date() + timedelta(days=1)
 
-        sender_account = Account.objects.create(customer=self.customer, balance=1000)
-        receiver_account = Account.objects.create(customer=self.customer2, balance=1000)
+        sender_account = Account.objects.create(customer=self.customer, balance=100000)
+        receiver_account = Account.objects.create(customer=self.customer2, balance=100000)
 
         Transfer.objects.create(sender_account=sender_account, receiver_account=receiver_account,
-                                amount=Decimal('100.00'))
+                                amount=10000)
         Transfer.objects.create(sender_account=sender_account, receiver_account=receiver_account,
-                                amount=Decimal('200.00'))
+                                amount=20000)
         Transfer.objects.create(sender_account=receiver_account, receiver_account=sender_account,
-                                amount=Decimal('50.00'))
+                                amount=5000)
 
         url = reverse('transfer_history',
                       kwargs={'account_id': sender_account.id}) + '?start_date={}&end_date={}'.format(start_date,
@@ -214,16 +491,15 @@ class BankingAPITests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
     def test_transfer_history_filter_by_invalid_date(self):
-        self.client.force_authenticate(user=self.employee_user)
-        sender_account = Account.objects.create(customer=self.customer, balance=1000)
-        receiver_account = Account.objects.create(customer=self.customer2, balance=1000)
+        sender_account = Account.objects.create(customer=self.customer, balance=100000)
+        receiver_account = Account.objects.create(customer=self.customer2, balance=100000)
 
         Transfer.objects.create(sender_account=sender_account, receiver_account=receiver_account,
-                                amount=Decimal('100.00'))
+                                amount=10000)
         Transfer.objects.create(sender_account=sender_account, receiver_account=receiver_account,
-                                amount=Decimal('200.00'))
+                                amount=20000)
         Transfer.objects.create(sender_account=receiver_account, receiver_account=sender_account,
-                                amount=Decimal('50.00'))
+                                amount=5000)
         url = reverse('transfer_history',
                       kwargs={'account_id': sender_account.id}) + '?start_date=2021-01-01&end_date=2020-12-31'
 
@@ -231,3 +507,1371 @@ class BankingAPITests(APITestCase):
 
         self.assertEqual(response.data, [])
         self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class ConcurrentTransferTests(EmployeeTransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        customer = Customer.objects.create(name='Sarah Johnson')
+        self.accounts = [Account.objects.create(customer=customer, balance=100000) for _ in range(5)]
+
+    def test_concurrent_transfers_do_not_lose_updates(self):
+        account_ids = [account.id for account in self.accounts]
+        errors = []
+
+        def worker(seed):
+            rng = random.Random(seed)
+            try:
+                for _ in range(40):
+                    sender_id, receiver_id = rng.sample(account_ids, 2)
+                    try:
+                        execute_transfer(sender_id, receiver_id, rng.randint(1, 300) * 100)
+                    except InsufficientBalance:
+                        pass
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(Account.objects.aggregate(total=Sum('balance'))['total'], 500000)
+        for account in Account.objects.all():
+            incoming = Transfer.objects.filter(receiver_account=account).aggregate(total=Sum('amount'))['total'] or 0
+            outgoing = Transfer.objects.filter(sender_account=account).aggregate(total=Sum('amount'))['total'] or 0
+            self.assertGreaterEqual(account.balance, 0)
+            self.assertEqual(account.balance, 100000 + incoming - outgoing)
+
+        # Every transfer ends up in the rollups exactly once.
+        roll_up_transfers()
+        self.assertEqual(DailyRollup.objects.aggregate(total=Sum('count_out'))['total'], Transfer.objects.count())
+        self.assertEqual(DailyRollup.objects.aggregate(total=Sum('amount_in'))['total'],
+                         Transfer.objects.aggregate(total=Sum('amount'))['total'])
+
+    def test_concurrent_retries_with_one_idempotency_key_transfer_once(self):
+        sender, receiver = self.accounts[0], self.accounts[1]
+        responses = []
+
+        def worker():
+            client = APIClient()
+            self.login(client)
+            try:
+                responses.append(client.post(reverse('transfer'), {
+                    'sender_account_id': sender.id,
+                    'receiver_account_id': receiver.id,
+                    'transfer_amount': 100,
+                }, format='json', HTTP_IDEMPOTENCY_KEY='storm'))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual([response.status_code for response in responses], [status.HTTP_201_CREATED] * 6)
+        self.assertEqual(len({response.content for response in responses}), 1)
+        self.assertEqual(Transfer.objects.count(), 1)
+        sender.refresh_from_db()
+        self.assertEqual(sender.balance, 90000)
+
+    def test_concurrent_batches_wait_for_the_write_lock(self):
+        account_ids = [account.id for account in self.accounts]
+        errors = []
+
+        def worker(seed):
+            rng = random.Random(seed)
+            try:
+                for _ in range(20):
+                    execute_transfer_batch([tuple(rng.sample(account_ids, 2)) + (100,) for _ in range(3)])
+                    # Readers keep a snapshot open while the batches commit.
+                    list(Account.objects.values_list('balance', flat=True))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(Transfer.objects.count(), 8 * 20 * 3)
+        self.assertEqual(Account.objects.aggregate(total=Sum('balance'))['total'], 500000)
+
+    def test_sqlite_writers_of_one_process_take_turns_on_a_mutex(self):
+        sender, receiver = self.accounts[0], self.accounts[1]
+        acquired = threading.Event()
+
+        def worker():
+            try:
+                execute_transfer(sender.id, receiver.id, 100)
+                acquired.set()
+            finally:
+                connection.close()
+
+        with _sqlite_writer:
+            thread = threading.Thread(target=worker)
+            thread.start()
+            self.assertFalse(acquired.wait(0.2))
+            # A transfer inside an open transaction doesn't wait, that could deadlock on SQLite's own lock.
+            with transaction.atomic():
+                execute_transfer(receiver.id, sender.id, 50)
+        thread.join()
+
+        self.assertTrue(acquired.is_set())
+        self.assertEqual(Transfer.objects.count(), 2)
+
+    def test_sqlite_connections_are_tuned(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone()[0], 'wal')
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], settings.SQLITE_PRAGMAS['busy_timeout'])
+
+    def test_failed_debit_leaves_receiver_untouched(self):
+        sender, receiver = self.accounts[1], self.accounts[0]
+
+        with self.assertRaises(InsufficientBalance):
+            execute_transfer(sender.id, receiver.id, 150000)
+
+        receiver.refresh_from_db()
+        self.assertEqual(receiver.balance, 100000)
+        self.assertFalse(Transfer.objects.exists())
+
+
+class TransferHistoryPaginationTests(EmployeeAPITestCase):
+    def setUp(self):
+        super().setUp()
+        customer = Customer.objects.create(name='Sarah Johnson')
+        self.account = Account.objects.create(customer=customer, balance=100000)
+        other_account = Account.objects.create(customer=customer, balance=100000)
+        timestamp = datetime(2023, 1, 1, 12, 0)
+        for amount in range(1, 8):
+            # Pairs of transfers share a timestamp so the id tie-breaker is exercised.
+            Transfer.objects.create(sender_account=self.account, receiver_account=other_account,
+                                    amount=amount * 100, timestamp=timestamp + timedelta(minutes=amount // 2))
+        self.url = reverse('transfer_history', kwargs={'account_id': self.account.id})
+
+    def test_cursor_pagination_walks_every_transfer_once(self):
+        amounts = []
+        cursor = None
+        pages = 0
+        while True:
+            params = {'limit': 3}
+            if cursor:
+                params['cursor'] = cursor
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            amounts += [transfer['amount'] for transfer in response.data['results']]
+            pages += 1
+            cursor = response.data['next_cursor']
+            if cursor is None:
+                break
+
+        self.assertEqual(pages, 3)
+        self.assertEqual(amounts, [Decimal(amount) for amount in range(1, 8)])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.url, {'cursor': 'not-a-cursor'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['error'], 'Invalid cursor')
+
+    def test_stream_ndjson(self):
+        response = self.client.get(self.url, {'stream': 'ndjson'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row['amount'] for row in rows], ['{}.00'.format(amount) for amount in range(1, 8)])
+        self.assertEqual(rows[0]['sender_account'], self.account.id)
+
+    def test_stream_csv(self):
+        response = self.client.get(self.url, {'stream': 'csv'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'id,sender_account,receiver_account,amount,timestamp')
+        self.assertEqual(len(lines), 8)
+
+
+class HistoryUnionTests(EmployeeAPITestCase):
+    def setUp(self):
+        super().setUp()
+        customer = Customer.objects.create(name='Sarah Johnson')
+        self.account, other, third = [Account.objects.create(customer=customer, balance=100000) for _ in range(3)]
+        start = datetime(2023, 1, 1, 12, 0)
+        # Sent, received, to itself and unrelated, with timestamps shared across directions.
+        Transfer.objects.bulk_create([
+            Transfer(sender_account=sender, receiver_account=receiver, amount=100,
+                     timestamp=start + timedelta(hours=hours))
+            for sender, receiver, hours in (
+                (self.account, other, 0), (other, self.account, 0), (self.account, self.account, 0),
+                (other, third, 0), (third, self.account, 1), (self.account, third, 1), (self.account, self.account, 2),
+                (other, self.account, 24), (other, third, 24), (self.account, other, 48))])
+        self.bounds = [(None, None), (start + timedelta(hours=1), None), (None, start + timedelta(hours=24)),
+                       (start + timedelta(hours=1), start + timedelta(hours=24))]
+
+    def _or_query(self, start_date, end_date):
+        """The ``sender OR receiver`` filter the union replaced."""
+        query = Q(sender_account_id=self.account.id) | Q(receiver_account_id=self.account.id)
+        if start_date:
+            query &= Q(timestamp__gte=start_date)
+        if end_date:
+            query &= Q(timestamp__lte=end_date)
+        return list(Transfer.objects.filter(query).order_by('timestamp', 'id').values_list('id', flat=True))
+
+    def test_union_matches_or_query(self):
+        for start_date, end_date in self.bounds:
+            branches = history_branches(self.account.id, start_date, end_date)
+            rows = union_all([branch.values_list('id', 'timestamp') for branch in branches])
+            self.assertEqual([pk for pk, _ in rows], self._or_query(start_date, end_date))
+        self.assertEqual(len(self._or_query(None, None)), 8)
+
+    def test_pages_match_or_query(self):
+        url = reverse('transfer_history', kwargs={'account_id': self.account.id})
+        for start_date, end_date in self.bounds:
+            dates = {key: value.isoformat() for key, value in (('start_date', start_date), ('end_date', end_date))
+                     if value}
+            for limit in (1, 2, 3, 8):
+                ids, cursor = [], None
+                while True:
+                    response = self.client.get(url, {'limit': limit, **dates, **({'cursor': cursor} if cursor else {})})
+                    self.assertLessEqual(len(response.data['results']), limit)
+                    ids += [row['id'] for row in response.data['results']]
+                    cursor = response.data['next_cursor']
+                    if cursor is None:
+                        break
+                self.assertEqual(ids, self._or_query(start_date, end_date))
+
+
+class BearerTokenTests(EmployeeAPITestCase):
+    sign_in = False
+
+    def setUp(self):
+        super().setUp()
+        self.account = Account.objects.create(customer=Customer.objects.create(name='Sarah Johnson'), balance=100000)
+        self.url = reverse('account_balance', kwargs={'account_id': self.account.id})
+
+    def _token(self, username='employeeuser', password='123456'):
+        response = self.client.post(reverse('obtain_token'), {'username': username, 'password': password},
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data['token']
+
+    @override_settings(BALANCE_CACHE=True)
+    def test_token_authenticates_without_queries(self):
+        reset_balance_cache_stats()
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self._token())
+        self.assertEqual(self.client.get(self.url).data['balance'], Decimal('1000.00'))
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('sessionid', response.cookies)
+
+        other = Account.objects.create(customer=self.account.customer, balance=0)
+        response = self.client.post(reverse('transfer'), {'sender_account_id': self.account.id,
+                                                          'receiver_account_id': other.id, 'transfer_amount': 10},
+                                    format='json', HTTP_IDEMPOTENCY_KEY='key-1')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(IdempotencyKey.objects.get().user, self.employee_user)
+
+    def test_invalid_expired_and_revoked_tokens_are_rejected(self):
+        response = self.client.post(reverse('obtain_token'), {'username': 'employeeuser', 'password': 'wrong'},
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        with override_settings(TOKEN_TTL=-1):
+            expired = self._token()
+        token = self._token()
+
+        for invalid in (token[:-2], expired, ''):
+            self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + invalid)
+            self.assertEqual(self.client.get(self.url).status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + token)
+        self.assertEqual(self.client.post(reverse('logout')).status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_401_UNAUTHORIZED)
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self._token())
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+
+    def test_employee_claim_follows_group_membership(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self._token())
+        self.employee_user.groups.remove(self.employee_group)
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self._token())
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_deactivation_and_password_changes_revoke_tokens(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self._token())
+        self.employee_user.last_login = timezone.now()
+        self.employee_user.save(update_fields=['last_login'])
+        self.employee_user.first_name = 'Sarah'
+        self.employee_user.save()
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+
+        self.employee_user.set_password('654321')
+        self.employee_user.save()
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self._token(password='654321'))
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+        user = User.objects.get(pk=self.employee_user.pk)
+        user.is_active = False
+        user.save()
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_refuses_a_revocation_cache_other_workers_cannot_see(self):
+        with override_settings(ALLOW_LOCAL_TOKEN_REVOCATION=False):
+            with self.assertRaises(ImproperlyConfigured):
+                check_revocation_cache()
+            with override_settings(CACHES={'default': {
+                    'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache', 'LOCATION': '127.0.0.1:11211'}}):
+                check_revocation_cache()
+
+
+class EmployeePermissionCacheTests(EmployeeAPITestCase):
+    def setUp(self):
+        super().setUp()
+        account = Account.objects.create(customer=Customer.objects.create(name='Sarah Johnson'), balance=10000)
+        self.url = reverse('account_balance', kwargs={'account_id': account.id})
+
+    def _group_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        return response, [query for query in queries if 'auth_group' in query['sql']]
+
+    def test_warm_request_skips_group_query(self):
+        response, group_queries = self._group_queries()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(group_queries), 1)
+
+        response, group_queries = self._group_queries()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(group_queries, [])
+
+    def test_removing_user_from_group_revokes_immediately(self):
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+
+        self.employee_user.groups.remove(self.employee_group)
+
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_removing_user_from_group_side_revokes_immediately(self):
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+
+        self.employee_group.user_set.clear()
+
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_deleting_group_revokes_immediately(self):
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+
+        self.employee_group.delete()
+
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_403_FORBIDDEN)
+
+
+@override_settings(BALANCE_CACHE=True)
+class BalanceCacheTests(EmployeeAPITestCase):
+    def setUp(self):
+        super().setUp()
+        customer = Customer.objects.create(name='Sarah Johnson')
+        self.sender_account = Account.objects.create(customer=customer, balance=100000)
+        self.receiver_account = Account.objects.create(customer=customer, balance=0)
+
+    def _balance(self, account):
+        response = self.client.get(reverse('account_balance', kwargs={'account_id': account.id}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data['balance']
+
+    def test_warm_balance_read_does_not_query_accounts(self):
+        self._balance(self.sender_account)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self._balance(self.sender_account), Decimal('1000.00'))
+
+        self.assertFalse([query for query in queries if 'app_account' in query['sql']])
+        stats = self.client.get(reverse('balance_cache_stats')).data
+        self.assertEqual((stats['misses'], stats['cache_hits']), (1, 1))
+
+    def test_committed_transfer_is_visible_in_cache(self):
+        self.assertEqual(self._balance(self.sender_account), Decimal('1000.00'))
+        self.assertEqual(self._balance(self.receiver_account), Decimal('0.00'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('transfer'), {
+                'sender_account_id': self.sender_account.id,
+                'receiver_account_id': self.receiver_account.id,
+                'transfer_amount': 250,
+            }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        self.assertEqual(self._balance(self.sender_account), Decimal('750.00'))
+        self.assertEqual(self._balance(self.receiver_account), Decimal('250.00'))
+        self.assertEqual(balance_cache_stats()['misses'], 2)
+
+    def test_older_version_does_not_replace_newer_entry(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            execute_transfer(self.sender_account.id, self.receiver_account.id, 10000)
+        reset_balance_cache_stats()
+
+        # A read that fetched the pre-transfer row finishes after the write-through.
+        _store(self.sender_account.id, 0, 100000, datetime.now())
+
+        self.assertEqual(get_balance(self.sender_account.id), 90000)
+
+    def test_store_evicts_when_the_lock_is_held_elsewhere(self):
+        self._balance(self.sender_account)
+        lock_key = _cache_key(self.sender_account.id) + ':lock'
+        cache.add(lock_key, 'other worker')
+
+        with mock.patch('app.balances.LOCK_TIMEOUT', 0.01):
+            _store(self.sender_account.id, 5, 0, datetime.now())
+
+        self.assertIsNone(cache.get(_cache_key(self.sender_account.id)))
+        self.assertEqual(cache.get(lock_key), 'other worker')
+        self.assertEqual(self._balance(self.sender_account), Decimal('1000.00'))
+
+    def test_cache_failure_does_not_fail_a_committed_transfer(self):
+        self._balance(self.sender_account)
+
+        with mock.patch('app.balances._store', side_effect=ConnectionError), \
+                self.assertLogs('app.balances', 'ERROR'), self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('transfer'), {
+                'sender_account_id': self.sender_account.id,
+                'receiver_account_id': self.receiver_account.id,
+                'transfer_amount': 250,
+            }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        self.assertEqual(self._balance(self.sender_account), Decimal('750.00'))
+
+    @override_settings(BALANCE_CACHE=False)
+    def test_balances_read_through_without_a_shared_cache(self):
+        reset_balance_cache_stats()
+        self._balance(self.sender_account)
+        with self.captureOnCommitCallbacks(execute=True):
+            execute_transfer(self.sender_account.id, self.receiver_account.id, 10000)
+        # Another worker's transfer, which this process couldn't have published.
+        Account.objects.filter(pk=self.sender_account.pk).update(balance=F('balance') - 10000)
+
+        self.assertEqual(self._balance(self.sender_account), Decimal('800.00'))
+        self.assertIsNone(cache.get(_cache_key(self.sender_account.id)))
+        self.assertEqual(balance_cache_stats()['misses'], 2)
+
+
+@override_settings(BALANCE_CACHE=True)
+class ConditionalGetTests(EmployeeAPITestCase):
+    def setUp(self):
+        super().setUp()
+        customer = Customer.objects.create(name='Sarah Johnson')
+        self.sender = Account.objects.create(customer=customer, balance=100000)
+        self.receiver = Account.objects.create(customer=customer, balance=0)
+        execute_transfer(self.sender.id, self.receiver.id, 1000)
+
+    def _get(self, name, account, **headers):
+        return self.client.get(reverse(name, kwargs={'account_id': account.id}), **headers)
+
+    def test_unchanged_balance_is_not_modified(self):
+        response = self._get('account_balance', self.sender)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('Last-Modified', response)
+
+        with CaptureQueriesContext(connection) as queries:
+            cached = self._get('account_balance', self.sender, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(cached.content, b'')
+        self.assertFalse([query for query in queries if 'app_account' in query['sql']])
+        self.assertEqual(cached['Last-Modified'], response['Last-Modified'])
+        # Several changes can share a Last-Modified second, so only the ETag can answer with a 304.
+        self.assertEqual(self._get('account_balance', self.sender,
+                                   HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code,
+                         status.HTTP_200_OK)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            execute_transfer(self.sender.id, self.receiver.id, 1000)
+        changed = self._get('account_balance', self.sender, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed.status_code, status.HTTP_200_OK)
+        self.assertEqual(changed.data['balance'], Decimal('980.00'))
+        self.assertNotEqual(changed['ETag'], response['ETag'])
+
+    def test_write_by_another_process_changes_the_etag(self):
+        etag = self._get('account_balance', self.sender)['ETag']
+        self.assertEqual(get_balance(self.sender.id), 99000)
+
+        # Another worker's transfer reaches the database and the shared cache, but not this process's tier.
+        Account.objects.filter(pk=self.sender.pk).update(balance=F('balance') - 500, **bump())
+        version, balance, modified_at = Account.objects.values_list(total_version(), 'balance', 'modified_at').get(
+            pk=self.sender.pk)
+        cache.set(_cache_key(self.sender.id), (version, balance, modified_at))
+
+        response = self._get('account_balance', self.sender, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['balance'], Decimal('985.00'))
+
+    def test_unchanged_history_costs_one_query(self):
+        etag = self._get('transfer_history', self.receiver)['ETag']
+
+        with self.assertNumQueries(1):
+            response = self._get('transfer_history', self.receiver, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(self._get('transfer_history', self.receiver, HTTP_IF_NONE_MATCH='"other"').status_code,
+                         status.HTTP_200_OK)
+        self.assertEqual(self._get('transfer_history', Account(pk=999), HTTP_IF_NONE_MATCH=etag).status_code,
+                         status.HTTP_404_NOT_FOUND)
+
+    @override_settings(BALANCE_SHARDS=True)
+    def test_every_transfer_changes_the_etag(self):
+        etags = [self._get('transfer_history', self.receiver)['ETag']]
+        # A credit that lands on a shard, and transfers that cancel out within a batch.
+        call_command('shard_account', self.receiver.id, shards=2, stdout=StringIO())
+        etags.append(self._get('transfer_history', self.receiver)['ETag'])
+        execute_transfer(self.sender.id, self.receiver.id, 1000)
+        etags.append(self._get('transfer_history', self.receiver)['ETag'])
+        execute_transfer_batch([(self.sender.id, self.receiver.id, 500), (self.receiver.id, self.sender.id, 500)])
+        etags.append(self._get('transfer_history', self.receiver)['ETag'])
+        call_command('shard_account', self.receiver.id, shards=0, stdout=StringIO())
+        etags.append(self._get('transfer_history', self.receiver)['ETag'])
+
+        self.assertEqual(len(set(etags)), len(etags))
+
+
+@override_settings(BALANCE_SHARDS=True)
+class CustomerPortfolioTests(EmployeeAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.customer = Customer.objects.create(name='Sarah Johnson')
+        self.accounts = [Account.objects.create(customer=self.customer, balance=balance)
+                         for balance in (100000, 0, 2500)]
+        other = Account.objects.create(customer=Customer.objects.create(name='Michael Garcia'), balance=100000)
+        call_command('shard_account', self.accounts[1].id, shards=2, stdout=StringIO())
+        self.transfers = [execute_transfer(self.accounts[0].id, self.accounts[1].id, 1000),
+                          execute_transfer(other.id, self.accounts[0].id, 500)]
+
+    def test_bulk_balances(self):
+        url = reverse('account_balances')
+        ids = [self.accounts[2].id, 999, self.accounts[1].id, self.accounts[2].id]
+        self.client.get(url, {'ids': self.accounts[0].id})
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url, {'ids': ','.join(map(str, ids))})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['balances'], [{'account_id': self.accounts[2].id, 'balance': Decimal('25.00')},
+                                                     {'account_id': self.accounts[1].id, 'balance': Decimal('10.00')}])
+        self.assertEqual(response.data['missing'], [999])
+
+    def test_bulk_balances_validates_ids(self):
+        url = reverse('account_balances')
+        for ids in ('', '1,x', ','.join(map(str, range(1001)))):
+            response = self.client.get(url, {'ids': ids})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_portfolio_in_constant_queries(self):
+        url = reverse('customer_portfolio', kwargs={'customer_id': self.customer.id})
+        self.client.get(url)
+        Account.objects.create(customer=self.customer, balance=0)
+
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['name'], 'Sarah Johnson')
+        accounts = response.data['accounts']
+        self.assertEqual([account['balance'] for account in accounts],
+                         [Decimal('995.00'), Decimal('10.00'), Decimal('25.00'), Decimal('0.00')])
+        timestamps = [transfer.timestamp.isoformat() for transfer in self.transfers]
+        self.assertEqual([account['last_transfer_at'] for account in accounts],
+                         [timestamps[1], timestamps[0], None, None])
+        self.assertEqual(self.client.get(reverse('customer_portfolio', kwargs={'customer_id': 999})).status_code,
+                         status.HTTP_404_NOT_FOUND)
+
+
+class CustomerSearchTests(EmployeeAPITestCase):
+    def setUp(self):
+        super().setUp()
+        for name in ('Ayşe IŞIK', 'İsmail Işıklı', 'Ali Işık', 'ismet  Yılmaz', 'Sarah Johnson'):
+            Customer.objects.create(name=name)
+
+    def _search(self, q, **params):
+        response = self.client.get(reverse('search_customers'), {'q': q, **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_prefix_search_folds_turkish_case(self):
+        self.assertEqual(Customer.objects.get(name='Ayşe IŞIK').search_name, 'ayşe ışık')
+        self.assertEqual([row['name'] for row in self._search('İS')['results']],
+                         ['İsmail Işıklı', 'ismet  Yılmaz'])
+        self.assertEqual([row['name'] for row in self._search('ISM')['results']], [])
+        self.assertEqual([row['name'] for row in self._search('ismet yıl')['results']], ['ismet  Yılmaz'])
+
+        response = self.client.get(reverse('search_customers'), {'q': '  ', 'match': 'prefix'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(reverse('search_customers'), {'q': 'ali', 'match': 'fuzzy'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_pages_follow_the_cursor(self):
+        Customer.objects.bulk_create([Customer(name='Ahmet {}'.format(i % 3)) for i in range(7)])
+        names, cursor = [], None
+        while True:
+            data = self._search('ahmet', limit=3, **({'cursor': cursor} if cursor else {}))
+            names.extend(row['name'] for row in data['results'])
+            cursor = data['next_cursor']
+            if cursor is None:
+                break
+        self.assertEqual(names, sorted(Customer.objects.filter(name__startswith='Ahmet')
+                                       .values_list('name', flat=True)))
+
+        response = self.client.get(reverse('search_customers'), {'q': 'ahmet', 'cursor': 'bogus'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_word_search_follows_renames_and_imports(self):
+        self.assertEqual([row['name'] for row in self._search('IŞIK', match='words')['results']],
+                         ['Ayşe IŞIK', 'Ali Işık'])
+        self.assertEqual([row['name'] for row in self._search('ışık ali', match='words')['results']], ['Ali Işık'])
+
+        customer = Customer.objects.get(name='Ali Işık')
+        customer.name = 'Ali Demir'
+        customer.save()
+        self.assertEqual([row['name'] for row in self._search('ışık', match='words')['results']], ['Ayşe IŞIK'])
+
+        response = self.client.post(reverse('import_customers'), 'name\nZeynep Demir\n'.encode(),
+                                    content_type='text/csv')
+        self.assertEqual(b''.join(response.streaming_content).count(b'"error"'), 0)
+        data = self._search('DEMİR', match='words', limit=1)
+        self.assertEqual([row['name'] for row in data['results']], ['Ali Demir'])
+        data = self._search('DEMİR', match='words', limit=1, cursor=data['next_cursor'])
+        self.assertEqual([row['name'] for row in data['results']], ['Zeynep Demir'])
+        self.assertIsNone(data['next_cursor'])
+
+
+class BalanceSnapshotTests(EmployeeAPITestCase):
+    def setUp(self):
+        super().setUp()
+        customer = Customer.objects.create(name='Sarah Johnson')
+        self.days = [datetime.now().date() - timedelta(days=offset) for offset in (5, 4, 3)]
+        opened = datetime.combine(self.days[0], datetime.min.time())
+        self.first = Account.objects.create(customer=customer, balance=73000)
+        self.second = Account.objects.create(customer=customer, balance=27000)
+        Account.objects.update(created_at=opened)
+        for day, sender, receiver, amount in ((0, self.first, self.second, 100), (1, self.second, self.first, 30),
+                                              (2, self.first, self.second, 200)):
+            Transfer.objects.create(sender_account=sender, receiver_account=receiver, amount=amount * 100,
+                                    timestamp=opened + timedelta(days=day, hours=12))
+
+    def _as_of(self, account, day):
+        url = reverse('account_balance_as_of', kwargs={'account_id': account.id})
+        return self.client.get(url, {'date': str(day)})
+
+    def test_snapshots_are_written_incrementally(self):
+        call_command('snapshot_balances', until=self.days[0], stdout=StringIO())
+        self.assertEqual(BalanceSnapshot.objects.count(), 2)
+
+        call_command('snapshot_balances', until=self.days[2], stdout=StringIO())
+
+        snapshots = BalanceSnapshot.objects.filter(account=self.first).order_by('day')
+        self.assertEqual([(snapshot.day, snapshot.balance) for snapshot in snapshots],
+                         list(zip(self.days, [90000, 93000, 73000])))
+        self.assertEqual(BalanceSnapshot.objects.get(account=self.second, day=self.days[1]).balance, 7000)
+
+    def test_balance_as_of_date(self):
+        call_command('snapshot_balances', until=self.days[1], stdout=StringIO())
+        # The snapshot of the 2nd day plus the transfer on the 3rd.
+        response = self._as_of(self.first, self.days[2])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['balance'], Decimal('730.00'))
+
+        BalanceSnapshot.objects.filter(day=self.days[0]).delete()
+        # Walks back from the later snapshot.
+        self.assertEqual(self._as_of(self.first, self.days[0]).data['balance'], Decimal('900.00'))
+
+    def test_balance_as_of_date_without_snapshots(self):
+        self.assertEqual(self._as_of(self.second, self.days[0]).data['balance'], Decimal('100.00'))
+        self.assertEqual(self._as_of(self.second, self.days[0] - timedelta(days=1)).status_code,
+                         status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self._as_of(self.second, 'yesterday').status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class AsyncViewTests(EmployeeTransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        customer = Customer.objects.create(name='Sarah Johnson')
+        self.account = Account.objects.create(customer=customer, balance=100000)
+        other_account = Account.objects.create(customer=Customer.objects.create(name='Michael Garcia'), balance=0)
+        Transfer.objects.create(sender_account=self.account, receiver_account=other_account, amount=10000)
+        Transfer.objects.create(sender_account=other_account, receiver_account=self.account, amount=2500)
+
+    def test_async_views_match_sync_views(self):
+        for name in ('account_balance', 'transfer_history'):
+            kwargs = {'account_id': self.account.id}
+            sync_response = self.client.get(reverse(name, kwargs=kwargs))
+            async_response = self.client.get(reverse('async_' + name, kwargs=kwargs))
+
+            self.assertEqual(async_response.status_code, status.HTTP_200_OK)
+            self.assertEqual(async_response.json(), sync_response.json())
+
+    def test_async_views_accept_bearer_tokens(self):
+        response = Client().post(reverse('obtain_token'), {'username': 'employeeuser', 'password': '123456'})
+        token = response.json()['token']
+        client = Client(HTTP_AUTHORIZATION='Bearer ' + token)
+        url = reverse('async_account_balance', kwargs={'account_id': self.account.id})
+
+        self.assertEqual(client.get(url).status_code, status.HTTP_200_OK)
+        client.post(reverse('logout'))
+        response = client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(response['WWW-Authenticate'], 'Bearer')
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+    def test_shared_cache_lookup_runs_off_the_event_loop(self):
+        cache_threads = []
+
+        def get(cache, key, default=None, version=None):
+            cache_threads.append(threading.current_thread())
+            return default
+
+        async def check():
+            return threading.current_thread(), await ais_employee(self.employee_user)
+
+        with mock.patch.object(DummyCache, 'get', get):
+            loop_thread, member = async_to_sync(check)()
+        self.assertTrue(member)
+        self.assertTrue(cache_threads)
+        self.assertNotIn(loop_thread, cache_threads)
+
+    @override_settings(BALANCE_CACHE=True)
+    def test_balance_sees_another_process_write(self):
+        reset_balance_cache_stats()
+        self.assertEqual(get_balance(self.account.id), 100000)
+
+        # Another worker's transfer reaches the database and the shared cache, but not this process's tier.
+        Account.objects.filter(pk=self.account.pk).update(balance=F('balance') - 500, **bump())
+        cache.set(_cache_key(self.account.id), Account.objects.values_list(
+            total_version(), 'balance', 'modified_at').get(pk=self.account.pk))
+
+        response = self.client.get(reverse('async_account_balance', kwargs={'account_id': self.account.id}))
+        self.assertEqual(response.json()['balance'], 995.0)
+
+    def test_bearer_token_is_verified_off_the_event_loop(self):
+        response = Client().post(reverse('obtain_token'), {'username': 'employeeuser', 'password': '123456'})
+        request = RequestFactory().get('/', HTTP_AUTHORIZATION='Bearer ' + response.json()['token'])
+        verify_threads = []
+
+        def verify(token):
+            verify_threads.append(threading.current_thread())
+            return verify_token(token)
+
+        async def check():
+            return threading.current_thread(), await _denied(request)
+
+        with mock.patch('app.authentication.verify_token', verify):
+            loop_thread, denied = async_to_sync(check)()
+        self.assertIsNone(denied)
+        self.assertTrue(verify_threads)
+        self.assertNotIn(loop_thread, verify_threads)
+
+    def test_async_history_pagination(self):
+        response = self.client.get(reverse('async_transfer_history', kwargs={'account_id': self.account.id}),
+                                   {'limit': 1})
+
+        self.assertEqual(len(response.json()['results']), 1)
+        self.assertIsNotNone(response.json()['next_cursor'])
+
+    def test_async_views_require_employee(self):
+        self.employee_user.groups.clear()
+
+        response = self.client.get(reverse('async_account_balance', kwargs={'account_id': self.account.id}))
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_async_balance_with_invalid_account(self):
+        response = self.client.get(reverse('async_account_balance', kwargs={'account_id': 9999}))
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(response.json()['error'], 'Account with given id does not exist')
+
+
+class BulkOnboardingTests(EmployeeAPITestCase):
+    def _import(self, body, content_type):
+        response = self.client.post(reverse('import_customers'), body, content_type=content_type)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+
+    def test_import_csv(self):
+        body = ('name,initial_balances\n'
+                'Sarah Johnson,100.50;20\n'
+                'Michael Garcia,\n'
+                ',10\n'
+                'Emily Rodriguez,-5\n'
+                'Ahmet Yılmaz,0\n')
+        events = self._import(body.encode(), 'text/csv')
+
+        self.assertEqual([(event['line'], event['error']) for event in events if event['event'] == 'error'],
+                         [(4, 'name is required'), (5, "Invalid initial balance: '-5'")])
+        self.assertEqual(events[-1], {'event': 'done', 'rows': 5, 'customers': 3, 'accounts': 3, 'errors': 2})
+        sarah = Customer.objects.get(name='Sarah Johnson')
+        self.assertEqual(sorted(sarah.account_set.values_list('balance', flat=True)),
+                         [2000, 10050])
+        self.assertFalse(Customer.objects.get(name='Michael Garcia').account_set.exists())
+        self.assertEqual(Customer.objects.get(name='Ahmet Yılmaz').account_set.get().balance, 0)
+
+    def test_import_ndjson_in_chunks(self):
+        lines = [json.dumps({'name': 'Customer {}'.format(i), 'accounts': [i, '1.25']}) for i in range(5)]
+        lines.insert(2, '{"name": "Broken"')
+        with NamedTemporaryFile('w', suffix='.ndjson') as source:
+            source.write('\n'.join(lines))
+            source.flush()
+            stdout, stderr = StringIO(), StringIO()
+            call_command('import_customers', source.name, chunk_size=2, stdout=stdout, stderr=stderr)
+
+        self.assertIn('line 3: Invalid JSON', stderr.getvalue())
+        self.assertEqual(stdout.getvalue().count('progress:'), 3)
+        self.assertIn('done: 6 rows, 5 customers, 10 accounts, 1 errors', stdout.getvalue())
+        customer = Customer.objects.get(name='Customer 4')
+        self.assertEqual(sorted(customer.account_set.values_list('balance', flat=True)),
+                         [125, 400])
+
+    def test_import_rejects_unknown_content_type(self):
+        response = self.client.post(reverse('import_customers'), {'name': 'Sarah Johnson'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+        self.assertEqual(self._import(b'customer\nSarah Johnson\n', 'text/csv')[0]['error'],
+                         'CSV header must contain a name column')
+        self.assertEqual(self._import(b'', 'application/x-ndjson'),
+                         [{'event': 'done', 'rows': 0, 'customers': 0, 'accounts': 0, 'errors': 0}])
+
+
+@override_settings(REQUEST_METRICS=True)
+class RequestMetricsTests(EmployeeTransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        reset_metrics()
+        customer = Customer.objects.create(name='Sarah Johnson')
+        self.account = Account.objects.create(customer=customer, balance=100000)
+        self.async_client = AsyncClient()
+        self.login(self.async_client)
+
+    async def _async_get(self, path):
+        return await self.async_client.get(path)
+
+    def test_server_timing_header(self):
+        response = self.client.get(reverse('account_balance', kwargs={'account_id': self.account.id}))
+
+        self.assertRegex(response['Server-Timing'],
+                         r'^db;dur=[\d.]+;desc="[1-9]\d* queries", permission;dur=[\d.]+, serialize;dur=[\d.]+, '
+                         r'encode;dur=[\d.]+, total;dur=[\d.]+$')
+
+    def test_serialization_and_permission_checks_are_timed_apart_from_queries(self):
+        with mock.patch('app.metrics.time.perf_counter', side_effect=itertools.count()):
+            timings = RequestTimings()
+            token = request_timings.set(timings)
+            try:
+                with timed('serialize'):
+                    timings.db += 0.5
+                with timed('permission'):
+                    pass
+            finally:
+                request_timings.reset(token)
+
+        self.assertEqual((timings.serialize, timings.permission), (0.5, 1))
+
+        self.client.get(reverse('transfer_history', kwargs={'account_id': self.account.id}))
+        body = render_prometheus()
+        self.assertNotIn('banking_serialize_duration_seconds_sum{view="transfer_history"} 0.0\n', body)
+        self.assertNotIn('banking_permission_duration_seconds_sum{view="transfer_history"} 0.0\n', body)
+        self.assertIn('banking_permission_duration_seconds_count{view="transfer_history"} 1', body)
+
+    @override_settings(METRICS_TOKEN='scrape-secret')
+    def test_metrics_endpoint(self):
+        self.client.get(reverse('account_balance', kwargs={'account_id': self.account.id}))
+        async_to_sync(self._async_get)(reverse('async_account_balance', kwargs={'account_id': self.account.id}))
+
+        response = Client().get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scrape-secret')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        body = response.content.decode()
+        self.assertIn('# TYPE banking_request_duration_seconds histogram', body)
+        self.assertIn('banking_request_duration_seconds_count{view="account_balance"} 1', body)
+        self.assertIn('banking_db_queries_bucket{view="account_balance",le="+Inf"} 1', body)
+        # The async view's queries run on a worker thread and are still counted.
+        self.assertRegex(body, r'banking_db_queries_sum\{view="async_account_balance"\} [1-9]')
+
+    @override_settings(METRICS_TOKEN='scrape-secret')
+    def test_metrics_endpoint_needs_the_token_or_staff(self):
+        url = reverse('metrics')
+        self.assertEqual(Client().get(url).status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(Client().get(url, HTTP_AUTHORIZATION='Bearer wrong').status_code,
+                         status.HTTP_403_FORBIDDEN)
+        # Being an employee isn't enough.
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+
+        User.objects.filter(pk=self.employee_user.pk).update(is_staff=True)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+
+    @override_settings(REQUEST_METRICS=False)
+    def test_disabled(self):
+        response = self.client.get(reverse('account_balance', kwargs={'account_id': self.account.id}))
+
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, status.HTTP_404_NOT_FOUND)
+
+
+@override_settings(REPLICA_READS=True)
+class ReplicaRoutingTests(EmployeeTransactionTestCase):
+    databases = {'default', 'replica'}
+    client_class = APIClient
+
+    def setUp(self):
+        super().setUp()
+        customer = Customer.objects.create(name='Sarah Johnson')
+        self.account = Account.objects.create(customer=customer, balance=100000)
+        self.other_account = Account.objects.create(customer=customer, balance=0)
+        call_command('sync_replica', stdout=StringIO())
+        # Written after the copy, so only the primary has it.
+        execute_transfer(self.account.id, self.other_account.id, 10000)
+        cache.clear()
+        reset_balance_cache_stats()
+
+    def test_balance_and_history_read_from_the_replica(self):
+        balance_url = reverse('account_balance', kwargs={'account_id': self.account.id})
+        history_url = reverse('transfer_history', kwargs={'account_id': self.account.id})
+
+        self.assertEqual(self.client.get(balance_url).data['balance'], Decimal('1000.00'))
+        self.assertEqual(self.client.get(history_url).data, [])
+        self.assertEqual(self.client.get(history_url, {'stream': 'ndjson'}).getvalue(), b'')
+
+        self.assertEqual(self.client.get(balance_url, HTTP_X_READ_FROM='primary').data['balance'],
+                         Decimal('900.00'))
+        self.assertEqual(len(self.client.get(history_url, HTTP_X_READ_FROM='primary').data), 1)
+
+    @override_settings(BALANCE_CACHE=True)
+    def test_replica_balances_are_not_cached(self):
+        reset_balance_cache_stats()
+        self.client.get(reverse('account_balance', kwargs={'account_id': self.account.id}))
+
+        self.assertEqual(get_balance(self.account.id), 90000)
+
+    def test_async_views_read_from_the_replica(self):
+        client = Client()
+        self.login(client)
+        url = reverse('async_account_balance', kwargs={'account_id': self.account.id})
+
+        self.assertEqual(client.get(url).json()['balance'], 1000.0)
+        self.assertEqual(client.get(url, HTTP_X_READ_FROM='primary').json()['balance'], 900.0)
+
+    def test_reads_stick_to_the_primary_after_a_write(self):
+        @replica_reads
+        def view(request):
+            before = Account.objects.all().db
+            Customer.objects.create(name='Michael Garcia')
+            return before, Account.objects.all().db
+
+        self.assertEqual(view(RequestFactory().get('/')), ('replica', 'default'))
+        # Outside a replica_reads view everything uses the primary.
+        self.assertEqual(Account.objects.all().db, 'default')
+
+
+@override_settings(BALANCE_SHARDS=True)
+class BalanceShardTests(EmployeeAPITestCase):
+    def setUp(self):
+        super().setUp()
+        customer = Customer.objects.create(name='Sarah Johnson')
+        self.merchant = Account.objects.create(customer=customer, balance=0)
+        self.payer = Account.objects.create(customer=customer, balance=100000)
+        call_command('shard_account', self.merchant.id, shards=4, stdout=StringIO())
+
+    def test_credits_land_on_shards(self):
+        for _ in range(20):
+            execute_transfer(self.payer.id, self.merchant.id, 1000)
+
+        self.merchant.refresh_from_db()
+        self.assertEqual(self.merchant.balance, 0)
+        self.assertEqual(BalanceShard.objects.filter(account=self.merchant).aggregate(total=Sum('balance'))['total'],
+                         20000)
+        self.assertGreater(BalanceShard.objects.filter(account=self.merchant, balance__gt=0).count(), 1)
+        self.assertEqual(get_balance(self.merchant.id), 20000)
+
+    def test_sharded_credit_updates_one_shard(self):
+        with CaptureQueriesContext(connection) as queries:
+            execute_transfer(self.payer.id, self.merchant.id, 1000)
+
+        statements = [(query['sql'].split()[0], query['sql'].split('"')[1])
+                      for query in queries if 'SAVEPOINT' not in query['sql']]
+        # The write lock, the shard counts, the merchant's credit, the payer's debit and the transfer.
+        self.assertEqual(statements, [('UPDATE', 'app_account'), ('SELECT', 'app_account'),
+                                      ('UPDATE', 'app_balanceshard'), ('UPDATE', 'app_account'),
+                                      ('INSERT', 'app_transfer')])
+
+    @override_settings(BALANCE_SHARDS=False)
+    def test_sharding_is_off_by_default(self):
+        with self.assertRaisesMessage(CommandError, 'Balance sharding is off'):
+            call_command('shard_account', self.payer.id, shards=2, stdout=StringIO())
+
+        # Accounts sharded before keep their shards, but credits go to the account row.
+        execute_transfer(self.payer.id, self.merchant.id, 1000)
+        self.merchant.refresh_from_db()
+        self.assertEqual(self.merchant.balance, 1000)
+        self.assertEqual(get_balance(self.merchant.id), 1000)
+
+        call_command('shard_account', self.merchant.id, shards=0, stdout=StringIO())
+        self.assertFalse(BalanceShard.objects.filter(account=self.merchant).exists())
+
+    def test_debit_folds_shards(self):
+        execute_transfer(self.payer.id, self.merchant.id, 30000)
+
+        execute_transfer(self.merchant.id, self.payer.id, 25000)
+        with self.assertRaises(InsufficientBalance):
+            execute_transfer(self.merchant.id, self.payer.id, 6000)
+
+        self.merchant.refresh_from_db()
+        self.assertEqual(self.merchant.balance, 5000)
+        self.assertFalse(BalanceShard.objects.filter(account=self.merchant, balance__gt=0).exists())
+
+    def test_batch_sees_shard_balances(self):
+        execute_transfer(self.payer.id, self.merchant.id, 30000)
+
+        execute_transfer_batch([(self.merchant.id, self.payer.id, 20000),
+                                (self.payer.id, self.merchant.id, 5000)])
+
+        self.assertEqual(get_balance(self.merchant.id), 15000)
+        self.assertEqual(get_balance(self.payer.id), 85000)
+
+    def test_compaction_and_unsharding(self):
+        execute_transfer(self.payer.id, self.merchant.id, 30000)
+        self.assertEqual(get_balance(self.merchant.id), 30000)
+
+        call_command('compact_balance_shards', stdout=StringIO())
+        self.merchant.refresh_from_db()
+        self.assertEqual(self.merchant.balance, 30000)
+
+        execute_transfer(self.payer.id, self.merchant.id, 500)
+        call_command('shard_account', self.merchant.id, shards=0, stdout=StringIO())
+
+        self.merchant.refresh_from_db()
+        self.assertEqual((self.merchant.shards, self.merchant.balance), (0, 30500))
+        self.assertFalse(BalanceShard.objects.filter(account=self.merchant).exists())
+        self.assertEqual(get_balance(self.merchant.id), 30500)
+
+
+class TransferQueueTests(EmployeeAPITestCase):
+    def setUp(self):
+        super().setUp()
+        customer = Customer.objects.create(name='Sarah Johnson')
+        self.sender = Account.objects.create(customer=customer, balance=10000)
+        self.receiver = Account.objects.create(customer=Customer.objects.create(name='Michael Garcia'), balance=0)
+
+    def _enqueue(self, sender_id, receiver_id, amount):
+        return self.client.post(reverse('transfer'), {
+            'sender_account_id': sender_id,
+            'receiver_account_id': receiver_id,
+            'transfer_amount': amount,
+        }, format='json', HTTP_PREFER='respond-async')
+
+    def test_queued_transfers_match_synchronous_outcomes(self):
+        responses = [self._enqueue(self.sender.id, self.receiver.id, 60),
+                     self._enqueue(self.sender.id, self.receiver.id, 60),
+                     self._enqueue(self.receiver.id, 9999, 10),
+                     self._enqueue(self.receiver.id, self.sender.id, 50)]
+        self.assertEqual({response.status_code for response in responses}, {status.HTTP_202_ACCEPTED})
+        self.assertEqual(responses[0].data['status'], 'pending')
+        self.assertEqual(Transfer.objects.count(), 0)
+
+        call_command('process_transfer_queue', once=True, batch_size=3, stdout=StringIO())
+
+        results = [self.client.get(response['Location']).data for response in responses]
+        self.assertEqual([result['status'] for result in results], ['completed', 'rejected', 'rejected', 'completed'])
+        self.assertEqual(results[1]['error'], 'Insufficient balance in sender account')
+        self.assertEqual(results[2]['error'], 'Account with given id does not exist')
+        self.assertEqual(results[0]['transfer']['id'], Transfer.objects.order_by('pk').first().id)
+        self.assertEqual(results[0]['transfer']['receiver_account_customer_name'], 'Michael Garcia')
+        self.assertEqual(get_balance(self.sender.id), 9000)
+        self.assertEqual(get_balance(self.receiver.id), 1000)
+
+    def test_enqueue_validates_input(self):
+        self.assertEqual(self._enqueue(self.sender.id, self.sender.id, 10).data['error'],
+                         'Sender and receiver account cannot be the same')
+        self.assertEqual(self._enqueue(self.sender.id, self.receiver.id, -5).data['error'], 'Invalid amount')
+        self.assertFalse(QueuedTransfer.objects.exists())
+        self.assertEqual(self.client.get(reverse('queued_transfer', kwargs={'queued_transfer_id': 9999})).status_code,
+                         status.HTTP_404_NOT_FOUND)
+
+
+class MinorUnitMoneyTests(EmployeeAPITestCase):
+    def setUp(self):
+        super().setUp()
+        customer = Customer.objects.create(name='Sarah Johnson')
+        self.sender = Account.objects.create(customer=customer, balance=100000)
+        self.receiver = Account.objects.create(customer=customer, balance=0)
+
+    def test_conversions(self):
+        self.assertEqual([to_minor(value) for value in ('12.5', 12.34, 7, '1E+2', Decimal('0.10'))],
+                         [1250, 1234, 700, 10000, 10])
+        for value in ('0.001', 'abc', 'NaN', None):
+            with self.assertRaises(ValueError):
+                to_minor(value)
+        self.assertEqual(str(from_minor(1250)), '12.50')
+        self.assertEqual([format_minor(minor) for minor in (0, 5, 1250, -5)], ['0.00', '0.05', '12.50', '-0.05'])
+
+    def test_wire_format_is_unchanged(self):
+        response = self.client.post(reverse('transfer'), {
+            'sender_account_id': self.sender.id,
+            'receiver_account_id': self.receiver.id,
+            'transfer_amount': '0.10',
+        }, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertIn(b'"amount":0.1,', response.content)
+        self.sender.refresh_from_db()
+        self.assertEqual(self.sender.balance, 99990)
+        balance = self.client.get(reverse('account_balance', kwargs={'account_id': self.sender.id}))
+        self.assertIn(b'"balance":999.9}', balance.content)
+
+    def test_sub_cent_amount_is_rejected(self):
+        response = self.client.post(reverse('transfer'), {
+            'sender_account_id': self.sender.id,
+            'receiver_account_id': self.receiver.id,
+            'transfer_amount': '0.001',
+        }, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['error'], 'Invalid amount')
+        self.assertFalse(Transfer.objects.exists())
+
+
+class DailyRollupTests(EmployeeAPITestCase):
+    def setUp(self):
+        super().setUp()
+        customer = Customer.objects.create(name='Sarah Johnson')
+        self.first = Account.objects.create(customer=customer, balance=100000)
+        self.second = Account.objects.create(customer=customer, balance=100000)
+        self.days = [datetime(2023, 1, 1).date() + timedelta(days=day) for day in range(3)]
+
+    def _rollups(self):
+        return list(DailyRollup.objects.order_by('account_id', 'day')
+                    .values_list('account_id', 'day', 'amount_in', 'amount_out', 'count_in', 'count_out'))
+
+    def _summary(self, account, **params):
+        return self.client.get(reverse('account_summary', kwargs={'account_id': account.id}), params)
+
+    def test_transfer_writes_only_balances_and_the_transfer(self):
+        with CaptureQueriesContext(connection) as queries:
+            execute_transfer(self.first.id, self.second.id, 1000)
+
+        statements = [(query['sql'].split()[0], query['sql'].split('"')[1])
+                      for query in queries if 'SAVEPOINT' not in query['sql']]
+        # The account updates also bump the versions; the rollups are left to roll_up_transfers.
+        self.assertEqual(statements, [('UPDATE', 'app_account'), ('UPDATE', 'app_account'), ('INSERT', 'app_transfer')])
+
+    def test_transfers_update_rollups(self):
+        execute_transfer(self.first.id, self.second.id, 1000)
+        execute_transfer_batch([(self.second.id, self.first.id, 250), (self.first.id, self.second.id, 500)])
+        stdout = StringIO()
+        call_command('roll_up_transfers', once=True, stdout=stdout)
+
+        self.assertIn('Rolled up 1 transfers in total', stdout.getvalue())
+
+        today = timezone.now().date()
+        self.assertEqual(self._rollups(), [(self.first.id, today, 250, 1500, 1, 2),
+                                           (self.second.id, today, 1500, 250, 2, 1)])
+
+    def test_rebuild_recomputes_rollups_from_transfers(self):
+        Transfer.objects.bulk_create([
+            Transfer(sender_account=self.first, receiver_account=self.second, amount=amount,
+                     timestamp=datetime.combine(self.days[day], datetime.min.time()) + timedelta(hours=hour))
+            for day, hour, amount in ((0, 9, 1000), (0, 23, 2000), (2, 0, 500))])
+        DailyRollup.objects.create(account=self.first, day=self.days[0], amount_out=1, count_out=1)
+
+        call_command('rebuild_daily_rollups', stdout=StringIO())
+
+        self.assertEqual(self._rollups(), [(self.first.id, self.days[0], 0, 3000, 0, 2),
+                                           (self.first.id, self.days[2], 0, 500, 0, 1),
+                                           (self.second.id, self.days[0], 3000, 0, 2, 0),
+                                           (self.second.id, self.days[2], 500, 0, 1, 0)])
+
+    def test_summary_adds_transfers_not_yet_rolled_up(self):
+        execute_transfer(self.first.id, self.second.id, 1000)
+        execute_transfer(self.second.id, self.first.id, 250)
+        self.assertEqual(self._rollups(), [])
+        today = timezone.now().date()
+
+        def summary(start_date=today, end_date=today):
+            response = self._summary(self.first, start_date=start_date.isoformat(), end_date=end_date.isoformat())
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            return [(day['amount_in'], day['amount_out'], day['count_in'], day['count_out'])
+                    for day in response.data['days']]
+
+        self.assertEqual(summary(), [(Decimal('2.50'), Decimal('10.00'), 1, 1)])
+        self.assertEqual(summary(end_date=today - timedelta(days=1)), [])
+        self.assertEqual(summary(start_date=today + timedelta(days=1), end_date=today + timedelta(days=1)), [])
+        self.assertEqual(roll_up_transfers(), 2)
+        self.assertEqual(summary(), [(Decimal('2.50'), Decimal('10.00'), 1, 1)])
+        self.assertEqual(roll_up_transfers(), 0)
+
+    def test_summary_reads_only_rollups(self):
+        for day, amount_in, amount_out in ((0, 1000, 0), (1, 0, 250), (2, 5050, 100)):
+            DailyRollup.objects.create(account=self.first, day=self.days[day], amount_in=amount_in,
+                                       amount_out=amount_out, count_in=1 if amount_in else 0,
+                                       count_out=1 if amount_out else 0)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self._summary(self.first, start_date='2023-01-02', end_date='2023-01-03')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data['amount_in'], response.data['amount_out'], response.data['net']),
+                         (Decimal('50.50'), Decimal('3.50'), Decimal('47.00')))
+        self.assertEqual((response.data['count_in'], response.data['count_out']), (1, 2))
+        self.assertEqual([day['day'] for day in response.data['days']], self.days[1:])
+        # Only transfers that aren't rolled up yet are read, and there are none.
+        self.assertTrue(all('rolled_up' in query['sql'] for query in queries if 'app_transfer' in query['sql']))
+
+    def test_summary_rejects_invalid_dates(self):
+        self.assertEqual(self._summary(self.first, start_date='yesterday').status_code,
+                         status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(reverse('account_summary', kwargs={'account_id': 9999})).status_code,
+                         status.HTTP_404_NOT_FOUND)
+
+
+class TransferArchiveTests(EmployeeTransactionTestCase):
+    client_class = APIClient
+
+    def setUp(self):
+        super().setUp()
+        self.account = Account.objects.create(customer=Customer.objects.create(name='Sarah Johnson'), balance=100000)
+        self.other = Account.objects.create(customer=Customer.objects.create(name='Michael Garcia'), balance=0)
+        Account.objects.update(created_at=datetime(2022, 12, 1))
+        self.timestamps = [datetime(2023, 1, 15, 10), datetime(2023, 1, 31, 23, 59), datetime(2023, 2, 10, 12),
+                           timezone.now()]
+        Transfer.objects.bulk_create([
+            Transfer(sender_account=self.account, receiver_account=self.other, amount=1000 * (i + 1), timestamp=ts)
+            for i, ts in enumerate(self.timestamps)])
+
+    def tearDown(self):
+        # The archive tables aren't managed models, so flushing the database leaves them behind.
+        with connection.schema_editor() as schema_editor:
+            for db_table in TransferArchive.objects.values_list('db_table', flat=True):
+                schema_editor.delete_model(archive_model(db_table))
+
+    def _history(self, **params):
+        response = self.client.get(reverse('transfer_history', kwargs={'account_id': self.account.id}), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_old_transfers_move_to_monthly_tables(self):
+        call_command('archive_transfers', days=30, batch_size=1, stdout=StringIO())
+
+        self.assertEqual(list(Transfer.objects.values_list('timestamp', flat=True)), self.timestamps[3:])
+        archives = dict(TransferArchive.objects.values_list('period', 'db_table'))
+        self.assertEqual(sorted(archives), ['2023-01', '2023-02'])
+        self.assertEqual(archive_model(archives['2023-01']).objects.count(), 2)
+        self.assertEqual(list(archive_transfers(datetime.now() - timedelta(days=30))), [])
+        # Transfers that weren't rolled up yet were added to the rollups on their way out.
+        self.assertEqual(DailyRollup.objects.aggregate(total=Sum('amount_out'))['total'], 6000)
+
+    def test_history_stays_complete_and_skips_other_periods(self):
+        expected = [(row['id'], row['amount']) for row in self._history()]
+        call_command('archive_transfers', days=30, stdout=StringIO())
+
+        self.assertEqual([(row['id'], row['amount']) for row in self._history()], expected)
+        self.assertEqual([row['receiver_account_customer_name'] for row in self._history()], ['Michael Garcia'] * 4)
+        with CaptureQueriesContext(connection) as queries:
+            rows = self._history(start_date='2023-02-01', end_date='2023-02-28')
+        self.assertEqual([row['amount'] for row in rows], [Decimal('30.00')])
+        sql = ' '.join(query['sql'] for query in queries)
+        self.assertIn('app_transfer_archive_202302', sql)
+        self.assertNotIn('app_transfer_archive_202301', sql)
+
+    def test_derived_data_counts_archived_transfers(self):
+        url = reverse('account_balance_as_of', kwargs={'account_id': self.account.id})
+        # Derived backwards from the current balance: the February transfer and today's one are added back.
+        self.assertEqual(self.client.get(url, {'date': '2023-01-31'}).data['balance'], Decimal('1070.00'))
+        call_command('archive_transfers', days=30, stdout=StringIO())
+
+        self.assertEqual(self.client.get(url, {'date': '2023-01-31'}).data['balance'], Decimal('1070.00'))
+        call_command('rebuild_daily_rollups', stdout=StringIO())
+        self.assertEqual(DailyRollup.objects.get(account=self.account, day=self.timestamps[1].date()).amount_out,
+                         2000)
+
+    def test_portfolio_finds_archived_last_transfers(self):
+        Transfer.objects.filter(timestamp=self.timestamps[3]).delete()
+        call_command('archive_transfers', days=30, stdout=StringIO())
+        call_command('rebuild_daily_rollups', stdout=StringIO())
+
+        response = self.client.get(reverse('customer_portfolio', kwargs={'customer_id': self.account.customer_id}))
+        self.assertEqual(response.data['accounts'][0]['last_transfer_at'], self.timestamps[2].isoformat())
+
+
+    def test_queued_transfer_status_survives_archiving(self):
+        location = self.client.post(reverse('transfer'), {
+            'sender_account_id': self.account.id, 'receiver_account_id': self.other.id, 'transfer_amount': 5,
+        }, format='json', HTTP_PREFER='respond-async')['Location']
+        call_command('process_transfer_queue', once=True, stdout=StringIO())
+        queued = QueuedTransfer.objects.get()
+        Transfer.objects.filter(pk=queued.transfer_id).update(timestamp=datetime(2023, 1, 20))
+        QueuedTransfer.objects.update(created_at=datetime(2023, 1, 20), processed_at=datetime(2023, 1, 20))
+        expected = self.client.get(location).data
+
+        call_command('archive_transfers', days=30, stdout=StringIO())
+
+        self.assertFalse(Transfer.objects.filter(pk=queued.transfer_id).exists())
+        self.assertEqual(self.client.get(location).data, expected)
+        self.assertEqual(expected['transfer']['id'], queued.transfer_id)
+        self.assertEqual(expected['transfer']['receiver_account_customer_name'], 'Michael Garcia')
+
+
+@override_settings(BALANCE_SHARDS=True)
+class LedgerReconciliationTests(EmployeeTransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        customer = Customer.objects.create(name='Sarah Johnson')
+        Account.objects.bulk_create([Account(customer=customer, balance=100000) for _ in range(5)])
+        self.accounts = list(Account.objects.order_by('pk').values_list('pk', flat=True))
+        call_command('shard_account', self.accounts[4], shards=2, stdout=StringIO())
+        rng = random.Random(0)
+        for _ in range(20):
+            sender, receiver = rng.sample(self.accounts, 2)
+            execute_transfer(sender, receiver, rng.randint(1, 50) * 100)
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.checkpoint = os.path.join(directory.name, 'checkpoint.json')
+
+    def _reconcile(self, **options):
+        stdout = StringIO()
+        call_command('reconcile_ledger', range_size=2, checkpoint=self.checkpoint, stdout=stdout, stderr=StringIO(),
+                     **options)
+        self.assertFalse(os.path.exists(self.checkpoint))
+        return list(csv.reader(StringIO(stdout.getvalue())))[1:]
+
+    def _tamper(self, account_id, amount):
+        Account.objects.filter(pk=account_id).update(balance=F('balance') + amount)
+
+    def test_reports_balances_that_dont_match_the_transfers(self):
+        self.assertEqual(set(Account.objects.values_list('opening_balance', flat=True)), {100000})
+        self.assertEqual(self._reconcile(workers=2), [])
+
+        self._tamper(self.accounts[1], 150)
+        self._tamper(self.accounts[4], -20)
+        rows = self._reconcile(workers=2)
+        self.assertEqual([(row[0], row[3]) for row in rows], [(str(self.accounts[1]), '1.50'),
+                                                              (str(self.accounts[4]), '-0.20')])
+        self.assertEqual(to_minor(rows[0][2]) - to_minor(rows[0][1]), 150)
+        self.assertEqual(self._reconcile(workers=1), rows)
+
+    def test_resumes_from_checkpoint(self):
+        ranges = account_ranges(2)
+        save_checkpoint(self.checkpoint, {'ranges': ranges, 'completed': ranges[:1],
+                                          'discrepancies': [[self.accounts[0], 100, 200]]})
+        # Tampering within the completed range goes unnoticed until the next run.
+        self._tamper(self.accounts[1], 100)
+        self._tamper(self.accounts[2], 100)
+
+        rows = self._reconcile(workers=2)
+        self.assertEqual([row[0] for row in rows], [str(self.accounts[0]), str(self.accounts[2])])
+        self.assertEqual([row[0] for row in self._reconcile()], [str(self.accounts[1]), str(self.accounts[2])])
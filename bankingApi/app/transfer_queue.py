@@ -0,0 +1,44 @@
+from django.db import transaction
+from django.utils import timezone
+
+from .models import QueuedTransfer
+from .transfers import TRANSFER_ERRORS, execute_transfer_batch, lock_for_update
+
+BATCH_SIZE = 500
+
+
+def enqueue_transfer(sender_account_id, receiver_account_id, amount):
+    """Durably record a transfer for the queue worker; the row is committed before this returns."""
+    return QueuedTransfer.objects.create(sender_account_id=sender_account_id, receiver_account_id=receiver_account_id,
+                                         amount=amount)
+
+
+def process_queued_transfers(batch_size=BATCH_SIZE):
+    """
+    Apply up to ``batch_size`` pending transfers, oldest first, in one transaction (group commit).
+
+    The transfers go through ``execute_transfer_batch`` in non-atomic mode, so each one is checked against
+    the balances left by the transfers queued before it, exactly as if they had been made one by one, and
+    the batch pays for a single commit. The pending rows are locked without skipping, so several workers
+    take turns instead of applying batches out of queue order. Returns the number of transfers processed.
+    """
+    with transaction.atomic():
+        lock_for_update()
+        queued = list(QueuedTransfer.objects.select_for_update().filter(status=QueuedTransfer.PENDING)
+                      .order_by('pk')[:batch_size])
+        if not queued:
+            return 0
+
+        results = execute_transfer_batch([(item.sender_account_id, item.receiver_account_id, item.amount)
+                                          for item in queued], atomic=False)
+        processed_at = timezone.now()
+        for item, result in zip(queued, results):
+            item.processed_at = processed_at
+            if isinstance(result, Exception):
+                item.status = QueuedTransfer.REJECTED
+                item.error = TRANSFER_ERRORS[type(result)]
+            else:
+                item.status = QueuedTransfer.COMPLETED
+                item.transfer = result
+        QueuedTransfer.objects.bulk_update(queued, ['status', 'error', 'transfer', 'processed_at'], batch_size=500)
+    return len(queued)
@@ -0,0 +1,193 @@
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .balances import write_through
+from .bulk import bulk_create_with_pks
+from .models import Account, Transfer
+from .rollups import record_transfers
+from .shards import credit_shard, fold_shards, sharding_enabled, total_balance
+from .versions import bump
+
+MAX_BATCH_SIZE = 10000
+
+_sqlite_writer = threading.Lock()
+
+
+class InsufficientBalance(Exception):
+    pass
+
+
+class BatchRejected(Exception):
+    def __init__(self, errors):
+        super().__init__(errors)
+        self.errors = errors
+
+
+class BatchConflict(Exception):
+    pass
+
+
+TRANSFER_ERRORS = {
+    Account.DoesNotExist: 'Account with given id does not exist',
+    InsufficientBalance: 'Insufficient balance in sender account',
+}
+
+
+def lock_for_update():
+    """
+    Take SQLite's write lock up front, where other backends would lock rows with ``select_for_update``.
+
+    A deferred SQLite transaction that reads before it writes can't wait for the write lock without risking
+    a deadlock, so it fails with "database is locked" at once. Writing first lets ``busy_timeout`` apply.
+    """
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute('UPDATE {} SET id = id WHERE 0'.format(connection.ops.quote_name(Account._meta.db_table)))
+
+
+@contextmanager
+def write_transaction():
+    """
+    ``transaction.atomic()``; on SQLite an outermost one first waits for the other writers of this process.
+
+    SQLite has a single writer anyway, and a connection waiting for its lock polls from the ``busy_timeout``
+    handler, sleeping up to 100 ms between tries; under contention most of the wait is that sleep. Waiting
+    on a mutex instead wakes the next thread as soon as the lock is free. Writers in other processes still
+    wait through ``busy_timeout``.
+    """
+    if connection.vendor != 'sqlite' or connection.in_atomic_block:
+        with transaction.atomic():
+            yield
+        return
+    with _sqlite_writer, transaction.atomic():
+        yield
+
+
+def _debit(account_id, amount):
+    def debit():
+        return Account.objects.filter(pk=account_id, balance__gte=amount).update(balance=F('balance') - amount,
+                                                                                  **bump())
+
+    # The account row may not cover the debit while its shards do; fold them in and try again.
+    return debit() or (fold_shards(account_id) and debit())
+
+
+def _credit(account_id, amount, shards=0):
+    # The account row counts towards the balance too, so a credit can always land there; shards only spread
+    # the credits to hot accounts over several rows.
+    return ((shards and credit_shard(account_id, shards, amount))
+            or Account.objects.filter(pk=account_id).update(balance=F('balance') + amount, **bump()))
+
+
+def _shard_counts(account_ids):
+    """
+    ``{account_id: shards}`` for the sharded accounts among ``account_ids``, read once before their balances
+    change; empty with ``BALANCE_SHARDS`` off, which sends every credit to the account row.
+    """
+    if not sharding_enabled():
+        return {}
+    lock_for_update()
+    return dict(Account.objects.filter(pk__in=account_ids, shards__gt=0).values_list('id', 'shards'))
+
+
+def execute_transfer(sender_account_id, receiver_account_id, amount):
+    """
+    Move ``amount`` minor units from the sender to the receiver account and record the transfer.
+
+    Both balances are changed with single-statement ``F()`` updates, so the funds check and the
+    debit can't be interleaved with another transfer. The updates are issued in ascending account
+    id order; the row locks they take are therefore always acquired in the same order and two
+    concurrent transfers between the same accounts can't deadlock. The write transaction is just those
+    two updates, which also bump the account versions, and the insert: the ``roll_up_transfers`` command
+    adds the transfer to the daily rollups later. With ``BALANCE_SHARDS`` on, the shard counts are read
+    first, so a credit to a sharded account is a single update of one of its shards.
+    """
+    sender_account_id = int(sender_account_id)
+    receiver_account_id = int(receiver_account_id)
+    if sender_account_id == receiver_account_id:
+        raise ValueError('Sender and receiver account cannot be the same')
+
+    with write_transaction():
+        shards = _shard_counts((sender_account_id, receiver_account_id))
+        for account_id in sorted((sender_account_id, receiver_account_id)):
+            if account_id == sender_account_id:
+                if not _debit(sender_account_id, amount):
+                    if Account.objects.filter(pk__in=(sender_account_id, receiver_account_id)).count() != 2:
+                        raise Account.DoesNotExist
+                    raise InsufficientBalance
+            elif not _credit(receiver_account_id, amount, shards.get(receiver_account_id, 0)):
+                raise Account.DoesNotExist
+
+        write_through((sender_account_id, receiver_account_id))
+        transfer = Transfer.objects.create(sender_account_id=sender_account_id,
+                                           receiver_account_id=receiver_account_id, amount=amount)
+        return transfer
+
+
+def execute_transfer_batch(transfers, atomic=True):
+    """
+    Apply a list of ``(sender_account_id, receiver_account_id, amount)`` transfers in one transaction; amounts
+    are in minor units.
+
+    The touched accounts are read (and locked, where the backend supports it) with one query and the
+    transfers are replayed against those balances in order, so an item sees the effect of every
+    accepted item before it. The accepted transfers are then netted into a single delta per account,
+    applied in ascending account id order, and inserted with one ``bulk_create``; the daily rollups are
+    updated per account and day.
+
+    Returns one entry per input: the new ``Transfer`` or the exception that rejected the item. With
+    ``atomic`` any rejection raises ``BatchRejected`` instead and nothing is written.
+    """
+    account_ids = {account_id for sender_id, receiver_id, _ in transfers for account_id in (sender_id, receiver_id)}
+    timestamp = timezone.now()
+
+    with write_transaction():
+        lock_for_update()
+        rows = list(Account.objects.select_for_update().filter(pk__in=account_ids).order_by('pk')
+                    .values_list('id', total_balance(), 'shards'))
+        balances = {account_id: balance for account_id, balance, _ in rows}
+        shards = {account_id: count for account_id, _, count in rows if count} if sharding_enabled() else {}
+        deltas = defaultdict(int)
+        results = []
+        for sender_id, receiver_id, amount in transfers:
+            if sender_id not in balances or receiver_id not in balances:
+                results.append(Account.DoesNotExist())
+                continue
+            if balances[sender_id] < amount:
+                results.append(InsufficientBalance())
+                continue
+            balances[sender_id] -= amount
+            balances[receiver_id] += amount
+            deltas[sender_id] -= amount
+            deltas[receiver_id] += amount
+            results.append(Transfer(sender_account_id=sender_id, receiver_account_id=receiver_id, amount=amount,
+                                    timestamp=timestamp, rolled_up=True))
+
+        errors = {index: result for index, result in enumerate(results) if isinstance(result, Exception)}
+        if atomic and errors:
+            raise BatchRejected(errors)
+
+        for account_id in sorted(deltas):
+            delta = deltas[account_id]
+            if delta < 0:
+                updated = _debit(account_id, -delta)
+            elif delta > 0:
+                updated = _credit(account_id, delta, shards.get(account_id, 0))
+            else:
+                # No money moved, but the account has new transfers.
+                updated = Account.objects.filter(pk=account_id).update(**bump())
+            if not updated:
+                raise BatchConflict
+        if deltas:
+            write_through(list(deltas))
+
+        created = [result for result in results if isinstance(result, Transfer)]
+        bulk_create_with_pks(Transfer, created, batch_size=500)
+        record_transfers(created)
+
+    return results
@@ -1,11 +1,28 @@
 from django.urls import path
 
-from .views import create_customer, create_account, transfer, account_balance, transfer_history
+from . import async_views
+from .views import (obtain_token, logout, create_customer, create_account, import_customers, transfer,
+                    transfer_batch, queued_transfer, account_balance, account_balances, account_balance_as_of,
+                    account_summary, balance_cache_statistics, customer_portfolio, search_customers,
+                    transfer_history)
 
 urlpatterns = [
+    path('auth/token', obtain_token, name='obtain_token'),
+    path('auth/logout', logout, name='logout'),
     path('create-customer', create_customer, name='create_customer'),
     path('create-account', create_account, name='create_account'),
+    path('import-customers', import_customers, name='import_customers'),
     path('transfer-amount', transfer, name='transfer'),
+    path('transfer-amount/batch', transfer_batch, name='transfer_batch'),
+    path('transfer-amount/queue/<int:queued_transfer_id>', queued_transfer, name='queued_transfer'),
     path('account-balance/<int:account_id>', account_balance, name='account_balance'),
+    path('account-balances', account_balances, name='account_balances'),
+    path('account-balance/<int:account_id>/as-of', account_balance_as_of, name='account_balance_as_of'),
+    path('account-summary/<int:account_id>', account_summary, name='account_summary'),
+    path('search-customers', search_customers, name='search_customers'),
+    path('customer-portfolio/<int:customer_id>', customer_portfolio, name='customer_portfolio'),
+    path('balance-cache-stats', balance_cache_statistics, name='balance_cache_stats'),
     path('transfer-history/<int:account_id>', transfer_history, name='transfer_history'),
+    path('async/account-balance/<int:account_id>', async_views.account_balance, name='async_account_balance'),
+    path('async/transfer-history/<int:account_id>', async_views.transfer_history, name='async_transfer_history'),
 ]
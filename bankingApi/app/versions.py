@@ -0,0 +1,43 @@
+from django.db.models import BigIntegerField, Case, DateTimeField, F, Max, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from .models import Account, BalanceShard
+
+
+def bump():
+    """``update()`` arguments that mark an account or shard row as changed."""
+    return {'version': F('version') + 1, 'modified_at': timezone.now()}
+
+
+def _shards(aggregate, field):
+    return Subquery(BalanceShard.objects.filter(account_id=OuterRef('pk')).order_by().values('account_id')
+                    .annotate(value=aggregate(field)).values('value'))
+
+
+def total_version():
+    """
+    An ``Account`` expression for the version of the account and its shards.
+
+    It changes with every transfer the account takes part in, including credits that only touch a shard.
+    The shards are only looked at for sharded accounts.
+    """
+    return Case(
+        When(shards=0, then=F('version')),
+        default=F('version') + Coalesce(_shards(Sum, 'version'), Value(0)),
+        output_field=BigIntegerField(),
+    )
+
+
+def last_modified():
+    """An ``Account`` expression for when the account or one of its shards last changed."""
+    return Case(
+        When(shards=0, then=F('modified_at')),
+        default=Greatest(F('modified_at'), Coalesce(_shards(Max, 'modified_at'), F('modified_at'))),
+        output_field=DateTimeField(),
+    )
+
+
+def account_version(account_id):
+    """``(version, modified_at)`` of ``account_id`` with one query, or ``None`` for unknown accounts."""
+    return Account.objects.filter(pk=account_id).values_list(total_version(), last_modified()).first()
@@ -1,14 +1,68 @@
-from decimal import Decimal
+import csv
+import json
+from datetime import date
+from functools import wraps
 
-from django.db import transaction
-from django.db.models import Q
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import http_date
+from django.views.decorators.http import condition
 from rest_framework import status
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
+from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 
-from .models import Customer, Account, Transfer
-from .permissions import IsEmployee
-from .serializers import AccountSerializer, TransferSerializer, CustomerSerializer
+from .archive import transfer_models
+from .authentication import KEYWORD, AccessToken, issue_token, revoke_token
+from .balances import balance_cache_stats, balance_entry
+from .history import (fill_archived_last_transfers, history_branches, last_rollup_day, last_transfer_at,
+                      union_all)
+from .idempotency import idempotent
+from .models import Customer, Account, QueuedTransfer, Transfer
+from .money import MAX_AMOUNT, MAX_BALANCE, format_minor, from_minor, to_minor
+from .names import normalize_name
+from .onboarding import PARSERS, import_rows
+from .pagination import (InvalidCursor, decode_key_cursor, encode_key_cursor, keyset_page,
+                         parse_page_size)
+from .permissions import IsEmployee, is_employee
+from .rollups import daily_totals
+from .routers import replica_reads
+from .search import customers_by_prefix, customers_by_words
+from .serializers import (TRANSFER_ROW_FIELDS, AccountSerializer, CustomerPortfolioSerializer, CustomerSerializer,
+                          QueuedTransferSerializer, TransferSerializer, serialized, transfer_rows)
+from .shards import total_balance
+from .snapshots import balance_as_of
+from .transfer_queue import enqueue_transfer
+from .transfers import (MAX_BATCH_SIZE, TRANSFER_ERRORS, BatchConflict, BatchRejected, InsufficientBalance,
+                        execute_transfer, execute_transfer_batch)
+from .versions import account_version
+
+
+@api_view(['POST'])
+@authentication_classes([])
+@permission_classes([AllowAny])
+def obtain_token(request):
+    """Exchange a username and password for a bearer token; the only request that loads the user."""
+    user = authenticate(request, username=request.data.get('username'), password=request.data.get('password'))
+    if user is None:
+        return Response({'error': 'Invalid username or password'}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({'token': issue_token(user, is_employee(user)), 'token_type': KEYWORD,
+                     'expires_in': settings.TOKEN_TTL})
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def logout(request):
+    """Revoke the bearer token the request was made with."""
+    if not isinstance(request.auth, AccessToken):
+        return Response({'error': 'Only bearer tokens can be revoked'}, status=status.HTTP_400_BAD_REQUEST)
+    revoke_token(request.auth)
+    return Response(status=status.HTTP_204_NO_CONTENT)
 
 
 @api_view(['POST'])
@@ -18,87 +72,513 @@ def create_customer(request):
 
     customer = Customer.objects.create(name=customer_name)
     serializer = CustomerSerializer(customer)
-    return Response(serializer.data, status=status.HTTP_201_CREATED)
+    return Response(serialized(serializer), status=status.HTTP_201_CREATED)
 
 
 @api_view(['POST'])
 @permission_classes([IsEmployee])
 def create_account(request):
     customer_id = request.data.get('customer_id')
-    initial_balance = request.data.get('initial_balance')
+
+    try:
+        initial_balance = to_minor(request.data.get('initial_balance'))
+    except ValueError:
+        return Response({'error': 'Invalid initial balance'}, status=status.HTTP_400_BAD_REQUEST)
+    if initial_balance < 0:
+        return Response({'error': 'Invalid initial balance'}, status=status.HTTP_400_BAD_REQUEST)
+    if initial_balance > MAX_BALANCE:
+        return Response({'error': 'Initial balance out of range'}, status=status.HTTP_400_BAD_REQUEST)
 
     try:
         customer = Customer.objects.get(pk=customer_id)
         account = Account.objects.create(customer=customer, balance=initial_balance)
         serializer = AccountSerializer(account)
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+        return Response(serialized(serializer), status=status.HTTP_201_CREATED)
     except Customer.DoesNotExist:
         return Response({'error': 'Customer with id {} does not exist'.format(customer_id)},
                         status=status.HTTP_404_NOT_FOUND)
 
 
+IMPORT_CONTENT_TYPES = {
+    'text/csv': 'csv',
+    'application/x-ndjson': 'ndjson',
+}
+
+
+def _import_events(rows):
+    for event in import_rows(rows):
+        yield json.dumps(event) + '\n'
+
+
+@api_view(['POST'])
+@permission_classes([IsEmployee])
+def import_customers(request):
+    """
+    Bulk-create customers and their accounts from a CSV or NDJSON body, streaming NDJSON progress events.
+
+    The body is read line by line from ``request.stream`` instead of through ``request.data``, so it is
+    never held in memory whole.
+    """
+    fmt = IMPORT_CONTENT_TYPES.get(request.content_type.split(';')[0].strip())
+    if fmt is None:
+        return Response({'error': 'Content-Type must be text/csv or application/x-ndjson'},
+                        status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+    # The stream is None for an empty body.
+    lines = (line.decode('utf-8', errors='replace') for line in request.stream or ())
+    return StreamingHttpResponse(_import_events(PARSERS[fmt](lines)), content_type='application/x-ndjson')
+
+
 @api_view(['POST'])
 @permission_classes([IsEmployee])
+@idempotent
 def transfer(request):
-    sender_account_id = request.data.get('sender_account_id')
-    receiver_account_id = request.data.get('receiver_account_id')
-    transfer_amount = Decimal(request.data.get('transfer_amount'))
+    if _prefers_async(request):
+        return _enqueue_transfer(request)
 
     try:
-        with transaction.atomic():
-            sender_account = Account.objects.get(pk=sender_account_id)
-            receiver_account = Account.objects.get(pk=receiver_account_id)
+        sender_account_id, receiver_account_id, transfer_amount = _parse_transfer(request.data)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-            if sender_account_id == receiver_account_id:
-                return Response({'error': 'Sender and receiver account cannot be the same'},
-                                status=status.HTTP_400_BAD_REQUEST)
+    try:
+        transfer = execute_transfer(sender_account_id, receiver_account_id, transfer_amount)
+    except Account.DoesNotExist:
+        return Response({'error': 'Account with given id does not exist'}, status=status.HTTP_404_NOT_FOUND)
+    except InsufficientBalance:
+        return Response({'error': 'Insufficient balance in sender account'}, status=status.HTTP_400_BAD_REQUEST)
+
+    transfer = Transfer.objects.select_related('sender_account__customer', 'receiver_account__customer').get(
+        pk=transfer.pk)
+    transfer_serializer = TransferSerializer(transfer)
+    return Response(serialized(transfer_serializer), status=status.HTTP_201_CREATED)
+
+
+MAX_ACCOUNT_ID = 2 ** 63 - 1
+
+
+def _parse_account_id(value):
+    # Booleans are ints and floats would be truncated; ids come as integers or their decimal strings.
+    if isinstance(value, (bool, float)):
+        raise ValueError
+    account_id = int(value)
+    if not 0 < account_id <= MAX_ACCOUNT_ID:
+        raise ValueError
+    return account_id
 
-            if transfer_amount <= 0:
-                return Response({'error': 'Invalid amount'}, status=status.HTTP_400_BAD_REQUEST)
 
-            if sender_account.balance < transfer_amount:
-                return Response({'error': 'Insufficient balance in sender account'}, status=status.HTTP_400_BAD_REQUEST)
+def _parse_transfer(item):
+    """
+    ``(sender_account_id, receiver_account_id, transfer_amount)`` of a transfer request body or batch item.
 
-            transfer = Transfer.objects.create(sender_account=sender_account, receiver_account=receiver_account,
-                                               amount=transfer_amount)
+    Raises ``ValueError`` with the message for the client if it is malformed; whether the accounts exist is
+    left to the transfer engine.
+    """
+    if not isinstance(item, dict):
+        raise ValueError('Invalid transfer')
+    try:
+        sender_account_id = _parse_account_id(item['sender_account_id'])
+        receiver_account_id = _parse_account_id(item['receiver_account_id'])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError('Invalid transfer')
+
+    if sender_account_id == receiver_account_id:
+        raise ValueError('Sender and receiver account cannot be the same')
+
+    try:
+        transfer_amount = to_minor(item.get('transfer_amount'))
+    except ValueError:
+        raise ValueError('Invalid amount')
+    if not 0 < transfer_amount <= MAX_AMOUNT:
+        raise ValueError('Invalid amount')
 
-            sender_account.balance -= transfer_amount
-            sender_account.save()
+    return sender_account_id, receiver_account_id, transfer_amount
 
-            receiver_account.balance += transfer_amount
-            receiver_account.save()
 
-            transfer_serializer = TransferSerializer(transfer)
+def _prefers_async(request):
+    preferences = request.headers.get('Prefer', '')
+    return 'respond-async' in (preference.split(';')[0].strip() for preference in preferences.split(','))
+
+
+def _enqueue_transfer(request):
+    try:
+        sender_account_id, receiver_account_id, transfer_amount = _parse_transfer(request.data)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    queued = enqueue_transfer(sender_account_id, receiver_account_id, transfer_amount)
+    return Response(serialized(QueuedTransferSerializer(queued)), status=status.HTTP_202_ACCEPTED, headers={
+        'Location': reverse('queued_transfer', kwargs={'queued_transfer_id': queued.id}),
+        'Preference-Applied': 'respond-async',
+    })
 
-            return Response(transfer_serializer.data, status=status.HTTP_201_CREATED)
+
+@api_view(['GET'])
+@permission_classes([IsEmployee])
+def queued_transfer(request, queued_transfer_id):
+    try:
+        queued = (QueuedTransfer.objects
+                  .select_related('transfer__sender_account__customer', 'transfer__receiver_account__customer')
+                  .get(pk=queued_transfer_id))
+    except QueuedTransfer.DoesNotExist:
+        return Response({'error': 'Queued transfer with given id does not exist'}, status=status.HTTP_404_NOT_FOUND)
+    data = serialized(QueuedTransferSerializer(queued))
+    if queued.transfer_id is not None and queued.transfer is None:
+        # The transfer was archived; it was made between the queueing and the processing.
+        for model in transfer_models(queued.created_at, queued.processed_at)[1:]:
+            rows = transfer_rows(model.objects.filter(pk=queued.transfer_id).values_list(*TRANSFER_ROW_FIELDS))
+            if rows:
+                data['transfer'] = rows[0]
+                break
+    return Response(data)
+
+
+@api_view(['POST'])
+@permission_classes([IsEmployee])
+@idempotent
+def transfer_batch(request):
+    if not isinstance(request.data, dict):
+        return Response({'error': 'Invalid batch'}, status=status.HTTP_400_BAD_REQUEST)
+    items = request.data.get('transfers')
+    atomic = request.data.get('atomic', True)
+
+    if not isinstance(atomic, bool):
+        return Response({'error': 'atomic must be true or false'}, status=status.HTTP_400_BAD_REQUEST)
+
+    if not isinstance(items, list) or not items:
+        return Response({'error': 'transfers must be a non-empty list'}, status=status.HTTP_400_BAD_REQUEST)
+
+    if len(items) > MAX_BATCH_SIZE:
+        return Response({'error': 'A batch can contain at most {} transfers'.format(MAX_BATCH_SIZE)},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    transfers = []
+    errors = {}
+    for index, item in enumerate(items):
+        try:
+            transfers.append(_parse_transfer(item))
+        except ValueError as e:
+            errors[index] = str(e)
+
+    if atomic and errors:
+        return Response({'error': 'Batch rejected',
+                         'errors': [{'index': index, 'error': error} for index, error in errors.items()]},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    valid_indexes = [index for index in range(len(items)) if index not in errors]
+    try:
+        results = execute_transfer_batch(transfers, atomic=atomic)
+    except BatchRejected as e:
+        return Response({'error': 'Batch rejected',
+                         'errors': [{'index': valid_indexes[index], 'error': TRANSFER_ERRORS[type(error)]}
+                                    for index, error in e.errors.items()]},
+                        status=status.HTTP_400_BAD_REQUEST)
+    except BatchConflict:
+        return Response({'error': 'Account balances changed during the batch, please retry'},
+                        status=status.HTTP_409_CONFLICT)
+
+    created = [result for result in results if not isinstance(result, Exception)]
+    account_ids = set()
+    for transfer in created:
+        account_ids.update((transfer.sender_account_id, transfer.receiver_account_id))
+    accounts = Account.objects.select_related('customer').in_bulk(account_ids)
+    for transfer in created:
+        transfer.sender_account = accounts[transfer.sender_account_id]
+        transfer.receiver_account = accounts[transfer.receiver_account_id]
+
+    if atomic:
+        return Response({'transfers': serialized(TransferSerializer(results, many=True))},
+                        status=status.HTTP_201_CREATED)
+
+    outcomes = dict(zip(valid_indexes, results))
+    response = []
+    for index in range(len(items)):
+        result = outcomes.get(index)
+        if index in errors:
+            response.append({'index': index, 'status': 'rejected', 'error': errors[index]})
+        elif isinstance(result, Exception):
+            response.append({'index': index, 'status': 'rejected', 'error': TRANSFER_ERRORS[type(result)]})
+        else:
+            response.append({'index': index, 'status': 'created', 'transfer': serialized(TransferSerializer(result))})
+    return Response({'results': response})
+
+
+def account_conditional(lookup):
+    """
+    Answer If-None-Match for an account with a 304 before the view reads anything else.
+
+    ``lookup(account_id)`` returns a tuple starting with the account's version and ending with its
+    modification time, or ``None`` for unknown accounts; ETag and Last-Modified derive from it. It is
+    called once per request and its result left on ``request.account_version`` for the view.
+
+    Last-Modified is informational only: it has a granularity of one second, in which an account can
+    change several times, so If-Modified-Since is never answered with a 304.
+    """
+    def version(request, account_id):
+        if not hasattr(request, 'account_version'):
+            request.account_version = lookup(account_id)
+        return request.account_version
+
+    def etag(request, account_id):
+        current = version(request, account_id)
+        # The JSON and browsable API renderings of a version are different representations.
+        return current and '{}-{}'.format(current[0], request.accepted_renderer.format)
+
+    def decorator(view):
+        conditional_view = condition(etag_func=etag)(view)
+
+        @wraps(view)
+        def inner(request, account_id, *args, **kwargs):
+            response = conditional_view(request, account_id, *args, **kwargs)
+            current = getattr(request, 'account_version', None)
+            if current and response.status_code in (200, 304):
+                # http_date takes naive datetimes for UTC; ours are in the current time zone.
+                modified_at = timezone.make_aware(current[-1]) if timezone.is_naive(current[-1]) else current[-1]
+                response['Last-Modified'] = http_date(modified_at.timestamp())
+            return response
+        return inner
+
+    return decorator
+
+
+def _balance_entry(account_id):
+    try:
+        return balance_entry(account_id)
     except Account.DoesNotExist:
-        return Response({'error': 'Account with given id does not exist'}, status=status.HTTP_404_NOT_FOUND)
+        return None
 
 
 @api_view(['GET'])
 @permission_classes([IsEmployee])
+@replica_reads
+@account_conditional(_balance_entry)
 def account_balance(request, account_id):
+    # Read for the ETag, from the balance cache where possible.
+    entry = request.account_version
+    if entry is None:
+        return Response({'error': 'Account with given id does not exist'}, status=status.HTTP_404_NOT_FOUND)
+    return Response({'account_id': account_id, 'balance': from_minor(entry[1])})
+
+
+SEARCH_MODES = ('prefix', 'words')
+
+
+@api_view(['GET'])
+@permission_classes([IsEmployee])
+@replica_reads
+def search_customers(request):
+    """
+    Customers whose name starts with ``q`` or, with ``match=words``, contains every word of ``q``; case and
+    Turkish letters are folded. Keyset-paginated like the transfer history, with ``limit`` and ``cursor``.
+    """
+    query = request.GET.get('q', '')
+    match = request.GET.get('match', 'prefix')
+    if not normalize_name(query):
+        return Response({'error': 'q is required'}, status=status.HTTP_400_BAD_REQUEST)
+    if match not in SEARCH_MODES:
+        return Response({'error': 'match must be one of {}'.format(', '.join(SEARCH_MODES))},
+                        status=status.HTTP_400_BAD_REQUEST)
+    try:
+        page_size = parse_page_size(request.GET.get('limit'))
+    except ValueError:
+        return Response({'error': 'Invalid limit'}, status=status.HTTP_400_BAD_REQUEST)
+
+    cursor = request.GET.get('cursor')
+    try:
+        if match == 'prefix':
+            rows = list(customers_by_prefix(query, cursor and decode_key_cursor(cursor, str, int))[:page_size + 1])
+        else:
+            rows = list(customers_by_words(query, cursor and decode_key_cursor(cursor, int)[0])[:page_size + 1])
+    except InvalidCursor:
+        return Response({'error': 'Invalid cursor'}, status=status.HTTP_400_BAD_REQUEST)
+
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        next_cursor = encode_key_cursor(last[2], last[0]) if match == 'prefix' else encode_key_cursor(last[0])
+    return Response({'results': [{'id': row[0], 'name': row[1]} for row in rows], 'next_cursor': next_cursor})
+
+
+MAX_BALANCE_LOOKUP = 1000
+
+
+@api_view(['GET'])
+@permission_classes([IsEmployee])
+@replica_reads
+def account_balances(request):
+    """The balances of the comma-separated account ``ids``, in the order asked, with one query."""
+    try:
+        account_ids = list(dict.fromkeys(int(account_id) for account_id in request.GET.get('ids', '').split(',')))
+    except ValueError:
+        return Response({'error': 'ids must be a comma-separated list of account ids'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    if len(account_ids) > MAX_BALANCE_LOOKUP:
+        return Response({'error': 'At most {} accounts can be looked up at once'.format(MAX_BALANCE_LOOKUP)},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    balances = dict(Account.objects.filter(pk__in=account_ids).values_list('pk', total_balance()))
+    return Response({
+        'balances': [{'account_id': account_id, 'balance': from_minor(balances[account_id])}
+                     for account_id in account_ids if account_id in balances],
+        'missing': [account_id for account_id in account_ids if account_id not in balances],
+    })
+
+
+@api_view(['GET'])
+@permission_classes([IsEmployee])
+@replica_reads
+def customer_portfolio(request, customer_id):
+    """A customer with all of their accounts, balances and last transfer times, in two queries."""
+    accounts = (Account.objects.annotate(total_balance=total_balance(), last_transfer_at=last_transfer_at(),
+                                         last_rollup_day=last_rollup_day()).order_by('pk'))
+    try:
+        customer = Customer.objects.prefetch_related(
+            Prefetch('account_set', queryset=accounts, to_attr='portfolio_accounts')).get(pk=customer_id)
+    except Customer.DoesNotExist:
+        return Response({'error': 'Customer with given id does not exist'}, status=status.HTTP_404_NOT_FOUND)
+    fill_archived_last_transfers(customer.portfolio_accounts)
+    return Response(serialized(CustomerPortfolioSerializer(customer)))
+
+
+@api_view(['GET'])
+@permission_classes([IsEmployee])
+def account_balance_as_of(request, account_id):
+    try:
+        day = date.fromisoformat(request.GET.get('date', ''))
+    except ValueError:
+        return Response({'error': 'date must be given as YYYY-MM-DD'}, status=status.HTTP_400_BAD_REQUEST)
+
     try:
-        account = Account.objects.get(pk=account_id)
-        return Response({'account_id': account.id, 'balance': account.balance})
+        created_at = Account.objects.values_list('created_at', flat=True).get(pk=account_id)
     except Account.DoesNotExist:
         return Response({'error': 'Account with given id does not exist'}, status=status.HTTP_404_NOT_FOUND)
+    if day < created_at.date():
+        return Response({'error': 'Account did not exist on given date'}, status=status.HTTP_404_NOT_FOUND)
+
+    return Response({'account_id': account_id, 'date': day, 'balance': from_minor(balance_as_of(account_id, day))})
 
 
 @api_view(['GET'])
 @permission_classes([IsEmployee])
-def transfer_history(request, account_id):
-    start_date = request.GET.get('start_date')
-    end_date = request.GET.get('end_date')
-    try:
-        account = Account.objects.get(pk=account_id)
-        query = Q(sender_account=account) | Q(receiver_account=account)
-        if start_date:
-            query &= Q(timestamp__gte=start_date)
-        if end_date:
-            query &= Q(timestamp__lte=end_date)
-        transfers = Transfer.objects.filter(query)
-        serializer = TransferSerializer(transfers, many=True)
-        return Response(serializer.data)
-    except Account.DoesNotExist:
+@replica_reads
+def account_summary(request, account_id):
+    """Daily and total money in and out of an account over an optional date range, from the daily rollups."""
+    try:
+        start_date, end_date = [date.fromisoformat(request.GET[name]) if request.GET.get(name) else None
+                                for name in ('start_date', 'end_date')]
+    except ValueError:
+        return Response({'error': 'start_date and end_date must be given as YYYY-MM-DD'},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    if not Account.objects.filter(pk=account_id).exists():
         return Response({'error': 'Account with given id does not exist'}, status=status.HTTP_404_NOT_FOUND)
+
+    totals, days = daily_totals(account_id, start_date, end_date)
+    for row in (totals, *days):
+        row['amount_in'] = from_minor(row['amount_in'])
+        row['amount_out'] = from_minor(row['amount_out'])
+    return Response({'account_id': account_id, 'start_date': start_date, 'end_date': end_date, **totals,
+                     'net': totals['amount_in'] - totals['amount_out'], 'days': days})
+
+
+@api_view(['GET'])
+@permission_classes([IsEmployee])
+def balance_cache_statistics(request):
+    return Response(balance_cache_stats())
+
+
+STREAM_FIELDS = ('id', 'sender_account', 'receiver_account', 'amount', 'timestamp')
+STREAM_CHUNK_SIZE = 1000
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def _stream_rows(branches):
+    rows = union_all([branch.values_list('id', 'sender_account_id', 'receiver_account_id', 'amount', 'timestamp')
+                      for branch in branches])
+    return rows.iterator(chunk_size=STREAM_CHUNK_SIZE)
+
+
+def _stream_ndjson(branches):
+    chunk = []
+    for pk, sender_account_id, receiver_account_id, amount, timestamp in _stream_rows(branches):
+        # The amount is written as a string, the way DjangoJSONEncoder writes decimals.
+        row = (pk, sender_account_id, receiver_account_id, format_minor(amount), timestamp)
+        chunk.append(json.dumps(dict(zip(STREAM_FIELDS, row)), cls=DjangoJSONEncoder))
+        if len(chunk) == STREAM_CHUNK_SIZE:
+            yield '\n'.join(chunk) + '\n'
+            chunk = []
+    if chunk:
+        yield '\n'.join(chunk) + '\n'
+
+
+def _stream_csv(branches):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(STREAM_FIELDS)
+    chunk = []
+    for row in _stream_rows(branches):
+        chunk.append(writer.writerow((row[0], row[1], row[2], format_minor(row[3]), row[4].isoformat())))
+        if len(chunk) == STREAM_CHUNK_SIZE:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
+
+
+def _row_cursor_key(row):
+    return row[TRANSFER_ROW_FIELDS.index('timestamp')], row[0]
+
+
+STREAM_FORMATS = {
+    'ndjson': (_stream_ndjson, 'application/x-ndjson'),
+    'csv': (_stream_csv, 'text/csv'),
+}
+
+
+def transfer_history_payload(account_id, params):
+    """Resolve a non-streaming history request to ``(payload, status)``; shared with the async view."""
+    if not Account.objects.filter(pk=account_id).exists():
+        return {'error': 'Account with given id does not exist'}, status.HTTP_404_NOT_FOUND
+
+    branches = history_branches(account_id, params.get('start_date'), params.get('end_date'))
+    rows = [branch.values_list(*TRANSFER_ROW_FIELDS) for branch in branches]
+
+    cursor = params.get('cursor')
+    limit = params.get('limit')
+    if cursor is not None or limit is not None:
+        try:
+            page_size = parse_page_size(limit)
+        except ValueError:
+            return {'error': 'Invalid limit'}, status.HTTP_400_BAD_REQUEST
+        try:
+            page, next_cursor = keyset_page(rows, cursor, page_size, key=_row_cursor_key)
+        except InvalidCursor:
+            return {'error': 'Invalid cursor'}, status.HTTP_400_BAD_REQUEST
+        return {'results': transfer_rows(page), 'next_cursor': next_cursor}, status.HTTP_200_OK
+
+    return transfer_rows(union_all(rows)), status.HTTP_200_OK
+
+
+@api_view(['GET'])
+@permission_classes([IsEmployee])
+@replica_reads
+# Not the balance cache: the version has to come from the database the history is read from.
+@account_conditional(account_version)
+def transfer_history(request, account_id):
+    stream = request.GET.get('stream')
+    if stream:
+        if not Account.objects.filter(pk=account_id).exists():
+            return Response({'error': 'Account with given id does not exist'}, status=status.HTTP_404_NOT_FOUND)
+        if stream not in STREAM_FORMATS:
+            return Response({'error': 'Unsupported stream format'}, status=status.HTTP_400_BAD_REQUEST)
+        generator, content_type = STREAM_FORMATS[stream]
+        branches = history_branches(account_id, request.GET.get('start_date'), request.GET.get('end_date'))
+        # The body is produced after the view returns; pin the database the view would have read from.
+        branches = [branch.using(branch.db) for branch in branches]
+        return StreamingHttpResponse(generator(branches), content_type=content_type)
+
+    payload, status_code = transfer_history_payload(account_id, request.GET)
+    return Response(payload, status=status_code)
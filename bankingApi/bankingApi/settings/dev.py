@@ -4,9 +4,26 @@ SECRET_KEY = os.environ.get('SECRET_KEY')
 DEBUG = os.environ.get('DEBUG')
 ALLOWED_HOSTS = ['localhost', '127.0.0.1']
 
+# runserver and the tests are a single process, so the local memory cache is enough for token revocations.
+ALLOW_LOCAL_TOKEN_REVOCATION = True
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'CONN_MAX_AGE': CONN_MAX_AGE,
+        # A file-backed test database lets concurrent tests open one connection per thread.
+        'TEST': {
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
+    },
+    # A second SQLite file stands in for a read replica; refresh it with `manage.py sync_replica`.
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ.get('REPLICA_DATABASE_NAME', BASE_DIR / 'replica.sqlite3'),
+        'CONN_MAX_AGE': CONN_MAX_AGE,
+        'TEST': {
+            'NAME': BASE_DIR / 'test_replica.sqlite3',
+        },
+    },
 }
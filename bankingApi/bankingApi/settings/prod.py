@@ -8,9 +8,22 @@ SECRET_KEY = os.environ.get('SECRET_KEY')
 DEBUG = os.environ.get('DEBUG')
 ALLOWED_HOSTS = []
 
+# Running more than one worker process needs CACHE_BACKEND/CACHE_LOCATION pointed at a shared cache such as
+# memcached or Redis: the local memory default isn't shared, so balances aren't cached at all and the
+# employee-group entries would only be seen by the worker that wrote them. Token revocations have to reach
+# every worker, so the app refuses to start without a shared cache.
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': CONN_MAX_AGE,
     }
 }
+
+if os.environ.get('REPLICA_DATABASE_NAME'):
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ['REPLICA_DATABASE_NAME'],
+        'CONN_MAX_AGE': CONN_MAX_AGE,
+    }